@@ -0,0 +1,79 @@
+# Накладные расходы одного чтения товара: как было (SQL в обработчике, разбор запроса
+# на каждый вызов, поля из Record по одному) и через ItemRepo (подготовленное выражение
+# из кэша соединения, строка в __slots__-объекте).
+#   DATABASE_URL=postgres://... python bench/bench_repo.py [вызовов]
+# Создаёт в базе временную поставку с одним товаром и удаляет её в конце
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncpg
+
+from db import init_pool, close_pool, acquire
+from migrations import migrate
+from repo import ItemRepo, HOT_STATEMENTS
+
+OLD_QUERY = """
+    SELECT title, price, sell_price, description, photo, is_sold, supply_id, status
+    FROM items WHERE id = $1
+"""
+
+
+async def old_call(conn, item_id):
+    row = await conn.fetchrow(OLD_QUERY, item_id)
+    return (row['title'], row['price'], row['sell_price'], row['description'], row['photo'],
+            row['is_sold'], row['supply_id'], row['status'])
+
+
+async def new_call(conn, item_id):
+    return await ItemRepo(conn).get(item_id)
+
+
+async def measure(fn, conn, item_id, calls):
+    for _ in range(100):
+        await fn(conn, item_id)
+    started = time.perf_counter()
+    for _ in range(calls):
+        await fn(conn, item_id)
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+async def main(calls):
+    dsn = os.environ["DATABASE_URL"]
+    setup = await asyncpg.connect(dsn)
+    supply_id = None
+    try:
+        await migrate(setup)
+        supply_id = await setup.fetchval("INSERT INTO supplies (name, status) VALUES ('bench', 'hidden') RETURNING id")
+        item_id = await setup.fetchval(
+            "INSERT INTO items (supply_id, title, price, sell_price, description) "
+            "VALUES ($1, 'bench', 100, 150, 'bench') RETURNING id", supply_id
+        )
+        # Было: без кэша выражений asyncpg каждый вызов заново разбирается и планируется сервером
+        old_conn = await asyncpg.connect(dsn, statement_cache_size=0)
+        try:
+            old = await measure(old_call, old_conn, item_id, calls)
+        finally:
+            await old_conn.close()
+
+        await init_pool(dsn, min_size=1, max_size=1, statements=HOT_STATEMENTS)
+        try:
+            async with acquire() as conn:
+                new = await measure(new_call, conn, item_id, calls)
+        finally:
+            await close_pool()
+
+        print(f"вызовов: {calls}")
+        print(f"было:  {old:8.1f} мкс/вызов")
+        print(f"стало: {new:8.1f} мкс/вызов ({old / new:.2f}x)")
+    finally:
+        if supply_id is not None:
+            await setup.execute("DELETE FROM supplies WHERE id = $1", supply_id)
+        await setup.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000))
@@ -0,0 +1,33 @@
+# Расчёт поставки на 10 000 вкладчиков: settle() — чистый Python, база не нужна.
+#   python bench/bench_settlement.py [вкладчиков] [товаров]
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from settlement import settle
+
+
+def main(contributors, items_count, repeat=5):
+    rng = random.Random(0)
+    contributions = [
+        (user_id, f"user{user_id}", round(rng.uniform(100, 50000), 2), user_id < 5)
+        for user_id in range(contributors)
+    ]
+    items = [
+        (round(rng.uniform(100, 5000), 2), round(rng.uniform(100, 9000), 2), rng.random() < 0.7)
+        for _ in range(items_count)
+    ]
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        settle(contributions, items)
+        timings.append(time.perf_counter() - started)
+    print(f"вкладчиков: {contributors}, товаров: {items_count}")
+    print(f"settle: лучшее {min(timings) * 1000:.1f} мс, среднее {sum(timings) / repeat * 1000:.1f} мс")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000, int(sys.argv[2]) if len(sys.argv) > 2 else 3000)
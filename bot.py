@@ -1,14 +1,36 @@
 import asyncio
 import os
+import sys
+import zipfile
+from html import escape
 from aiogram import Bot, Dispatcher, F
-from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, FSInputFile
+from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.filters import Command
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
 import asyncpg
 from datetime import datetime
 from dotenv import load_dotenv
+from db import init_pool, close_pool, acquire
+from migrations import migrate
+from repo import SupplyRepo, ItemRepo, ContributionRepo, RequestRepo, OutboxRepo, SummaryRepo, LedgerRepo, HOT_STATEMENTS
+from photos import PHOTO_DIR, send_item_photo, store_photo, run_photo_gc
+from leaderboard import TopContributors
+from broadcast import Broadcaster
+from outbox import OutboxDispatcher
+from ledger import ContributionRollup
+from fsm_storage import PostgresStorage
+from webhook import run_webhook
+from supervisor import run_supervisor
+from middlewares import UpdateLockMiddleware
+from singleflight import stats as single_flight_stats
+from cache import cache, cached, init_cache, SUPPLIES, supply_scope, item_scope, photo_scope
+from invalidation import CacheInvalidationListener
+from export import EXPORTS, send_export
+from settlement import complete_supply, profit_share, expected_profit
+from importer import MAX_PHOTO_SIZE, parse_items, extract_photos, download_document, import_items
 
 load_dotenv()
 
@@ -29,10 +51,50 @@ PAYMENT_DETAILS = (
 )
 
 # === ПАПКИ ===
-os.makedirs("photos", exist_ok=True)
+os.makedirs(PHOTO_DIR, exist_ok=True)
+PHOTO_GC_INTERVAL = float(os.getenv("PHOTO_GC_INTERVAL", "3600"))
+PHOTO_GC_GRACE = float(os.getenv("PHOTO_GC_GRACE", "86400"))
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL is not set in environment variables")
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "10"))
+DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", "5"))
+DB_MAX_INACTIVE_LIFETIME = float(os.getenv("DB_MAX_INACTIVE_LIFETIME", "300"))
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "10"))
+LEADERBOARD_REFRESH = float(os.getenv("LEADERBOARD_REFRESH", "300"))
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "30"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))
+ITEMS_PAGE_SIZE = int(os.getenv("ITEMS_PAGE_SIZE", "10"))
+REQUESTS_PAGE_SIZE = int(os.getenv("REQUESTS_PAGE_SIZE", "10"))
+REPORT_PAGE_SIZE = int(os.getenv("REPORT_PAGE_SIZE", "50"))
+FSM_STORAGE = os.getenv("FSM_STORAGE", "postgres")
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))
+FSM_CACHE_TTL = float(os.getenv("FSM_CACHE_TTL", "0"))
+FSM_STATE_TTL = float(os.getenv("FSM_STATE_TTL", "21600"))
+FSM_CLEANUP_INTERVAL = float(os.getenv("FSM_CLEANUP_INTERVAL", "600"))
+RUN_MODE = os.getenv("RUN_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+if RUN_MODE in ("webhook", "supervisor") and not WEBHOOK_SECRET:
+    raise ValueError("WEBHOOK_SECRET is not set in environment variables")
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "16"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+SUPERVISOR_WORKERS = int(os.getenv("SUPERVISOR_WORKERS", str(os.cpu_count() or 1)))
+SUPERVISOR_BASE_PORT = int(os.getenv("SUPERVISOR_BASE_PORT", "8100"))
+UPDATE_LOCK_SCOPE = os.getenv("UPDATE_LOCK_SCOPE", "user")
+CACHE_SIZE = int(os.getenv("CACHE_SIZE", "5000"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "300"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+EXPORT_TIMEOUT = float(os.getenv("EXPORT_TIMEOUT", "300"))
+LEDGER_ROLLUP_INTERVAL = float(os.getenv("LEDGER_ROLLUP_INTERVAL", "5"))
 
 # === БАЗА ДАННЫХ ===
 async def init_db():
@@ -40,65 +102,20 @@ async def init_db():
     try:
         conn = await asyncpg.connect(DATABASE_URL)
 
-        # === Поставки ===
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS supplies (
-                id BIGSERIAL PRIMARY KEY,
-                name TEXT NOT NULL,
-                status TEXT DEFAULT 'active'
-            )
-        """)
-
-        # === Товары ===
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS items (
-                id BIGSERIAL PRIMARY KEY,
-                supply_id INTEGER,
-                title TEXT,
-                price REAL,
-                sell_price REAL,
-                description TEXT,
-                photo TEXT,
-                is_sold BOOLEAN DEFAULT FALSE,
-                status TEXT DEFAULT '🛒 Выкуплен'
-                FOREIGN KEY(supply_id) REFERENCES supplies(id) ON DELETE CASCADE
-            )
-        """)
-
-        # === Вклады ===
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS contributions (
-                user_id BIGINT,
-                supply_id INTEGER,
-                amount REAL,
-                username TEXT,
-                PRIMARY KEY (user_id, supply_id)
-            )
-        """)
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS contribution_requests (
-                id BIGSERIAL PRIMARY KEY,
-                user_id BIGINT,
-                username TEXT,
-                bank TEXT,
-                payment_info TEXT,
-                status TEXT DEFAULT 'pending'
-            )
-        """)
-
-        column_exists = await conn.fetchval("""
-            SELECT EXISTS (
-                SELECT 1
-                FROM information_schema.columns
-                WHERE table_name = 'items' AND column_name = 'status'
-            );
-        """)
-        if not column_exists:
-            await conn.execute("ALTER TABLE items ADD COLUMN status TEXT DEFAULT '🛒 Выкуплен'")
-
-        count = await conn.fetchval("SELECT COUNT(*) FROM supplies")
-        if count == 0:
-            await conn.execute("INSERT INTO supplies (name, status) VALUES ('Поставка #1', 'active')")
+        await migrate(conn)
+
+        # Админы нужны триггерам, чтобы делить суммы на админские и остальные
+        known_admins = {r['user_id'] for r in await conn.fetch("SELECT user_id FROM admins")}
+        if known_admins != set(ADMIN_IDS):
+            async with conn.transaction():
+                await conn.execute("LOCK TABLE contributions, items IN SHARE MODE")
+                await conn.execute("DELETE FROM admins")
+                await conn.executemany("INSERT INTO admins (user_id) VALUES ($1)", [(a,) for a in set(ADMIN_IDS)])
+                await conn.execute("SELECT supply_totals_rebuild()")
+
+        supplies = SupplyRepo(conn)
+        if await supplies.count() == 0:
+            await supplies.create("Поставка #1")
 
     except Exception as e:
         print(f"Error initializing database: {e}")
@@ -134,15 +151,43 @@ class MakeContribution(StatesGroup):
 class EditContribution(StatesGroup):
     waiting_new_amount = State()
 
+class Broadcast(StatesGroup):
+    waiting_text = State()
+
+class RequestInbox(StatesGroup):
+    waiting_amounts = State()
+
+class ImportItems(StatesGroup):
+    waiting_photos = State()
+    waiting_file = State()
+
 
 # === БОТ ===
 bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
+if FSM_STORAGE == "memory":
+    storage = MemoryStorage()
+else:
+    # Сценарии, где ждём перевода денег, живут дольше; рассылка — короче
+    storage = PostgresStorage(
+        cache_size=FSM_CACHE_SIZE,
+        cache_ttl=FSM_CACHE_TTL,
+        default_ttl=FSM_STATE_TTL,
+        state_ttls={
+            MakeContribution.waiting_payment_info.state: 3 * 86400,
+            MakeContribution.waiting_confirm.state: 3 * 86400,
+            MakeContribution.waiting_amount.state: 3 * 86400,
+            Broadcast.waiting_text.state: 3600,
+        },
+    )
 dp = Dispatcher(storage=storage)
-
-# Helper function for database connection
-async def get_db_conn():
-    return await asyncpg.connect(DATABASE_URL)
+dp.update.outer_middleware(UpdateLockMiddleware(UPDATE_LOCK_SCOPE))
+init_cache(CACHE_SIZE, CACHE_TTL)
+top_contributors = TopContributors(LEADERBOARD_SIZE, LEADERBOARD_REFRESH)
+broadcaster = Broadcaster(bot, rate=BROADCAST_RATE, concurrency=BROADCAST_CONCURRENCY)
+outbox = OutboxDispatcher(
+    bot, batch_size=OUTBOX_BATCH_SIZE, poll_interval=OUTBOX_POLL_INTERVAL, max_attempts=OUTBOX_MAX_ATTEMPTS
+)
+rollup = ContributionRollup(LEDGER_ROLLUP_INTERVAL)
 
 # === КЛАВИАТУРЫ ===
 def get_main_menu(user_id):
@@ -151,48 +196,75 @@ def get_main_menu(user_id):
         [InlineKeyboardButton(text="2️⃣ Посмотреть поставку", callback_data="view_supply")],
         [InlineKeyboardButton(text="3️⃣ Сделать вклад", callback_data="make_contribution")],
         [InlineKeyboardButton(text="📊 Статистика", callback_data="my_stats")],
+        [InlineKeyboardButton(text="🏆 Топ вкладчиков", callback_data="top_contributors")],
         [InlineKeyboardButton(text="❓ Вопросы", callback_data="faq")]
     ]
     if user_id in ADMIN_IDS:
         buttons.append([InlineKeyboardButton(text="🔧 Админская панель", callback_data="admin_panel")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+@cached(lambda value, supply_type: (SUPPLIES,))
 async def get_supply_list_keyboard(supply_type):
-    conn = await get_db_conn()
-    supplies = []
-    try:
-        if supply_type == "current":
-            supplies = await conn.fetch("SELECT id, name FROM supplies WHERE status = 'active'")
-        else:
-            supplies = await conn.fetch("SELECT id, name FROM supplies WHERE status = 'completed'")
-    finally:
-        if conn:
-            await conn.close()
+    status = "active" if supply_type == "current" else "completed"
+    supplies = await get_supplies_by_status(status)
 
     buttons = []
     for s in supplies:
-        buttons.append([InlineKeyboardButton(text=s['name'], callback_data=f"supply_{s['id']}_{supply_type}")])
+        buttons.append([InlineKeyboardButton(text=s.name, callback_data=f"supply_{s.id}_{supply_type}")])
     buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-async def get_item_list_keyboard(supply_id, for_admin=False):
-    conn = await get_db_conn()
-    items = []
-    try:
-        items = await conn.fetch("SELECT id, title, price, is_sold FROM items WHERE supply_id = $1", supply_id)
-    finally:
-        if conn:
-            await conn.close()
+# Фильтр товаров в callback: "a" — все, "s" — проданные, "u" — непроданные, плюс номер статуса или "-"
+ITEM_SOLD_FILTERS = {"a": None, "s": True, "u": False}
+
+@cached(lambda value, supply_id, **kwargs: (supply_scope(supply_id),))
+async def get_item_list_keyboard(supply_id, for_admin=False, manage=False, item_filter="a-", after_id=0, before_id=None):
+    scope = "m" if manage else "a" if for_admin else "u"
+    sold_filter, status_filter = item_filter[0], item_filter[1:]
+    status = STATUSES[int(status_filter)] if status_filter != "-" else None
+    async with acquire() as conn:
+        page = await ItemRepo(conn).page(
+            supply_id, ITEMS_PAGE_SIZE, after_id=after_id, before_id=before_id,
+            is_sold=ITEM_SOLD_FILTERS[sold_filter], status=status
+        )
 
-    buttons = []
-    for item in items:
-        item_id, title, price, is_sold = item['id'], item['title'], item['price'], item['is_sold']
-        status = "✅" if is_sold else "🔄"
-        text = f"{title} — {price}₽ {status}"
-        callback = f"admin_item_{item_id}" if for_admin else f"user_item_{item_id}"
+    prefix = f"items_{scope}_{supply_id}"
+    buttons = [[
+        InlineKeyboardButton(
+            text=f"• {label}" if key == sold_filter else label,
+            callback_data=f"{prefix}_{key}{status_filter}_n0"
+        )
+        for key, label in (("a", "Все"), ("s", "✅ Проданные"), ("u", "🔄 В наличии"))
+    ]]
+    if status is None:
+        next_status = "0"
+    elif int(status_filter) + 1 < len(STATUSES):
+        next_status = str(int(status_filter) + 1)
+    else:
+        next_status = "-"
+    buttons.append([InlineKeyboardButton(
+        text=f"Статус: {status or 'все'}",
+        callback_data=f"{prefix}_{sold_filter}{next_status}_n0"
+    )])
+
+    for item in page.items:
+        mark = "✅" if item.is_sold else "🔄"
+        text = f"{item.title} — {item.price}₽ {mark}"
+        callback = f"admin_item_{item.id}" if for_admin or manage else f"user_item_{item.id}"
         buttons.append([InlineKeyboardButton(text=text, callback_data=callback)])
 
-    back_callback = "admin_view_supply" if for_admin else "view_supply"
+    nav = []
+    if page.has_prev and page.items:
+        nav.append(InlineKeyboardButton(text="◀️", callback_data=f"{prefix}_{item_filter}_p{page.items[0].id}"))
+    if page.has_next and page.items:
+        nav.append(InlineKeyboardButton(text="▶️", callback_data=f"{prefix}_{item_filter}_n{page.items[-1].id}"))
+    if nav:
+        buttons.append(nav)
+
+    if manage:
+        buttons.append([InlineKeyboardButton(text="🗑 Удалить все товары", callback_data=f"delete_all_{supply_id}")])
+        buttons.append([InlineKeyboardButton(text="🔁 Изменить статус всех", callback_data=f"bulk_status_{supply_id}")])
+    back_callback = "admin_view_supply" if for_admin or manage else "view_supply"
     buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=back_callback)])
 
     return InlineKeyboardMarkup(inline_keyboard=buttons)
@@ -203,45 +275,213 @@ def get_admin_panel():
         [InlineKeyboardButton(text="📬 Заявки на вклады", callback_data="admin_view_requests")],
         [InlineKeyboardButton(text="➕ Добавить вклад", callback_data="admin_add_contribution")],
         [InlineKeyboardButton(text="📦 Заполнить поставку", callback_data="admin_add_item")],
+        [InlineKeyboardButton(text="📥 Импорт товаров", callback_data="admin_import_items")],
         [InlineKeyboardButton(text="🔍 Управлять поставкой", callback_data="admin_view_supply")],
         [InlineKeyboardButton(text="🆕 Создать поставку", callback_data="admin_create_supply")],
         [InlineKeyboardButton(text="🗑 Удалить поставку", callback_data="admin_delete_supply")],
+        [InlineKeyboardButton(text="📣 Рассылка", callback_data="admin_broadcast")],
         [InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")]
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+# === ВХОДЯЩИЕ ЗАЯВКИ ===
+# Одно сообщение со страницей заявок: отмеченные можно отклонить разом, а суммы по заявкам
+# админ присылает одним сообщением строками «номер сумма»
+async def render_request_inbox(message, state, after_id=0, before_id=None):
+    async with acquire() as conn:
+        page = await RequestRepo(conn).pending_page(REQUESTS_PAGE_SIZE, after_id=after_id, before_id=before_id)
+    if page.items:
+        after_id = page.items[0].id - 1
+    data = await state.update_data(inbox_after=after_id)
+    selected = set(data.get("inbox_selected", []))
+
+    if not page.items:
+        text = "📬 Новых заявок нет."
+    else:
+        lines = ["📬 <b>Заявки на вклады</b>\n"]
+        for req in page.items:
+            lines.append(
+                f"#{req.id} @{escape(req.username or str(req.user_id))} — "
+                f"{escape(req.bank or '')}: <code>{escape(req.payment_info or '')}</code>"
+            )
+        text = "\n".join(lines)
+
+    buttons = []
+    for req in page.items:
+        mark = "☑️" if req.id in selected else "⬜️"
+        buttons.append([InlineKeyboardButton(
+            text=f"{mark} #{req.id} @{req.username or req.user_id}", callback_data=f"inbox_toggle_{req.id}"
+        )])
+    nav = []
+    if page.has_prev and page.items:
+        nav.append(InlineKeyboardButton(text="◀️", callback_data=f"inbox_page_p{page.items[0].id}"))
+    if page.has_next and page.items:
+        nav.append(InlineKeyboardButton(text="▶️", callback_data=f"inbox_page_n{page.items[-1].id}"))
+    if nav:
+        buttons.append(nav)
+    if page.items:
+        buttons.append([
+            InlineKeyboardButton(text="☑️ Вся страница", callback_data="inbox_select_page"),
+            InlineKeyboardButton(text="✖️ Снять выбор", callback_data="inbox_clear"),
+        ])
+        buttons.append([
+            InlineKeyboardButton(text=f"✅ Ввести суммы ({len(selected)})", callback_data="inbox_approve"),
+            InlineKeyboardButton(text=f"❌ Отклонить ({len(selected)})", callback_data="inbox_reject"),
+        ])
+    buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_panel")])
+
+    try:
+        await message.edit_text(text, reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons), parse_mode="HTML")
+    except TelegramBadRequest:
+        pass
+    return page
+
 @dp.callback_query(F.data == "admin_view_requests")
-async def admin_view_requests(call: CallbackQuery):
+async def admin_view_requests(call: CallbackQuery, state: FSMContext):
     if call.from_user.id not in ADMIN_IDS:
         return
+    await state.set_state(None)
+    await state.update_data(inbox_selected=[])
+    await render_request_inbox(call.message, state)
 
-    conn = await get_db_conn()
-    requests = []
-    try:
-        requests = await conn.fetch("SELECT id, user_id, username, bank, payment_info FROM contribution_requests WHERE status = 'pending'")
-    finally:
-        if conn:
-            await conn.close()
+@dp.message(Command("requests"))
+async def cmd_requests(message: Message, state: FSMContext):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    await state.set_state(None)
+    await state.update_data(inbox_selected=[])
+    await render_request_inbox(await message.answer("📬 Заявки на вклады"), state)
+
+# Уведомления о заявках, разосланные до общего списка, ещё несут кнопки и состояние старого подтверждения по одной
+@dp.callback_query(F.data.startswith(("approve_req_", "reject_req_")))
+async def legacy_request_buttons(call: CallbackQuery):
+    await call.answer("Заявки теперь разбираются списком: используйте /requests", show_alert=True)
+
+async def _legacy_amount_state(message: Message, state: FSMContext):
+    return "req_id" in await state.get_data()
 
-    if not requests:
-        await call.answer("Нет новых заявок.", show_alert=True)
+@dp.message(MakeContribution.waiting_bank, _legacy_amount_state)
+async def legacy_admin_enter_amount(message: Message, state: FSMContext):
+    await state.clear()
+    await message.answer("Подтверждение по одной заявке больше не работает: используйте /requests")
+
+@dp.callback_query(F.data.startswith("inbox_"))
+async def request_inbox_action(call: CallbackQuery, state: FSMContext):
+    if call.from_user.id not in ADMIN_IDS:
+        await call.answer("Доступ запрещён.", show_alert=True)
         return
 
-    for req in requests:
-        req_id, user_id, username, bank, info = req['id'], req['user_id'], req['username'], req['bank'], req['payment_info']
-        markup = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="✅ Подтвердить", callback_data=f"approve_req_{req_id}")],
-            [InlineKeyboardButton(text="❌ Отклонить", callback_data=f"reject_req_{req_id}")]
-        ])
+    action = call.data[len("inbox_"):]
+    data = await state.get_data()
+    selected = data.get("inbox_selected", [])
+    after_id = data.get("inbox_after", 0)
+
+    if action.startswith("page_"):
+        cursor = action[len("page_"):]
+        position = int(cursor[1:])
+        await render_request_inbox(
+            call.message, state,
+            after_id=position if cursor[0] == "n" else 0,
+            before_id=position if cursor[0] == "p" else None
+        )
+    elif action.startswith("toggle_"):
+        req_id = int(action[len("toggle_"):])
+        selected = [i for i in selected if i != req_id] if req_id in selected else selected + [req_id]
+        await state.update_data(inbox_selected=selected)
+        await render_request_inbox(call.message, state, after_id=after_id)
+    elif action == "select_page":
+        async with acquire() as conn:
+            page = await RequestRepo(conn).pending_page(REQUESTS_PAGE_SIZE, after_id=after_id)
+        await state.update_data(inbox_selected=sorted(set(selected) | {req.id for req in page.items}))
+        await render_request_inbox(call.message, state, after_id=after_id)
+    elif action == "clear":
+        await state.update_data(inbox_selected=[])
+        await render_request_inbox(call.message, state, after_id=after_id)
+    elif action == "reject":
+        if not selected:
+            await call.answer("Отметьте заявки.", show_alert=True)
+            return
+        async with acquire() as conn:
+            async with conn.transaction():
+                user_ids = await RequestRepo(conn).reject_many(selected)
+                await OutboxRepo(conn).enqueue_many(
+                    user_ids, ["❌ Ваша заявка на вклад была отклонена."] * len(user_ids)
+                )
+        outbox.wake()
+        await state.update_data(inbox_selected=[])
+        await call.answer(f"Отклонено заявок: {len(user_ids)}.")
+        await render_request_inbox(call.message, state, after_id=after_id)
+        return
+    elif action == "approve":
+        await state.set_state(RequestInbox.waiting_amounts)
+        template = "\n".join(f"{req_id} " for req_id in sorted(selected)) or "12 1500"
         await call.message.answer(
-            f"📬 Заявка #{req_id}\n"
-            f"👤 Пользователь: @{username or user_id}\n"
-            f"🏦 Банк: {bank}\n"
-            f"📱/💳: <code>{info}</code>",
-            reply_markup=markup,
+            "💸 Отправьте суммы одним сообщением, по заявке на строку: <b>номер сумма</b>\n\n"
+            f"<code>{template}</code>",
             parse_mode="HTML"
         )
+    await call.answer()
+
+def parse_request_amounts(text):
+    amounts, errors = {}, []
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        parts = line.lstrip("#").split(maxsplit=1)
+        try:
+            req_id = int(parts[0])
+            amount = float(parts[1].replace(" ", "").replace(",", "."))
+            if amount <= 0:
+                raise ValueError
+        except (ValueError, IndexError):
+            errors.append(f"«{line}»: нужна строка вида «номер сумма»")
+            continue
+        if req_id in amounts:
+            errors.append(f"#{req_id}: заявка указана дважды")
+            continue
+        amounts[req_id] = amount
+    return amounts, errors
+
+@dp.message(RequestInbox.waiting_amounts)
+async def request_inbox_amounts(message: Message, state: FSMContext):
+    if message.from_user.id not in ADMIN_IDS:
+        await state.clear()
+        return
+
+    amounts, errors = parse_request_amounts(message.text)
+    if not amounts:
+        await message.answer("\n".join(errors or ["Введите суммы строками «номер сумма»."]))
+        return
+
+    async with acquire() as conn:
+        # Все подтверждения, записи в журнал и уведомления — одна транзакция, поставка заблокирована до коммита
+        async with conn.transaction():
+            ledger = LedgerRepo(conn)
+            supply_id = await ledger.lock_active_supply()
+            if supply_id is None:
+                await message.answer("❌ Нет активной поставки: заявки не подтверждены, суммы можно отправить позже.")
+                return
+            approved = await ledger.approve_requests(amounts, message.from_user.id, supply_id)
+            await OutboxRepo(conn).enqueue_many(
+                [row["user_id"] for row in approved],
+                [
+                    f"✅ Ваш вклад на {row['amount']}₽ подтверждён!\n"
+                    f"Он добавлен в поставку #{row['supply_id']}."
+                    for row in approved
+                ]
+            )
+    rollup.wake()
+    outbox.wake()
 
+    done = {row["request_id"] for row in approved}
+    errors += [f"#{req_id}: заявка не найдена или уже обработана" for req_id in amounts if req_id not in done]
+    await state.clear()
+
+    text = f"✅ Подтверждено заявок: {len(done)} на {sum(row['amount'] for row in approved)}₽"
+    if errors:
+        text += "\n\n" + "\n".join(errors[:30])
+    await message.answer(text, reply_markup=get_admin_panel())
 
 @dp.callback_query(F.data == "faq")
 async def show_faq(call: CallbackQuery):
@@ -280,73 +520,21 @@ async def show_faq(call: CallbackQuery):
 async def my_stats(call: CallbackQuery):
     user_id = call.from_user.id
 
-    conn = await get_db_conn()
-    contrib_rows = []
-    top_rows = []
-    try:
-        contrib_rows = await conn.fetch("""
-            SELECT s.name, s.status, c.amount
-            FROM contributions c
-            JOIN supplies s ON c.supply_id = s.id
-            WHERE c.user_id = $1
-        """, user_id)
-
-        if not contrib_rows:
-            await call.answer("Вы ещё не делали вкладов.", show_alert=True)
-            return
-
-        total_invested = sum(row['amount'] for row in contrib_rows)
-        total_profit = 0
-        for row in contrib_rows:
-            supply_name, status, amount = row['name'], row['status'], row['amount']
-            if status == "completed":
-                profit = amount * 0.3
-                total_profit += profit
-
-        biggest_contrib = max(contrib_rows, key=lambda x: x['amount'])
-        biggest_contrib_amount = biggest_contrib['amount']
-        biggest_contrib_supply = biggest_contrib['name']
-
-        num_supplies = len(contrib_rows)
-
-        best_supply = None
-        best_ratio = 0
-        for row in contrib_rows:
-            supply_name, status, amount = row['name'], row['status'], row['amount']
-            if status == "completed" and amount > 0:
-                profit = amount * 0.3
-                ratio = profit / amount
-                if ratio > best_ratio:
-                    best_ratio = ratio
-                    best_supply = supply_name
-
-        top_rows = await conn.fetch("""
-            SELECT user_id, SUM(amount) as total
-            FROM contributions
-            GROUP BY user_id
-            ORDER BY total DESC
-        """)
-    finally:
-        if conn:
-            await conn.close()
+    async with acquire() as conn:
+        stats = await SummaryRepo(conn).user_stats(user_id)
 
-    my_total = total_invested
-    my_rank = 1
-    for row in top_rows:
-        if row['total'] >= my_total:
-            my_rank += 1
-        else:
-            break
-    my_rank -= 1
+    if not stats.supplies:
+        await call.answer("Вы ещё не делали вкладов.", show_alert=True)
+        return
 
     text = (
         "📊 <b>ВАША СТАТИСТИКА</b>\n\n\n"
-        f"💸 Всего вложено: <b>{total_invested}₽</b>\n\n"
-        f"💰 Получено с продаж: <b>{total_profit:.2f}₽</b>\n\n"
-        f"🏆 Самый большой вклад: <b>{biggest_contrib_amount}₽</b> {biggest_contrib_supply}\n\n"
-        f"🏅 Место в топе по вкладам за все время: <b>{my_rank}</b>\n\n"
-        f"🎯 Самая удачная поставка: <b>{best_supply or 'Нет завершённых'}</b>\n\n"
-        f"📦 Участвовал в поставках: <b>{num_supplies}</b>\n\n"
+        f"💸 Всего вложено: <b>{stats.invested}₽</b>\n\n"
+        f"💰 Получено с продаж: <b>{stats.profit:.2f}₽</b>\n\n"
+        f"🏆 Самый большой вклад: <b>{stats.biggest_amount}₽</b> {stats.biggest_supply}\n\n"
+        f"🏅 Место в топе по вкладам за все время: <b>{stats.rank}</b>\n\n"
+        f"🎯 Самая удачная поставка: <b>{stats.best_supply or 'Нет завершённых'}</b>\n\n"
+        f"📦 Участвовал в поставках: <b>{stats.supplies}</b>\n\n"
     )
 
     markup = InlineKeyboardMarkup(inline_keyboard=[
@@ -355,119 +543,57 @@ async def my_stats(call: CallbackQuery):
 
     await call.message.edit_text(text, reply_markup=markup, parse_mode="HTML")
 
-@dp.callback_query(F.data.startswith("approve_req_"))
-async def approve_contribution_request(call: CallbackQuery, state: FSMContext):
-    req_id = int(call.data.split("_")[2])
+@dp.callback_query(F.data == "top_contributors")
+async def show_top_contributors(call: CallbackQuery):
+    rows = await top_contributors.get()
 
-    conn = await get_db_conn()
-    row = None
-    try:
-        row = await conn.fetchrow("SELECT user_id, bank, payment_info FROM contribution_requests WHERE id = $1", req_id)
-    finally:
-        if conn:
-            await conn.close()
-
-    if not row:
-        await call.answer("Заявка не найдена.")
-        return
-
-    user_id, bank, info = row['user_id'], row['bank'], row['payment_info']
-
-    await state.update_data(req_id=req_id, temp_user_id=user_id)
-    await state.set_state(MakeContribution.waiting_bank)
-    await call.message.edit_text(f"Сколько внес пользователь (в рублях)?")
+    text = "🏆 <b>ТОП ВКЛАДЧИКОВ</b>\n\n"
+    if not rows:
+        text += "Пока никто не сделал вклад."
+    for place, row in enumerate(rows, start=1):
+        name = f"@{row.username}" if row.username else f"#{row.user_id}"
+        text += f"{place}. {name} — <b>{row.total:.0f}₽</b>\n"
 
-@dp.message(MakeContribution.waiting_bank)
-async def admin_enter_amount(message: Message, state: FSMContext):
-    try:
-        amount = float(message.text)
-        if amount <= 0: raise ValueError
-    except:
-        await message.answer("Введите число!")
-        return
-
-    data = await state.get_data()
-    req_id = data["req_id"]
-    user_id = data["temp_user_id"]
-
-    conn = await get_db_conn()
-    try:
-        supply_id = await get_latest_active_supply_id()
-        if not supply_id:
-            await message.answer("❌ Нет активной поставки.")
-            await state.clear()
-            return
-
-        existing = await conn.fetchrow("SELECT amount FROM contributions WHERE user_id = $1 AND supply_id = $2", user_id, supply_id)
-
-        async with conn.transaction():
-            if existing:
-                new_amount = existing['amount'] + amount
-                await conn.execute("UPDATE contributions SET amount = $1 WHERE user_id = $2 AND supply_id = $3",
-                                    new_amount, user_id, supply_id)
-            else:
-                await conn.execute("INSERT INTO contributions (user_id, supply_id, amount, username) VALUES ($1, $2, $3, $4)",
-                                    user_id, supply_id, amount, message.from_user.username)
-
-            await conn.execute("UPDATE contribution_requests SET status = 'approved' WHERE id = $1", req_id)
-    finally:
-        if conn:
-            await conn.close()
-
-    try:
-        await bot.send_message(
-            user_id,
-            f"✅ Ваш вклад на {amount}₽ подтверждён!\n"
-            f"Он добавлен в поставку #{supply_id}."
-        )
-    except Exception as e:
-        print(f"Failed to send message to user {user_id}: {e}")
+    markup = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")]
+    ])
 
-    await message.answer("✅ Вклад подтверждён и добавлен.")
-    await state.clear()
-    await cmd_start(message)
+    await call.message.edit_text(text, reply_markup=markup, parse_mode="HTML")
 
 # === ОСНОВНЫЕ ОБРАБОТЧИКИ ===
 
 @dp.message(Command("start"))
 async def cmd_start(message: Message, state: FSMContext):
     user_id = message.from_user.id
-    username = message.from_user.username
 
     await state.clear()
 
-    conn = await get_db_conn()
-    try:
-        supply_row = await conn.fetchrow("SELECT id FROM supplies WHERE status = 'active' ORDER BY id DESC LIMIT 1")
-        supply_id = None
-        if not supply_row:
-            supply_id = await conn.fetchval(
-                "INSERT INTO supplies (name, status) VALUES ($1, 'active') RETURNING id",
-                f"Поставка от {datetime.now().strftime('%d.%m.%Y')}"
-            )
-        else:
-            supply_id = supply_row['id']
-
-        existing_contribution = await conn.fetchrow("SELECT 1 FROM contributions WHERE user_id = $1 AND supply_id = $2", user_id, supply_id)
-        if not existing_contribution:
-            await conn.execute("INSERT INTO contributions (user_id, supply_id, amount, username) VALUES ($1, $2, 0, $3)", user_id, supply_id, username)
-        else:
-            await conn.execute("UPDATE contributions SET username = $1 WHERE user_id = $2 AND supply_id = $3", username, user_id, supply_id)
-    finally:
-        if conn:
-            await conn.close()
+    async with acquire() as conn:
+        _, created = await SupplyRepo(conn).ensure_active(f"Поставка от {datetime.now().strftime('%d.%m.%Y')}")
+    if created:
+        cache.bump(SUPPLIES)
 
     await message.answer("👋 Добро пожаловать! Выберите действие:", reply_markup=get_main_menu(user_id))
 
-async def get_latest_active_supply_id():
-    conn = await get_db_conn()
-    row = None
-    try:
-        row = await conn.fetchrow("SELECT id FROM supplies WHERE status = 'active' ORDER BY id DESC LIMIT 1")
-    finally:
-        if conn:
-            await conn.close()
-    return row['id'] if row else None
+@cached(lambda value, status: (SUPPLIES,))
+async def get_supplies_by_status(status):
+    async with acquire() as conn:
+        return await SupplyRepo(conn).list_by_status(status)
+
+@cached(lambda value, supply_id: (supply_scope(supply_id),))
+async def get_supply_name(supply_id):
+    async with acquire() as conn:
+        return await SupplyRepo(conn).name(supply_id)
+
+def item_scopes(item, item_id):
+    if item is None:
+        return (item_scope(item_id),)
+    return (item_scope(item_id), supply_scope(item.supply_id), photo_scope(item.photo))
+
+@cached(item_scopes)
+async def get_item(item_id):
+    async with acquire() as conn:
+        return await ItemRepo(conn).get(item_id)
 
 
 @dp.callback_query(F.data.startswith("user_item_"))
@@ -475,47 +601,23 @@ async def user_show_item_details(call: CallbackQuery):
     item_id = int(call.data.split("_")[2])
     user_id = call.from_user.id
 
-    conn = await get_db_conn()
-    row = None
-    try:
-        row = await conn.fetchrow("""
-            SELECT title, price, sell_price, description, photo, is_sold, supply_id, status
-            FROM items WHERE id = $1
-        """, item_id)
-        if not row:
-            await call.answer("Товар не найден.")
-            return
-
-        title, price, sell_price, desc, photo_path, is_sold_db, supply_id, status = \
-            row['title'], row['price'], row['sell_price'], row['description'], row['photo'], \
-            row['is_sold'], row['supply_id'], row['status']
-
-        contrib_row = await conn.fetchrow("SELECT amount FROM contributions WHERE user_id = $1 AND supply_id = $2", user_id, supply_id)
-        user_contribution = contrib_row['amount'] if contrib_row else 0
+    item = await get_item(item_id)
+    if not item:
+        await call.answer("Товар не найден.")
+        return
 
-        all_contribs = await conn.fetch("SELECT user_id, amount FROM contributions WHERE supply_id = $1", supply_id)
-        total = sum(c['amount'] for c in all_contribs)
+    title, price, sell_price, desc, photo_path, supply_id, status = \
+        item.title, item.price, item.sell_price, item.description, item.photo, item.supply_id, item.status
+    photo_file_id = item.photo_file_id
 
-        share = 0
-        if total != 0:
-            share = (user_contribution / total) * 100
+    async with acquire() as conn:
+        details = await SummaryRepo(conn).supply_details(supply_id, user_id)
 
-        if user_id in ADMIN_IDS:
-            other_users = [c['user_id'] for c in all_contribs if c['user_id'] not in ADMIN_IDS]
-            N = len(other_users)
-            if N > 0:
-                share = min(share + 20.0, 100)
-        else:
-            admin_in_supply = any(c['user_id'] in ADMIN_IDS for c in all_contribs)
-            if admin_in_supply:
-                other_users = [c['user_id'] for c in all_contribs if c['user_id'] not in ADMIN_IDS]
-                N = len(other_users)
-                if N > 0:
-                    deduction = 20.0 / N
-                    share = max(share - deduction, 0)
-    finally:
-        if conn:
-            await conn.close()
+    share = 0
+    if details and details.payout:
+        share = details.payout.share * 100
+    elif details:
+        share = profit_share(details.amount, user_id in ADMIN_IDS, details.totals) * 100
 
     arrival_text = "🚚 Приедет примерно: <b>20–30 дней</b>"
 
@@ -546,14 +648,16 @@ async def user_show_item_details(call: CallbackQuery):
         [InlineKeyboardButton(text="⬅️ Назад", callback_data=f"supply_user_{supply_id}")]
     ])
 
-    if photo_path and os.path.exists(photo_path):
+    if photo_path and (photo_file_id or os.path.exists(photo_path)):
         try:
             await call.message.delete()
         except:
             pass
-        await bot.send_photo(
-            chat_id=call.message.chat.id,
-            photo=FSInputFile(photo_path),
+        await send_item_photo(
+            bot,
+            call.message.chat.id,
+            photo_path,
+            photo_file_id,
             caption=text,
             reply_markup=markup,
             parse_mode="HTML"
@@ -569,12 +673,9 @@ async def admin_create_supply(call: CallbackQuery):
 
     name = f"Поставка от {datetime.now().strftime('%d.%m.%Y')}"
 
-    conn = await get_db_conn()
-    try:
-        await conn.execute("INSERT INTO supplies (name, status) VALUES ($1, 'active')", name)
-    finally:
-        if conn:
-            await conn.close()
+    async with acquire() as conn:
+        await SupplyRepo(conn).create(name)
+    cache.bump(SUPPLIES)
 
     await call.answer(f"✅ Поставка '{name}' создана!", show_alert=True)
     await admin_panel(call)
@@ -585,13 +686,8 @@ async def admin_delete_supply_start(call: CallbackQuery):
         await call.answer("Доступ запрещён.", show_alert=True)
         return
 
-    conn = await get_db_conn()
-    supplies = []
-    try:
-        supplies = await conn.fetch("SELECT id, name FROM supplies WHERE status = 'active'")
-    finally:
-        if conn:
-            await conn.close()
+    async with acquire() as conn:
+        supplies = await SupplyRepo(conn).list_by_status("active")
 
     if not supplies:
         await call.answer("Нет активных поставок.", show_alert=True)
@@ -599,7 +695,7 @@ async def admin_delete_supply_start(call: CallbackQuery):
 
     buttons = []
     for s in supplies:
-        buttons.append([InlineKeyboardButton(text=s['name'], callback_data=f"confirm_delete_supply_{s['id']}")])
+        buttons.append([InlineKeyboardButton(text=s.name, callback_data=f"confirm_delete_supply_{s.id}")])
     buttons.append([InlineKeyboardButton(text="❌ Отмена", callback_data="admin_panel")])
 
     await call.message.answer("Выберите поставку для удаления:", reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
@@ -608,13 +704,7 @@ async def admin_delete_supply_start(call: CallbackQuery):
 async def confirm_delete_supply(call: CallbackQuery):
     supply_id = int(call.data.split("_")[3])
 
-    conn = await get_db_conn()
-    name = None
-    try:
-        name = await conn.fetchval("SELECT name FROM supplies WHERE id = $1", supply_id)
-    finally:
-        if conn:
-            await conn.close()
+    name = await get_supply_name(supply_id)
 
     if not name:
         await call.answer("Поставка не найдена.")
@@ -631,12 +721,8 @@ async def confirm_delete_supply(call: CallbackQuery):
 async def move_supply_to_completed(call: CallbackQuery):
     supply_id = int(call.data.split("_")[2])
 
-    conn = await get_db_conn()
-    try:
-        await conn.execute("UPDATE supplies SET status = 'completed' WHERE id = $1", supply_id)
-    finally:
-        if conn:
-            await conn.close()
+    await complete_supply(supply_id)
+    cache.bump(SUPPLIES, supply_scope(supply_id))
 
     await call.answer("✅ Поставка перемещена в 'Предыдущие'.")
     await admin_panel(call)
@@ -645,14 +731,11 @@ async def move_supply_to_completed(call: CallbackQuery):
 async def full_delete_supply(call: CallbackQuery):
     supply_id = int(call.data.split("_")[3])
 
-    conn = await get_db_conn()
-    try:
+    async with acquire() as conn:
         async with conn.transaction():
-            await conn.execute("DELETE FROM items WHERE supply_id = $1", supply_id)
-            await conn.execute("DELETE FROM supplies WHERE id = $1", supply_id)
-    finally:
-        if conn:
-            await conn.close()
+            await ItemRepo(conn).delete_by_supply(supply_id)
+            await SupplyRepo(conn).delete(supply_id)
+    cache.bump(SUPPLIES, supply_scope(supply_id))
 
     await call.answer("✅ Поставка и все товары удалены.")
     await admin_panel(call)
@@ -663,24 +746,16 @@ async def admin_show_item_details(call: CallbackQuery, state: FSMContext):
 
     await state.update_data(current_item_id=item_id)
 
-    conn = await get_db_conn()
-    row = None
-    try:
-        row = await conn.fetchrow("""
-            SELECT title, price, sell_price, description, photo, is_sold, supply_id, status
-            FROM items WHERE id = $1
-        """, item_id)
-    finally:
-        if conn:
-            await conn.close()
+    item = await get_item(item_id)
 
-    if not row:
+    if not item:
         await call.answer("Товар не найден.")
         return
 
     title, price, sell_price, desc, photo_path, is_sold_db, supply_id, status = \
-        row['title'], row['price'], row['sell_price'], row['description'], row['photo'], \
-        row['is_sold'], row['supply_id'], row['status']
+        item.title, item.price, item.sell_price, item.description, item.photo, \
+        item.is_sold, item.supply_id, item.status
+    photo_file_id = item.photo_file_id
     text = (
         f"📦 <b>{title}</b>\n\n"
         f"💰 Закупка: <b>{price}₽</b>\n"
@@ -704,14 +779,16 @@ async def admin_show_item_details(call: CallbackQuery, state: FSMContext):
 
     markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-    if photo_path and os.path.exists(photo_path):
+    if photo_path and (photo_file_id or os.path.exists(photo_path)):
         try:
             await call.message.delete()
         except:
             pass
-        await bot.send_photo(
-            chat_id=call.message.chat.id,
-            photo=FSInputFile(photo_path),
+        await send_item_photo(
+            bot,
+            call.message.chat.id,
+            photo_path,
+            photo_file_id,
             caption=text,
             reply_markup=markup,
             parse_mode="HTML"
@@ -727,25 +804,19 @@ async def admin_show_item_details(call: CallbackQuery, state: FSMContext):
 async def my_contributions(call: CallbackQuery):
     user_id = call.from_user.id
 
-    conn = await get_db_conn()
-    all_supplies = []
-    contrib_dict = {}
-    try:
-        all_supplies = await conn.fetch("SELECT id, name FROM supplies WHERE status IN ('active', 'completed')")
-        contrib_rows = await conn.fetch("SELECT supply_id, amount FROM contributions WHERE user_id = $1", user_id)
-        contrib_dict = {row['supply_id']: row['amount'] for row in contrib_rows}
-    finally:
-        if conn:
-            await conn.close()
+    async with acquire() as conn:
+        all_supplies = await SupplyRepo(conn).list_visible()
+        contrib_rows = await ContributionRepo(conn).list_by_user(user_id)
+        contrib_dict = {row.supply_id: row.amount for row in contrib_rows}
 
     if not all_supplies:
         await call.answer("Нет поставок.", show_alert=True)
         return
 
     buttons = []
-    for s_id, s_name in [(s['id'], s['name']) for s in all_supplies]:
-        amount = contrib_dict.get(s_id, 0)
-        buttons.append([InlineKeyboardButton(text=f"{s_name} — {amount}₽", callback_data=f"user_supply_{s_id}")])
+    for s in all_supplies:
+        amount = contrib_dict.get(s.id, 0)
+        buttons.append([InlineKeyboardButton(text=f"{s.name} — {amount}₽", callback_data=f"user_supply_{s.id}")])
 
     buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")])
 
@@ -766,63 +837,35 @@ async def user_show_supply_details(call: CallbackQuery):
     supply_id = int(call.data.split("_")[2])
     user_id = call.from_user.id
 
-    conn = await get_db_conn()
-    supply_name = None
-    supply_status = None
-    user_amount = 0
-    expected_earnings = 0
     share = 0
-    bank = "Не указаны"
-    payment_info = "Не указаны"
-    supply_info_text = ""
 
-    try:
-        supply_row = await conn.fetchrow("SELECT name, status FROM supplies WHERE id = $1", supply_id)
-        if not supply_row:
-            await call.answer("Поставка не найдена.")
-            return
-        supply_name, supply_status = supply_row['name'], supply_row['status']
-
-        contrib_row = await conn.fetchrow("SELECT amount FROM contributions WHERE user_id = $1 AND supply_id = $2", user_id, supply_id)
-        user_amount = contrib_row['amount'] if contrib_row else 0
-
-        items = await conn.fetch("SELECT price, sell_price, is_sold FROM items WHERE supply_id = $1", supply_id)
-
-        if items:
-            total_cost = sum(item['price'] for item in items)
-            total_revenue = sum(item['sell_price'] for item in items if item['is_sold'])
-            total_contrib = await conn.fetchval("SELECT COALESCE(SUM(amount), 0) FROM contributions WHERE supply_id = $1", supply_id)
-
-            if total_contrib > 0:
-                share = user_amount / total_contrib
-            else:
-                share = 0
-
-            if user_id in ADMIN_IDS:
-                other_contrib_sum = sum(c['amount'] for c in await conn.fetch("SELECT amount FROM contributions WHERE supply_id = $1 AND user_id != ANY($2)", supply_id, ADMIN_IDS))
-                if total_contrib > 0:
-                    bonus_share = 0.2 * (other_contrib_sum / total_contrib)
-                    share = min(share + bonus_share, 1)
-            else:
-                admin_contribs_sum = sum(c['amount'] for c in await conn.fetch("SELECT amount FROM contributions WHERE supply_id = $1 AND user_id = ANY($2)", supply_id, ADMIN_IDS))
-                if total_contrib > 0 and admin_contribs_sum > 0:
-                    deduction_share = 0.2 * (user_amount / total_contrib)
-                    share = max(share - deduction_share, 0)
-
-
-            expected_revenue_for_user = (total_revenue - total_cost) * share
-            expected_earnings = round(expected_revenue_for_user, 2)
-            supply_info_text = f"💰 Предполагаемый заработок: <b>{expected_earnings}₽</b>\n"
-        else:
-            supply_info_text = "📦 В этой поставке пока нет товаров.\n"
+    async with acquire() as conn:
+        details = await SummaryRepo(conn).supply_details(supply_id, user_id)
 
-        req_row = await conn.fetchrow("SELECT bank, payment_info FROM contribution_requests WHERE user_id = $1 AND status = 'pending' ORDER BY id DESC LIMIT 1", user_id)
-        bank = req_row['bank'] if req_row else "Не указаны"
-        payment_info = req_row['payment_info'] if req_row else "Не указаны"
+    if not details:
+        await call.answer("Поставка не найдена.")
+        return
+    supply_name = details.name
+    user_amount = details.amount
+    payout = details.payout
+    totals = details.totals
+
+    if payout:
+        share = payout.share
+        supply_info_text = (
+            f"💰 Заработок: <b>{payout.profit:.2f}₽</b>\n"
+            f"↩️ К выплате: <b>{payout.payout:.2f}₽</b>\n"
+        )
+    elif totals.item_count:
+        is_admin = user_id in ADMIN_IDS
+        share = profit_share(user_amount, is_admin, totals)
+        expected_earnings = round(expected_profit(user_amount, is_admin, totals), 2)
+        supply_info_text = f"💰 Предполагаемый заработок: <b>{expected_earnings}₽</b>\n"
+    else:
+        supply_info_text = "📦 В этой поставке пока нет товаров.\n"
 
-    finally:
-        if conn:
-            await conn.close()
+    bank = details.bank or "Не указаны"
+    payment_info = details.payment_info or "Не указаны"
 
     text = (
         f"📦 <b>{supply_name}</b>\n\n"
@@ -846,20 +889,12 @@ async def user_show_supply_details(call: CallbackQuery):
 async def show_supply_list(call: CallbackQuery):
     supply_type = call.data.split("_")[2]
 
-    conn = await get_db_conn()
-    supplies = []
-    try:
-        if supply_type == "current":
-            supplies = await conn.fetch("SELECT id, name FROM supplies WHERE status = 'active'")
-        else:
-            supplies = await conn.fetch("SELECT id, name FROM supplies WHERE status = 'completed'")
-    finally:
-        if conn:
-            await conn.close()
+    status = "active" if supply_type == "current" else "completed"
+    supplies = await get_supplies_by_status(status)
 
     buttons = []
     for s in supplies:
-        buttons.append([InlineKeyboardButton(text=s['name'], callback_data=f"supply_user_{s['id']}")])
+        buttons.append([InlineKeyboardButton(text=s.name, callback_data=f"supply_user_{s.id}")])
     buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="view_supply")])
     await call.message.answer(f"Список {supply_type} поставок:", reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
 
@@ -869,13 +904,7 @@ async def admin_view_supply(call: CallbackQuery):
         await call.answer("Доступ запрещён.", show_alert=True)
         return
 
-    conn = await get_db_conn()
-    supplies = []
-    try:
-        supplies = await conn.fetch("SELECT id, name FROM supplies WHERE status = 'active'")
-    finally:
-        if conn:
-            await conn.close()
+    supplies = await get_supplies_by_status("active")
 
     if not supplies:
         await call.answer("Нет активной поставки.", show_alert=True)
@@ -883,7 +912,7 @@ async def admin_view_supply(call: CallbackQuery):
 
     buttons = []
     for s in supplies:
-        buttons.append([InlineKeyboardButton(text=s['name'], callback_data=f"admin_supply_{s['id']}")])
+        buttons.append([InlineKeyboardButton(text=s.name, callback_data=f"admin_supply_{s.id}")])
     buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_panel")])
     try:
         await call.message.edit_text("📦 Выберите поставку для управления:", reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
@@ -893,51 +922,48 @@ async def admin_view_supply(call: CallbackQuery):
 @dp.callback_query(F.data.startswith("supply_user_"))
 async def user_show_supply_items(call: CallbackQuery):
     supply_id = int(call.data.split("_")[2])
-    conn = await get_db_conn()
-    name_row = None
-    try:
-        name_row = await conn.fetchrow("SELECT name FROM supplies WHERE id = $1", supply_id)
-    finally:
-        if conn:
-            await conn.close()
+    name = await get_supply_name(supply_id)
 
-    if not name_row:
+    if not name:
         await call.answer("Поставка не найдена.")
         return
 
     await call.message.answer(
-        f"📦 Товары в поставке: {name_row['name']}",
+        f"📦 Товары в поставке: {name}",
         reply_markup=await get_item_list_keyboard(supply_id, for_admin=False)
     )
 
 @dp.callback_query(F.data.startswith("admin_supply_"))
 async def admin_show_supply_items(call: CallbackQuery):
     supply_id = int(call.data.split("_")[2])
-    conn = await get_db_conn()
-    name_row = None
-    items = []
-    try:
-        name_row = await conn.fetchrow("SELECT name FROM supplies WHERE id = $1", supply_id)
-        if not name_row:
-            await call.answer("Поставка не найдена.")
-            return
-        items = await conn.fetch("SELECT id, title, price, is_sold FROM items WHERE supply_id = $1", supply_id)
-    finally:
-        if conn:
-            await conn.close()
+    name = await get_supply_name(supply_id)
+    if not name:
+        await call.answer("Поставка не найдена.")
+        return
 
-    buttons = []
-    for item in items:
-        item_id, title, price, is_sold = item['id'], item['title'], item['price'], item['is_sold']
-        status = "✅" if is_sold else "🔄"
-        text = f"{title} — {price}₽ {status}"
-        buttons.append([InlineKeyboardButton(text=text, callback_data=f"admin_item_{item_id}")])
-
-    buttons.append([InlineKeyboardButton(text="🗑 Удалить все товары", callback_data=f"delete_all_{supply_id}")])
-    buttons.append([InlineKeyboardButton(text="🔁 Изменить статус всех", callback_data=f"bulk_status_{supply_id}")])
-    buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_view_supply")])
-    markup = InlineKeyboardMarkup(inline_keyboard=buttons)
-    await call.message.answer(f"📦 Управление поставкой: {name_row['name']}", reply_markup=markup)
+    await call.message.answer(
+        f"📦 Управление поставкой: {name}",
+        reply_markup=await get_item_list_keyboard(supply_id, manage=True)
+    )
+
+@dp.callback_query(F.data.startswith("items_"))
+async def show_item_page(call: CallbackQuery):
+    _, scope, supply_id, item_filter, cursor = call.data.split("_")
+    if scope != "u" and call.from_user.id not in ADMIN_IDS:
+        await call.answer("Доступ запрещён.", show_alert=True)
+        return
+
+    position = int(cursor[1:])
+    markup = await get_item_list_keyboard(
+        int(supply_id), for_admin=scope == "a", manage=scope == "m", item_filter=item_filter,
+        after_id=position if cursor[0] == "n" else 0,
+        before_id=position if cursor[0] == "p" else None
+    )
+    try:
+        await call.message.edit_reply_markup(reply_markup=markup)
+    except TelegramBadRequest:
+        pass
+    await call.answer()
 
 @dp.callback_query(F.data.startswith("delete_all_"))
 async def confirm_delete_all(call: CallbackQuery):
@@ -951,12 +977,9 @@ async def confirm_delete_all(call: CallbackQuery):
 @dp.callback_query(F.data.startswith("confirm_delete_all_"))
 async def delete_all_items(call: CallbackQuery):
     supply_id = int(call.data.split("_")[3])
-    conn = await get_db_conn()
-    try:
-        await conn.execute("DELETE FROM items WHERE supply_id = $1", supply_id)
-    finally:
-        if conn:
-            await conn.close()
+    async with acquire() as conn:
+        await ItemRepo(conn).delete_by_supply(supply_id)
+    cache.bump(supply_scope(supply_id))
     await call.message.edit_text("🗑 Все товары удалены.")
     await admin_view_supply(call)
 
@@ -987,12 +1010,9 @@ async def apply_bulk_status(call: CallbackQuery, state: FSMContext):
     status = call.data.replace("apply_bulk_status_", "").replace("_", " ")
     data = await state.get_data()
     supply_id = data["bulk_supply_id"]
-    conn = await get_db_conn()
-    try:
-        await conn.execute("UPDATE items SET status = $1 WHERE supply_id = $2", status, supply_id)
-    finally:
-        if conn:
-            await conn.close()
+    async with acquire() as conn:
+        await ItemRepo(conn).set_status_for_supply(supply_id, status)
+    cache.bump(supply_scope(supply_id))
     await call.answer(f"✅ Статус всех товаров изменён на: {status}")
     await admin_view_supply(call)
 
@@ -1002,26 +1022,21 @@ async def admin_add_contribution_start(call: CallbackQuery, state: FSMContext):
         await call.answer("Доступ запрещён.", show_alert=True)
         return
 
-    conn = await get_db_conn()
-    supplies = []
-    try:
-        supplies = await conn.fetch("SELECT id, name FROM supplies WHERE status = 'active'")
-    finally:
-        if conn:
-            await conn.close()
+    async with acquire() as conn:
+        supplies = await SupplyRepo(conn).list_by_status("active")
 
     if not supplies:
         await call.answer("Нет активных поставок. Сначала создайте новую поставку.")
         return
 
     if len(supplies) == 1:
-        await state.update_data(supply_id=supplies[0]['id'])
+        await state.update_data(supply_id=supplies[0].id)
         await state.set_state(AddContribution.waiting_username)
         await call.message.answer("👤 Введите <b>юзернейм</b> пользователя (например, @ivan_123 или ivan_123):", parse_mode="HTML")
     else:
         buttons = []
         for s in supplies:
-            buttons.append([InlineKeyboardButton(text=s['name'], callback_data=f"select_supply_for_contrib_{s['id']}")])
+            buttons.append([InlineKeyboardButton(text=s.name, callback_data=f"select_supply_for_contrib_{s.id}")])
         buttons.append([InlineKeyboardButton(text="❌ Отмена", callback_data="admin_panel")])
         markup = InlineKeyboardMarkup(inline_keyboard=buttons)
         await call.message.answer("📦 В какую поставку добавить вклад?", reply_markup=markup)
@@ -1038,34 +1053,23 @@ async def show_supply_items(call: CallbackQuery):
     data = call.data.split("_")
     supply_id = int(data[1])
     is_admin = call.from_user.id in ADMIN_IDS
-    conn = await get_db_conn()
-    name_row = None
-    try:
-        name_row = await conn.fetchrow("SELECT name FROM supplies WHERE id = $1", supply_id)
-    finally:
-        if conn:
-            await conn.close()
+    name = await get_supply_name(supply_id)
 
-    if not name_row:
+    if not name:
         await call.answer("Поставка не найдена.")
         return
 
     await call.message.answer(
-        f"📦 Товары в поставке: {name_row['name']}",
+        f"📦 Товары в поставке: {name}",
         reply_markup=await get_item_list_keyboard(supply_id, for_admin=is_admin)
     )
 
 @dp.callback_query(F.data.startswith("toggle_sold_"))
 async def toggle_item_sold_status(call: CallbackQuery, state: FSMContext):
     item_id = int(call.data.split("_")[2])
-    conn = await get_db_conn()
-    try:
-        current_status = await conn.fetchval("SELECT is_sold FROM items WHERE id = $1", item_id)
-        new_status = not current_status
-        await conn.execute("UPDATE items SET is_sold = $1 WHERE id = $2", new_status, item_id)
-    finally:
-        if conn:
-            await conn.close()
+    async with acquire() as conn:
+        supply_id = await ItemRepo(conn).toggle_sold(item_id)
+    cache.bump(item_scope(item_id), supply_scope(supply_id))
     await call.answer("Статус товара изменён.")
     await admin_show_item_details(call, state)
 
@@ -1077,12 +1081,9 @@ async def admin_delete_item(call: CallbackQuery, state: FSMContext):
         await call.answer("Ошибка: товар не выбран.")
         return
 
-    conn = await get_db_conn()
-    try:
-        await conn.execute("DELETE FROM items WHERE id = $1", item_id)
-    finally:
-        if conn:
-            await conn.close()
+    async with acquire() as conn:
+        supply_id = await ItemRepo(conn).delete(item_id)
+    cache.bump(item_scope(item_id), supply_scope(supply_id))
     await call.answer("Товар удалён.")
     await state.clear()
     await admin_panel(call)
@@ -1095,13 +1096,8 @@ async def admin_edit_item_start(call: CallbackQuery, state: FSMContext):
         await call.answer("Ошибка: товар не выбран для редактирования.")
         return
 
-    conn = await get_db_conn()
-    item_data = None
-    try:
-        item_data = await conn.fetchrow("SELECT title, price, sell_price, description, photo FROM items WHERE id = $1", item_id)
-    finally:
-        if conn:
-            await conn.close()
+    async with acquire() as conn:
+        item_data = await ItemRepo(conn).get(item_id)
 
     if not item_data:
         await call.answer("Ошибка: товар не найден.")
@@ -1109,14 +1105,14 @@ async def admin_edit_item_start(call: CallbackQuery, state: FSMContext):
 
     await state.update_data(
         item_to_edit_id=item_id,
-        original_title=item_data['title'],
-        original_price=item_data['price'],
-        original_sell_price=item_data['sell_price'],
-        original_description=item_data['description'],
-        original_photo=item_data['photo']
+        original_title=item_data.title,
+        original_price=item_data.price,
+        original_sell_price=item_data.sell_price,
+        original_description=item_data.description,
+        original_photo=item_data.photo
     )
     await state.set_state(EditItem.waiting_new_title)
-    await call.message.answer(f"Введите новое название товара (текущее: {item_data['title']}):")
+    await call.message.answer(f"Введите новое название товара (текущее: {item_data.title}):")
 
 @dp.message(EditItem.waiting_new_title)
 async def process_new_item_title(message: Message, state: FSMContext):
@@ -1159,9 +1155,7 @@ async def process_new_item_description(message: Message, state: FSMContext):
 @dp.message(EditItem.waiting_new_photo, F.photo)
 async def process_new_item_photo(message: Message, state: FSMContext):
     file_id = message.photo[-1].file_id
-    file = await bot.get_file(file_id)
-    filename = f"photos/{file.file_id}.jpg"
-    await bot.download_file(file.file_path, filename)
+    filename = await store_photo(bot, file_id)
     await state.update_data(new_photo=filename)
     await save_edited_item(message, state)
 
@@ -1180,21 +1174,9 @@ async def save_edited_item(message: Message, state: FSMContext):
     new_description = data['new_description']
     new_photo = data.get('new_photo')
 
-    conn = await get_db_conn()
-    try:
-        if new_photo is not None:
-            await conn.execute(
-                "UPDATE items SET title = $1, price = $2, sell_price = $3, description = $4, photo = $5 WHERE id = $6",
-                new_title, new_price, new_sell_price, new_description, new_photo, item_id
-            )
-        else:
-            await conn.execute(
-                "UPDATE items SET title = $1, price = $2, sell_price = $3, description = $4 WHERE id = $5",
-                new_title, new_price, new_sell_price, new_description, item_id
-            )
-    finally:
-        if conn:
-            await conn.close()
+    async with acquire() as conn:
+        supply_id = await ItemRepo(conn).update(item_id, new_title, new_price, new_sell_price, new_description, new_photo)
+    cache.bump(item_scope(item_id), supply_scope(supply_id))
 
     await message.answer("✅ Товар успешно изменён!")
     await state.clear()
@@ -1206,26 +1188,21 @@ async def admin_add_item_start(call: CallbackQuery, state: FSMContext):
         await call.answer("Доступ запрещён.", show_alert=True)
         return
 
-    conn = await get_db_conn()
-    supplies = []
-    try:
-        supplies = await conn.fetch("SELECT id, name FROM supplies WHERE status = 'active'")
-    finally:
-        if conn:
-            await conn.close()
+    async with acquire() as conn:
+        supplies = await SupplyRepo(conn).list_by_status("active")
 
     if not supplies:
         await call.answer("Нет активных поставок. Сначала создайте новую поставку.")
         return
 
     if len(supplies) == 1:
-        await state.update_data(supply_id=supplies[0]['id'])
+        await state.update_data(supply_id=supplies[0].id)
         await state.set_state(AddItem.waiting_title)
         await call.message.answer("📦 Введите название товара:")
     else:
         buttons = []
         for s in supplies:
-            buttons.append([InlineKeyboardButton(text=s['name'], callback_data=f"select_supply_add_item_{s['id']}")])
+            buttons.append([InlineKeyboardButton(text=s.name, callback_data=f"select_supply_add_item_{s.id}")])
         buttons.append([InlineKeyboardButton(text="❌ Отмена", callback_data="admin_panel")])
         markup = InlineKeyboardMarkup(inline_keyboard=buttons)
         await call.message.answer("Выберите поставку, в которую хотите добавить товар:", reply_markup=markup)
@@ -1274,9 +1251,7 @@ async def add_item_description(message: Message, state: FSMContext):
 @dp.message(AddItem.waiting_photo, F.photo)
 async def add_item_photo(message: Message, state: FSMContext):
     file_id = message.photo[-1].file_id
-    file = await bot.get_file(file_id)
-    filename = f"photos/{file.file_id}.jpg"
-    await bot.download_file(file.file_path, filename)
+    filename = await store_photo(bot, file_id)
     await state.update_data(photo=filename)
 
     data = await state.get_data()
@@ -1287,15 +1262,11 @@ async def add_item_photo(message: Message, state: FSMContext):
         await state.clear()
         return
 
-    conn = await get_db_conn()
-    try:
-        await conn.execute(
-            "INSERT INTO items (supply_id, title, price, sell_price, description, photo) VALUES ($1, $2, $3, $4, $5, $6)",
+    async with acquire() as conn:
+        await ItemRepo(conn).create(
             supply_id, data['title'], data['price'], data['sell_price'], data['description'], filename
         )
-    finally:
-        if conn:
-            await conn.close()
+    cache.bump(supply_scope(supply_id))
 
     await message.answer("✅ Товар успешно добавлен!")
     await state.clear()
@@ -1313,6 +1284,171 @@ async def admin_panel(call: CallbackQuery):
         return
     await call.message.edit_text("⚙️ Админская панель:", reply_markup=get_admin_panel())
 
+@dp.callback_query(F.data == "admin_broadcast")
+async def admin_broadcast_start(call: CallbackQuery, state: FSMContext):
+    if call.from_user.id not in ADMIN_IDS:
+        await call.answer("Доступ запрещён.", show_alert=True)
+        return
+
+    async with acquire() as conn:
+        supplies = await SupplyRepo(conn).list_visible()
+
+    if not supplies:
+        await call.answer("Нет поставок.", show_alert=True)
+        return
+
+    buttons = []
+    for s in supplies:
+        buttons.append([InlineKeyboardButton(text=s.name, callback_data=f"broadcast_supply_{s.id}")])
+    buttons.append([InlineKeyboardButton(text="❌ Отмена", callback_data="admin_panel")])
+    await call.message.edit_text("📣 Вкладчикам какой поставки отправить сообщение?", reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
+
+@dp.callback_query(F.data.startswith("broadcast_supply_"))
+async def admin_broadcast_select_supply(call: CallbackQuery, state: FSMContext):
+    if call.from_user.id not in ADMIN_IDS:
+        await call.answer("Доступ запрещён.", show_alert=True)
+        return
+
+    supply_id = int(call.data.split("_")[2])
+    await state.update_data(broadcast_supply_id=supply_id)
+    await state.set_state(Broadcast.waiting_text)
+    await call.message.answer("📝 Введите текст рассылки:")
+
+@dp.message(Broadcast.waiting_text)
+async def admin_broadcast_send(message: Message, state: FSMContext):
+    admin_id = message.from_user.id
+    if admin_id not in ADMIN_IDS:
+        await state.clear()
+        return
+
+    data = await state.get_data()
+    supply_id = data["broadcast_supply_id"]
+    await state.clear()
+
+    async with acquire() as conn:
+        recipients = await ContributionRepo(conn).contributor_ids(supply_id)
+
+    if not recipients:
+        await message.answer("В этой поставке пока нет вкладчиков.", reply_markup=get_admin_panel())
+        return
+
+    async def report(result):
+        await bot.send_message(
+            admin_id,
+            f"📣 Рассылка завершена\n"
+            f"✅ Доставлено: {result.delivered}\n"
+            f"❌ Не доставлено: {result.failed}"
+        )
+
+    broadcaster.submit(recipients, message.text, on_done=report)
+    await message.answer(f"📣 Рассылка запущена, получателей: {len(recipients)}.", reply_markup=get_admin_panel())
+
+# === ИМПОРТ ТОВАРОВ ИЗ ФАЙЛА ===
+IMPORT_ERRORS_SHOWN = 30
+IMPORT_HELP = (
+    "📄 Отправьте файл с товарами: CSV (разделитель «,» или «;») или JSON.\n"
+    "Колонки: title, price, sell_price, description, photo, status; title, price и sell_price обязательны.\n"
+    "photo — имя файла из архива, status — один из статусов товара.\n"
+    "Таблицу из Excel сохраните как CSV."
+)
+
+@dp.callback_query(F.data == "admin_import_items")
+async def admin_import_items_start(call: CallbackQuery, state: FSMContext):
+    if call.from_user.id not in ADMIN_IDS:
+        await call.answer("Доступ запрещён.", show_alert=True)
+        return
+
+    async with acquire() as conn:
+        supplies = await SupplyRepo(conn).list_by_status("active")
+
+    if not supplies:
+        await call.answer("Нет активных поставок. Сначала создайте новую поставку.")
+        return
+
+    buttons = []
+    for s in supplies:
+        buttons.append([InlineKeyboardButton(text=s.name, callback_data=f"import_supply_{s.id}")])
+    buttons.append([InlineKeyboardButton(text="❌ Отмена", callback_data="admin_panel")])
+    await call.message.edit_text("📥 В какую поставку импортировать товары?", reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
+
+@dp.callback_query(F.data.startswith("import_supply_"))
+async def admin_import_select_supply(call: CallbackQuery, state: FSMContext):
+    if call.from_user.id not in ADMIN_IDS:
+        await call.answer("Доступ запрещён.", show_alert=True)
+        return
+
+    supply_id = int(call.data.split("_")[2])
+    await state.update_data(import_supply_id=supply_id, import_photos={})
+    await state.set_state(ImportItems.waiting_photos)
+    markup = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="⏭ Без фото", callback_data="import_skip_photos")]
+    ])
+    await call.message.answer("🗂 Отправьте ZIP-архив с фотографиями товаров или пропустите этот шаг:", reply_markup=markup)
+
+@dp.message(ImportItems.waiting_photos, F.document)
+async def admin_import_photos(message: Message, state: FSMContext):
+    if not (message.document.file_name or "").lower().endswith(".zip"):
+        await message.answer("Нужен ZIP-архив с фотографиями.")
+        return
+
+    path = await download_document(bot, message.document)
+    try:
+        # Распаковка и хэширование — в потоке, чтобы не держать цикл событий
+        photos, skipped = await asyncio.to_thread(extract_photos, path)
+    except zipfile.BadZipFile:
+        await message.answer("❌ Архив повреждён, отправьте другой.")
+        return
+    finally:
+        os.remove(path)
+
+    await state.update_data(import_photos=photos)
+    await state.set_state(ImportItems.waiting_file)
+    text = f"🖼 Фотографий в архиве: {len(photos)}."
+    if skipped:
+        text += f"\n⚠️ Пропущены, больше {MAX_PHOTO_SIZE // (1024 * 1024)} МБ: " + ", ".join(skipped[:IMPORT_ERRORS_SHOWN])
+        if len(skipped) > IMPORT_ERRORS_SHOWN:
+            text += f" … и ещё {len(skipped) - IMPORT_ERRORS_SHOWN}"
+    await message.answer(f"{text}\n\n{IMPORT_HELP}")
+
+@dp.callback_query(ImportItems.waiting_photos, F.data == "import_skip_photos")
+async def admin_import_skip_photos(call: CallbackQuery, state: FSMContext):
+    await state.set_state(ImportItems.waiting_file)
+    await call.message.answer(IMPORT_HELP)
+
+@dp.message(ImportItems.waiting_file, F.document)
+async def admin_import_file(message: Message, state: FSMContext):
+    if message.from_user.id not in ADMIN_IDS:
+        await state.clear()
+        return
+
+    filename = message.document.file_name or ""
+    if not filename.lower().endswith((".csv", ".json", ".jsonl")):
+        await message.answer("Нужен файл .csv или .json.")
+        return
+
+    data = await state.get_data()
+    supply_id = data["import_supply_id"]
+
+    path = await download_document(bot, message.document)
+    try:
+        rows, errors = await asyncio.to_thread(parse_items, path, filename, data.get("import_photos", {}), STATUSES)
+    finally:
+        os.remove(path)
+
+    imported = 0
+    if rows:
+        imported = await import_items(supply_id, rows)
+        cache.bump(supply_scope(supply_id))
+    await state.clear()
+
+    text = f"📥 Импортировано товаров: {imported}"
+    if errors:
+        text += f"\n❌ Строк с ошибками: {len(errors)}\n"
+        text += "\n".join(f"строка {line}: {error}" if line else error for line, error in errors[:IMPORT_ERRORS_SHOWN])
+        if len(errors) > IMPORT_ERRORS_SHOWN:
+            text += f"\n… и ещё {len(errors) - IMPORT_ERRORS_SHOWN}"
+    await message.answer(text, reply_markup=get_admin_panel())
+
 @dp.callback_query(F.data == "make_contribution")
 async def make_contribution_start(call: CallbackQuery, state: FSMContext):
     await state.clear()
@@ -1336,18 +1472,14 @@ async def make_contribution_start(call: CallbackQuery, state: FSMContext):
     # Уведомление админам
     user = call.from_user
     username = f"@{user.username}" if user.username else f"#{user.id}"
-    for admin_id in ADMIN_IDS:
-        try:
-            await bot.send_message(
-                admin_id,
-                f"🔔 <b>Новый вклад</b>\n"
-                f"Пользователь: {username}\n"
-                f"Нажал «Сделать вклад»\n"
-                f"Ожидает начисления.",
-                parse_mode="HTML"
-            )
-        except Exception as e:
-            print(f"Не удалось отправить админу {admin_id}: {e}")
+    broadcaster.submit(
+        ADMIN_IDS,
+        f"🔔 <b>Новый вклад</b>\n"
+        f"Пользователь: {username}\n"
+        f"Нажал «Сделать вклад»\n"
+        f"Ожидает начисления.",
+        parse_mode="HTML"
+    )
 
 @dp.message(MakeContribution.waiting_bank)
 async def process_user_bank(message: Message, state: FSMContext):
@@ -1387,25 +1519,13 @@ async def confirm_user_contribution(call: CallbackQuery, state: FSMContext):
     bank = data['bank']
     payment_info = data['payment_info']
 
-    conn = await get_db_conn()
-    try:
-        existing_req = await conn.fetchrow(
-            "SELECT id FROM contribution_requests WHERE user_id = $1 AND status = 'pending'",
-            user_id
-        )
+    async with acquire() as conn:
+        requests = RequestRepo(conn)
+        existing_req = await requests.latest_pending_for_user(user_id)
         if existing_req:
-            await conn.execute(
-                "UPDATE contribution_requests SET username = $1, bank = $2, payment_info = $3 WHERE id = $4",
-                username, bank, payment_info, existing_req['id']
-            )
+            await requests.update_details(existing_req.id, username, bank, payment_info)
         else:
-            await conn.execute(
-                "INSERT INTO contribution_requests (user_id, username, bank, payment_info) VALUES ($1, $2, $3, $4)",
-                user_id, username, bank, payment_info
-            )
-    finally:
-        if conn:
-            await conn.close()
+            await requests.create(user_id, username, bank, payment_info)
 
     await state.clear()
     await call.answer("✅ Ваши реквизиты сохранены. Теперь вы можете сделать вклад.", show_alert=True)
@@ -1422,71 +1542,238 @@ async def cancel_user_contribution(call: CallbackQuery, state: FSMContext):
 async def user_start_contribution_edit(call: CallbackQuery, state: FSMContext):
     await make_contribution_start(call, state)
 
+# === ОТЧЁТ ПО ВКЛАДАМ ===
+MESSAGE_LIMIT = 4096
+
+
+def split_message(text, limit=MESSAGE_LIMIT):
+    # Режем по строкам, чтобы не разорвать HTML-тег; строку длиннее лимита — как есть по символам
+    chunks, current = [], ""
+    for line in text.split("\n"):
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        if current and len(current) + 1 + len(line) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    if current or not chunks:
+        chunks.append(current)
+    return chunks
+
+
+def parse_report_cursor(value):
+    amount, user_id = value.split("_")
+    return float(amount), int(user_id)
+
+
+async def render_contribution_report(call, supply_id=None, after=None, before=None):
+    async with acquire() as conn:
+        report = await SummaryRepo(conn).contribution_report(supply_id, REPORT_PAGE_SIZE, after=after, before=before)
+    if report is None:
+        await call.answer("Поставка не найдена." if supply_id else "Нет поставок.", show_alert=True)
+        return None
+
+    supply, totals, page = report.supply, report.totals, report.page
+    lines = [
+        f"📊 <b>Вклады: {escape(supply.name)}</b>" + (" (завершена)" if supply.status == "completed" else ""),
+        f"💰 Всего: {totals.contrib_total:.2f}₽, участников: {report.contributors}",
+        f"👑 Админы: {totals.admin_total:.2f}₽ · 👥 Остальные: {totals.other_total:.2f}₽",
+        "",
+    ]
+    for c in page.items:
+        lines.append(f"  👤 @{escape(c.username or str(c.user_id))}: {c.amount:.2f}₽")
+    if page.items:
+        lines.append(f"\nНа странице: {report.page_total:.2f}₽")
+    else:
+        lines.append("Вкладов пока нет.")
+
+    buttons = []
+    nav = []
+    if page.has_prev and page.items:
+        first = page.items[0]
+        nav.append(InlineKeyboardButton(text="◀️", callback_data=f"crep_{supply.id}_p{first.amount!r}_{first.user_id}"))
+    if page.has_next and page.items:
+        last = page.items[-1]
+        nav.append(InlineKeyboardButton(text="▶️", callback_data=f"crep_{supply.id}_n{last.amount!r}_{last.user_id}"))
+    if nav:
+        buttons.append(nav)
+    nav = []
+    if report.prev_supply_id:
+        nav.append(InlineKeyboardButton(text="⏮ Пред. поставка", callback_data=f"crep_{report.prev_supply_id}"))
+    if report.next_supply_id:
+        nav.append(InlineKeyboardButton(text="След. поставка ⏭", callback_data=f"crep_{report.next_supply_id}"))
+    if nav:
+        buttons.append(nav)
+    buttons.append([InlineKeyboardButton(text="📥 Выгрузить CSV", callback_data=f"export_menu_{supply.id}")])
+    buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_panel")])
+    markup = InlineKeyboardMarkup(inline_keyboard=buttons)
+
+    # Страница, которая влезает в одно сообщение, перерисовывается на месте; длинная уходит
+    # несколькими сообщениями, кнопки — под последним
+    chunks = split_message("\n".join(lines))
+    if len(chunks) == 1:
+        try:
+            await call.message.edit_text(chunks[0], reply_markup=markup, parse_mode="HTML")
+        except TelegramBadRequest:
+            pass
+        return report
+    for chunk in chunks[:-1]:
+        await call.message.answer(chunk, parse_mode="HTML")
+    await call.message.answer(chunks[-1], reply_markup=markup, parse_mode="HTML")
+    return report
+
 @dp.callback_query(F.data == "admin_view_contributions")
 async def admin_view_contributions(call: CallbackQuery):
     if call.from_user.id not in ADMIN_IDS:
         await call.answer("Доступ запрещён.", show_alert=True)
         return
+    await render_contribution_report(call)
 
-    conn = await get_db_conn()
-    contributions = []
-    try:
-        contributions = await conn.fetch("""
-            SELECT c.user_id, c.username, s.name as supply_name, c.amount
-            FROM contributions c
-            JOIN supplies s ON c.supply_id = s.id
-            ORDER BY supply_name, c.amount DESC
-        """)
-    finally:
-        if conn:
-            await conn.close()
-
-    if not contributions:
-        await call.answer("Вкладов пока нет.", show_alert=True)
+@dp.callback_query(F.data.startswith("crep_"))
+async def admin_contribution_report_page(call: CallbackQuery):
+    if call.from_user.id not in ADMIN_IDS:
+        await call.answer("Доступ запрещён.", show_alert=True)
         return
 
-    text = "📊 <b>Все вклады:</b>\n\n"
-    current_supply_name = ""
-    for contrib in contributions:
-        if contrib['supply_name'] != current_supply_name:
-            text += f"\n📦 <b>{contrib['supply_name']}</b>\n"
-            current_supply_name = contrib['supply_name']
-        text += f"  👤 @{contrib['username'] or contrib['user_id']}: {contrib['amount']}₽\n"
+    # crep_{supply_id}, crep_{supply_id}_n{amount}_{user_id}, crep_{supply_id}_p{amount}_{user_id}
+    _, supply_id, *cursor = call.data.split("_", 2)
+    after = before = None
+    if cursor:
+        direction, value = cursor[0][0], cursor[0][1:]
+        if direction == "n":
+            after = parse_report_cursor(value)
+        else:
+            before = parse_report_cursor(value)
+    if await render_contribution_report(call, int(supply_id), after=after, before=before):
+        await call.answer()
+
+@dp.callback_query(F.data.startswith("export_menu_"))
+async def admin_export_menu(call: CallbackQuery):
+    if call.from_user.id not in ADMIN_IDS:
+        await call.answer("Доступ запрещён.", show_alert=True)
+        return
 
+    supply_id = int(call.data.split("_")[2])
     markup = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_panel")]
+        [InlineKeyboardButton(text="👥 Вклады (CSV)", callback_data=f"export_contributions_{supply_id}")],
+        [InlineKeyboardButton(text="📦 Товары (CSV)", callback_data=f"export_items_{supply_id}")],
+        [InlineKeyboardButton(text="💰 Выплаты (CSV)", callback_data=f"export_payouts_{supply_id}")],
+        [InlineKeyboardButton(text="🧾 Журнал движений (CSV)", callback_data=f"export_events_{supply_id}")],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data=f"crep_{supply_id}")]
     ])
+    await call.message.edit_text(f"📦 <b>{await get_supply_name(supply_id)}</b>\n\nЧто выгрузить?", reply_markup=markup, parse_mode="HTML")
 
-    await call.message.answer(text, reply_markup=markup, parse_mode="HTML")
-
-@dp.callback_query(F.data.startswith("reject_req_"))
-async def reject_contribution_request(call: CallbackQuery):
-    req_id = int(call.data.split("_")[2])
+@dp.callback_query(F.data.regexp(r"^export_(contributions|items|payouts|events)_\d+$"))
+async def admin_export(call: CallbackQuery):
+    if call.from_user.id not in ADMIN_IDS:
+        await call.answer("Доступ запрещён.", show_alert=True)
+        return
 
-    conn = await get_db_conn()
-    try:
-        row = await conn.fetchrow("SELECT user_id, username FROM contribution_requests WHERE id = $1", req_id)
-        if not row:
-            await call.answer("Заявка не найдена.")
+    _, kind, supply_id = call.data.split("_")
+    supply_id = int(supply_id)
+    if kind == "payouts":
+        async with acquire() as conn:
+            supply = await SupplyRepo(conn).get(supply_id)
+        if not supply or supply.status != "completed":
+            await call.answer("Выплаты рассчитываются при завершении поставки.", show_alert=True)
             return
-        user_id = row['user_id']
+    await call.answer("⏳ Готовлю файл...")
+    await send_export(bot, call.from_user.id, kind, supply_id, EXPORT_TIMEOUT)
 
-        await conn.execute("UPDATE contribution_requests SET status = 'rejected' WHERE id = $1", req_id)
-    finally:
-        if conn:
-            await conn.close()
+@dp.message(Command("export"))
+async def cmd_export(message: Message):
+    if message.from_user.id not in ADMIN_IDS:
+        return
 
-    try:
-        await bot.send_message(user_id, f"❌ Ваша заявка на вклад была отклонена.")
-    except Exception as e:
-        print(f"Failed to notify user {user_id} about rejected request: {e}")
+    args = (message.text or "").split()[1:]
+    if len(args) != 2 or args[0] not in EXPORTS or not args[1].isdigit():
+        await message.answer(f"Использование: /export {'|'.join(EXPORTS)} <id поставки>")
+        return
+    await send_export(bot, message.chat.id, args[0], int(args[1]), EXPORT_TIMEOUT)
+
+@dp.message(Command("perf"))
+async def show_perf_stats(message: Message):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+
+    lines = ["📈 <b>Объединённые запросы</b> (выполнено / объединено):"]
+    for name, calls, coalesced in single_flight_stats():
+        lines.append(f"• {name}: {calls} / {coalesced}")
+    lines.append(f"\n🗂 Кэш: {len(cache)} записей, попаданий {cache.hits}, промахов {cache.misses}")
+    await message.answer("\n".join(lines), parse_mode="HTML")
+
+@dp.message(Command("reconcile"))
+async def cmd_reconcile(message: Message):
+    if message.from_user.id not in ADMIN_IDS:
+        return
 
-    await call.answer("Заявка отклонена.")
-    await admin_view_requests(call)
+    async with acquire() as conn:
+        rows = await LedgerRepo(conn).reconcile()
+
+    if not rows:
+        await message.answer("✅ Суммы вкладов сходятся с журналом.")
+        return
+    lines = [f"❗️ Расхождений с журналом: {len(rows)}"]
+    for supply_id, user_id, amount, ledger_amount in rows[:30]:
+        lines.append(f"• поставка {supply_id}, пользователь {user_id}: {amount}₽ / по журналу {ledger_amount}₽")
+    await message.answer("\n".join(lines))
 
 async def main():
+    if RUN_MODE == "supervisor":
+        # Сам супервизор базу не трогает: он только раздаёт апдейты воркерам
+        await run_supervisor(
+            bot, dp.resolve_used_update_types(), [sys.executable, os.path.abspath(__file__)],
+            WEBAPP_HOST, WEBAPP_PORT, WEBHOOK_PATH,
+            url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+            workers=SUPERVISOR_WORKERS,
+            base_port=SUPERVISOR_BASE_PORT,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+        return
+
     await init_db()
-    await dp.start_polling(bot)
+    await init_pool(
+        DATABASE_URL,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        command_timeout=DB_COMMAND_TIMEOUT,
+        acquire_timeout=DB_ACQUIRE_TIMEOUT,
+        max_inactive_lifetime=DB_MAX_INACTIVE_LIFETIME,
+        statements=HOT_STATEMENTS,
+    )
+    background = [
+        asyncio.create_task(run_photo_gc(PHOTO_GC_INTERVAL, PHOTO_GC_GRACE)),
+        asyncio.create_task(top_contributors.run()),
+        asyncio.create_task(outbox.run()),
+        asyncio.create_task(rollup.run()),
+    ]
+    background.append(asyncio.create_task(CacheInvalidationListener(DATABASE_URL).run()))
+    if isinstance(storage, PostgresStorage):
+        background.append(asyncio.create_task(storage.run_cleanup(FSM_CLEANUP_INTERVAL)))
+    try:
+        if RUN_MODE == "webhook":
+            await run_webhook(
+                dp, bot, WEBAPP_HOST, WEBAPP_PORT, WEBHOOK_PATH,
+                url=WEBHOOK_URL,
+                secret_token=WEBHOOK_SECRET,
+                workers=WEBHOOK_WORKERS,
+                queue_size=WEBHOOK_QUEUE_SIZE,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                scope=UPDATE_LOCK_SCOPE,
+            )
+        else:
+            await dp.start_polling(bot)
+    finally:
+        for task in background:
+            task.cancel()
+        await broadcaster.close()
+        await close_pool()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest, TelegramAPIError
+
+
+# === РАССЫЛКИ ===
+class BroadcastResult:
+    __slots__ = ("delivered", "failed")
+
+    def __init__(self, delivered=0, failed=0):
+        self.delivered = delivered
+        self.failed = failed
+
+
+class _RateLimiter:
+    # Не больше rate отправок в секунду на весь процесс
+    __slots__ = ("interval", "next_at", "lock")
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.next_at = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self.lock:
+            now = time.monotonic()
+            delay = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class Broadcaster:
+    def __init__(self, bot, rate=30, concurrency=10, per_chat_interval=1.0, max_retries=3):
+        self.bot = bot
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self._limiter = _RateLimiter(rate)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._chat_next_at = {}
+        self._tasks = set()
+
+    async def _wait_for_chat(self, chat_id):
+        now = time.monotonic()
+        next_at = self._chat_next_at.get(chat_id, 0.0)
+        self._chat_next_at[chat_id] = max(now, next_at) + self.per_chat_interval
+        if next_at > now:
+            await asyncio.sleep(next_at - now)
+
+    def _forget_idle_chats(self):
+        now = time.monotonic()
+        for chat_id in [c for c, t in self._chat_next_at.items() if t < now]:
+            del self._chat_next_at[chat_id]
+
+    async def _deliver(self, chat_id, text, kwargs):
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self._wait_for_chat(chat_id)
+                await self._limiter.wait()
+                try:
+                    await self.bot.send_message(chat_id, text, **kwargs)
+                    return True
+                except TelegramRetryAfter as e:
+                    await asyncio.sleep(e.retry_after)
+                except (TelegramForbiddenError, TelegramBadRequest) as e:
+                    print(f"Broadcast to {chat_id} rejected: {e}")
+                    return False
+                except TelegramAPIError as e:
+                    print(f"Broadcast to {chat_id} failed (attempt {attempt + 1}): {e}")
+                    await asyncio.sleep(2 ** attempt)
+            return False
+
+    async def send(self, chat_ids, text, **kwargs):
+        results = await asyncio.gather(*(self._deliver(chat_id, text, kwargs) for chat_id in dict.fromkeys(chat_ids)))
+        self._forget_idle_chats()
+        delivered = sum(results)
+        return BroadcastResult(delivered, len(results) - delivered)
+
+    def submit(self, chat_ids, text, on_done=None, **kwargs):
+        # Отправка идёт в фоне, обработчик не ждёт Telegram
+        async def run():
+            result = await self.send(chat_ids, text, **kwargs)
+            if on_done is not None:
+                await on_done(result)
+            return result
+
+        task = asyncio.create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Broadcast failed: {task.exception()}")
+
+    async def close(self, timeout=10):
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=timeout)
+        for task in list(self._tasks):
+            task.cancel()
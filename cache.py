@@ -0,0 +1,124 @@
+import functools
+import time
+from collections import OrderedDict
+
+from singleflight import SingleFlight, groups
+
+_MISS = object()
+
+# === ОБЛАСТИ ВЕРСИЙ ===
+# Каждая запись кэша помнит, от каких областей она зависит. Запись на пути изменения
+# поднимает версию области, и все зависящие от неё записи становятся невалидными
+SUPPLIES = "supplies"
+
+
+def supply_scope(supply_id):
+    return ("supply", supply_id)
+
+
+def item_scope(item_id):
+    return ("item", item_id)
+
+
+def photo_scope(photo):
+    return ("photo", photo)
+
+
+# === КЭШ ===
+class VersionedCache:
+    def __init__(self, maxsize=5000, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.seq = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._versions = {}
+        # Результаты запросов, начатых раньше floor, не кэшируются: версии, которые могли
+        # их опровергнуть, уже забыты (clear или чистка старых версий)
+        self._floor = 0
+        self._prune_at = 0
+
+    def _stale(self, scopes, seq):
+        return seq < self._floor or any(self._versions.get(scope, 0) > seq for scope in scopes)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, scopes, seq, expires_at = entry
+            if expires_at > time.monotonic() and not self._stale(scopes, seq):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+        self.misses += 1
+        return _MISS
+
+    def put(self, key, value, scopes, seq):
+        # seq снят до запроса в базу: если версия успела подняться, результат уже устарел
+        if self._stale(scopes, seq):
+            return
+        self._entries[key] = (value, tuple(scopes), seq, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def bump(self, *scopes):
+        self.seq += 1
+        for scope in scopes:
+            self._versions[scope] = self.seq
+        if len(self._versions) > self._prune_at:
+            self._prune()
+
+    def _prune(self):
+        # Версия не старше самой старой живой записи уже ничего не делает устаревшим, кроме
+        # запросов в полёте — их отсекает floor. Порог растёт вдвое, так что чистка в среднем O(1) на bump
+        now = time.monotonic()
+        for key in [key for key, entry in self._entries.items() if entry[3] <= now]:
+            del self._entries[key]
+        oldest = min((entry[2] for entry in self._entries.values()), default=self.seq)
+        pruned = [scope for scope, version in self._versions.items() if version <= oldest]
+        for scope in pruned:
+            self._floor = max(self._floor, self._versions.pop(scope))
+        self._prune_at = max(2 * self.maxsize, 2 * len(self._versions))
+
+    def clear(self):
+        self.seq += 1
+        self._floor = self.seq
+        self._entries.clear()
+        self._versions.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+cache = VersionedCache()
+
+
+def init_cache(maxsize, ttl):
+    cache.maxsize = maxsize
+    cache.ttl = ttl
+
+
+def cached(scopes):
+    # scopes(value, *args, **kwargs) -> области, от которых зависит результат.
+    # Промахи по одному ключу объединяются через single-flight
+    def decorate(fn):
+        name = fn.__name__
+        group = groups[name] = SingleFlight(name)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            key = (name, args, tuple(sorted(kwargs.items())))
+            value = cache.get(key)
+            if value is not _MISS:
+                return value
+            seq = cache.seq
+            # seq входит в ключ single-flight: запрос, начатый до изменения, не достанется пришедшим после
+            value = await group.do((seq, key), fn, *args, **kwargs)
+            cache.put(key, value, scopes(value, *args, **kwargs), seq)
+            return value
+
+        return wrapper
+
+    return decorate
@@ -0,0 +1,51 @@
+import re
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+# === ПУЛ СОЕДИНЕНИЙ ===
+pool = None
+_acquire_timeout = None
+_hot_statements = ()
+
+
+async def _init_connection(conn):
+    # Прогреваем кэш подготовленных выражений asyncpg: запрос с NULL-параметрами
+    # готовится на сервере и ничего не находит. Дальше conn.fetch() с тем же текстом
+    # переиспользует выражение, пока живёт соединение.
+    for query in _hot_statements:
+        params = [int(n) for n in re.findall(r"\$(\d+)", query)]
+        await conn.fetch(query, *[None] * max(params, default=0))
+
+
+async def init_pool(dsn, min_size=2, max_size=10, command_timeout=10.0,
+                    acquire_timeout=5.0, max_inactive_lifetime=300.0, statements=()):
+    global pool, _acquire_timeout, _hot_statements
+    if pool is not None:
+        return pool
+    _hot_statements = tuple(statements)
+    pool = await asyncpg.create_pool(
+        dsn,
+        min_size=min_size,
+        max_size=max_size,
+        command_timeout=command_timeout,
+        max_inactive_connection_lifetime=max_inactive_lifetime,
+        init=_init_connection,
+    )
+    _acquire_timeout = acquire_timeout
+    return pool
+
+
+async def close_pool():
+    global pool
+    if pool is not None:
+        await pool.close()
+        pool = None
+
+
+@asynccontextmanager
+async def acquire():
+    if pool is None:
+        raise RuntimeError("Database pool is not initialized")
+    async with pool.acquire(timeout=_acquire_timeout) as conn:
+        yield conn
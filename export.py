@@ -0,0 +1,41 @@
+import gzip
+import os
+import tempfile
+from datetime import datetime
+
+from aiogram.types import FSInputFile
+
+from db import acquire
+from repo import ExportRepo
+
+EXPORTS = {
+    "contributions": ExportRepo.CONTRIBUTIONS,
+    "items": ExportRepo.ITEMS,
+    "payouts": ExportRepo.PAYOUTS,
+    "events": ExportRepo.EVENTS,
+}
+
+
+# === ВЫГРУЗКА CSV ===
+async def export_csv(kind, supply_id, timeout=None):
+    # Файл пишется на диск сжатым по мере прихода строк из COPY: память не зависит от размера таблицы.
+    # asyncpg сам пишет в файловый объект в пуле потоков, так что сжатие не держит цикл событий
+    fd, path = tempfile.mkstemp(prefix=f"export-{kind}-", suffix=".csv.gz")
+    os.close(fd)
+    try:
+        with gzip.open(path, "wb") as f:
+            async with acquire() as conn:
+                await ExportRepo(conn).copy_csv(EXPORTS[kind], supply_id, f, timeout=timeout)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+async def send_export(bot, chat_id, kind, supply_id, timeout=None):
+    path = await export_csv(kind, supply_id, timeout)
+    filename = f"{kind}-supply{supply_id}-{datetime.now():%Y%m%d-%H%M}.csv.gz"
+    try:
+        await bot.send_document(chat_id, FSInputFile(path, filename=filename))
+    finally:
+        os.remove(path)
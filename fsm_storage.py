@@ -0,0 +1,113 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+
+from db import acquire
+from repo import FsmRepo
+
+
+# === ХРАНИЛИЩЕ СОСТОЯНИЙ FSM ===
+class _Entry:
+    __slots__ = ("state", "data", "expires_at", "version", "cached_at")
+
+    def __init__(self, state, data, expires_at, version=None):
+        self.state = state
+        self.data = data
+        self.expires_at = expires_at
+        self.version = version
+        self.cached_at = time.monotonic()
+
+    def expired(self):
+        return self.expires_at is not None and self.expires_at <= time.time()
+
+
+class PostgresStorage(BaseStorage):
+    # Состояния лежат в Postgres, перед ним — LRU в памяти процесса, куда пишем одновременно с базой.
+    # Каждое чтение сверяет версию копии с базой: следующий шаг сценария мог прийти в другой процесс.
+    # Совпала версия — состояние и данные по сети не идут. cache_ttl > 0 позволяет верить копии без
+    # сверки — только когда апдейты одного пользователя всегда приходят в один процесс
+    def __init__(self, cache_size=10000, cache_ttl=0.0, default_ttl=86400.0, state_ttls=None):
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.default_ttl = default_ttl
+        self.state_ttls = dict(state_ttls or {})
+        self.key_builder = DefaultKeyBuilder(with_destiny=True)
+        self._cache = OrderedDict()
+
+    def _ttl(self, state):
+        return self.state_ttls.get(state, self.default_ttl)
+
+    def _remember(self, key, entry):
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return entry
+
+    async def _entry(self, key):
+        entry = self._cache.get(key)
+        if entry is not None and time.monotonic() - entry.cached_at < self.cache_ttl:
+            self._cache.move_to_end(key)
+        else:
+            async with acquire() as conn:
+                row = await FsmRepo(conn).get(key, entry.version if entry is not None else None)
+            if row is None:
+                entry = self._remember(key, _Entry(None, {}, None))
+            elif entry is not None and row[0] == entry.version:
+                entry.expires_at = row[3]
+                entry.cached_at = time.monotonic()
+                self._remember(key, entry)
+            else:
+                entry = self._remember(key, _Entry(row[1], json.loads(row[2]), row[3], row[0]))
+        if entry.expired():
+            entry = self._remember(key, _Entry(None, {}, None))
+        return entry
+
+    async def _write(self, key, state, data):
+        if state is None and not data:
+            async with acquire() as conn:
+                await FsmRepo(conn).delete(key)
+            self._remember(key, _Entry(None, {}, None))
+            return
+
+        ttl = self._ttl(state)
+        async with acquire() as conn:
+            version = await FsmRepo(conn).put(
+                key, state, json.dumps(data, ensure_ascii=False), float(ttl) if ttl is not None else None
+            )
+        self._remember(key, _Entry(state, data, time.time() + ttl if ttl is not None else None, version))
+
+    async def set_state(self, key, state=None):
+        state = state.state if isinstance(state, State) else state
+        key = self.key_builder.build(key)
+        await self._write(key, state, (await self._entry(key)).data)
+
+    async def get_state(self, key):
+        return (await self._entry(self.key_builder.build(key))).state
+
+    async def set_data(self, key, data):
+        key = self.key_builder.build(key)
+        await self._write(key, (await self._entry(key)).state, dict(data))
+
+    async def get_data(self, key):
+        return dict((await self._entry(self.key_builder.build(key))).data)
+
+    async def purge_expired(self):
+        async with acquire() as conn:
+            await FsmRepo(conn).purge_expired()
+
+    async def run_cleanup(self, interval):
+        # Брошенные сценарии удаляются из базы, даже если пользователь больше не пишет боту
+        while True:
+            try:
+                await self.purge_expired()
+            except Exception as e:
+                print(f"FSM cleanup failed: {e}")
+            await asyncio.sleep(interval)
+
+    async def close(self):
+        self._cache.clear()
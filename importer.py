@@ -0,0 +1,209 @@
+import codecs
+import csv
+import json
+import os
+import tempfile
+import zipfile
+
+from db import acquire
+from photos import keep_photo, temp_photo
+from repo import ItemRepo
+
+PHOTO_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+# Больше Telegram всё равно не примет как фото
+MAX_PHOTO_SIZE = 10 * 1024 * 1024
+_CHUNK_SIZE = 65536
+
+
+# === ИМПОРТ ТОВАРОВ ===
+def _number(value):
+    # Таблицы из Excel приходят с пробелами в разрядах и запятой вместо точки
+    return float(str(value).replace("\u00a0", "").replace(" ", "").replace(",", "."))
+
+
+def _encoding(path):
+    # Excel в русской локали сохраняет CSV в cp1251. Файл проверяется на UTF-8 потоково, целиком
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    with open(path, "rb") as f:
+        try:
+            for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+                decoder.decode(chunk)
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            return "cp1251"
+    return "utf-8-sig"
+
+
+def _csv_rows(path):
+    with open(path, encoding=_encoding(path), newline="") as f:
+        header = f.readline()
+        delimiter = ";" if header.count(";") > header.count(",") else ","
+        f.seek(0)
+        # start=2: первая строка файла — заголовок
+        for line, row in enumerate(csv.DictReader(f, delimiter=delimiter), start=2):
+            yield line, row
+
+
+def _json_array(f):
+    # Элементы массива разбираются по одному: в памяти только текущий объект и хвост буфера.
+    # expect — что должно идти дальше: «[», первый элемент или «]», «,» или «]», очередной элемент
+    decoder = json.JSONDecoder()
+    buffer, eof, expect, index = "", False, "[", 0
+    while True:
+        buffer = buffer.lstrip()
+        if not buffer:
+            if eof:
+                raise json.JSONDecodeError("массив не закрыт", buffer, 0)
+            chunk = f.read(_CHUNK_SIZE)
+            buffer, eof = chunk, not chunk
+            continue
+        if expect == "[":
+            if buffer[0] != "[":
+                raise json.JSONDecodeError("ожидался «[»", buffer, 0)
+            buffer, expect = buffer[1:], "first"
+        elif buffer[0] == "]" and expect in ("first", ","):
+            return
+        elif expect == ",":
+            if buffer[0] != ",":
+                raise json.JSONDecodeError("ожидалась «,» или «]»", buffer, 0)
+            buffer, expect = buffer[1:], "value"
+        else:
+            try:
+                value, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                end = None
+            # Элемент мог оборваться на границе куска (а число у самого края — ещё и разобраться не целиком):
+            # дочитываем и разбираем заново
+            if end is None or (end == len(buffer) and not eof):
+                chunk = f.read(_CHUNK_SIZE)
+                buffer, eof = buffer + chunk, not chunk
+                continue
+            index += 1
+            yield index, value
+            buffer, expect = buffer[end:], ","
+
+
+def _json_rows(path):
+    with open(path, encoding=_encoding(path)) as f:
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        if first == "[":
+            yield from _json_array(f)
+        else:
+            # JSON Lines: по объекту на строку, читается построчно
+            for line, text in enumerate(f, start=1):
+                if text.strip():
+                    yield line, json.loads(text)
+
+
+def read_rows(path, filename):
+    if filename.lower().endswith((".json", ".jsonl")):
+        return _json_rows(path)
+    return _csv_rows(path)
+
+
+def validate_row(row, photos, statuses):
+    if not isinstance(row, dict):
+        raise ValueError("строка должна быть объектом с полями")
+    row = {str(k).strip().lower(): v for k, v in row.items() if k is not None}
+
+    title = str(row.get("title") or "").strip()
+    if not title:
+        raise ValueError("нет названия")
+    # Без цены продажи прибыль товара молча стала бы нулевой
+    if str(row.get("sell_price") or "").strip() == "":
+        raise ValueError("нет цены продажи (sell_price)")
+    try:
+        price = _number(row.get("price"))
+        sell_price = _number(row.get("sell_price"))
+    except (TypeError, ValueError):
+        raise ValueError("цена должна быть числом")
+    if price <= 0 or sell_price <= 0:
+        raise ValueError("цена должна быть больше нуля")
+
+    photo = None
+    photo_name = str(row.get("photo") or "").strip()
+    if photo_name:
+        photo = photos.get(os.path.basename(photo_name).lower())
+        if photo is None:
+            raise ValueError(f"фото {photo_name} нет в архиве")
+
+    status = str(row.get("status") or "").strip() or statuses[0]
+    if status not in statuses:
+        raise ValueError(f"неизвестный статус {status}")
+
+    return title, price, sell_price, str(row.get("description") or "").strip() or None, photo, status
+
+
+def parse_items(path, filename, photos, statuses):
+    # Один проход по файлу: годные строки идут в вставку, ошибки копятся с номером строки
+    rows, errors = [], []
+    try:
+        for line, row in read_rows(path, filename):
+            try:
+                rows.append(validate_row(row, photos, statuses))
+            except ValueError as e:
+                errors.append((line, str(e)))
+    except UnicodeDecodeError:
+        errors.append((0, "файл не читается: сохраните его в кодировке UTF-8"))
+    except (json.JSONDecodeError, csv.Error) as e:
+        errors.append((0, f"файл не читается: {e}"))
+    return rows, errors
+
+
+def _copy_limited(src, dst, limit):
+    # Размер из заголовка архива может врать, поэтому считаем и реально распакованные байты
+    copied = 0
+    for chunk in iter(lambda: src.read(_CHUNK_SIZE), b""):
+        copied += len(chunk)
+        if copied > limit:
+            return False
+        dst.write(chunk)
+    return True
+
+
+def extract_photos(zip_path, max_size=MAX_PHOTO_SIZE):
+    # Фото из архива кладутся так же, как загруженные через бота. Файлы больше max_size пропускаются:
+    # -> ({имя: путь}, [пропущенные имена])
+    photos, skipped = {}, []
+    with zipfile.ZipFile(zip_path) as archive:
+        for member in archive.infolist():
+            name = os.path.basename(member.filename)
+            if member.is_dir() or name.startswith(".") or not name.lower().endswith(PHOTO_EXTENSIONS):
+                continue
+            if member.file_size > max_size:
+                skipped.append(name)
+                continue
+            with temp_photo() as tmp_path:
+                with archive.open(member) as src, open(tmp_path, "wb") as dst:
+                    copied = _copy_limited(src, dst, max_size)
+                if not copied:
+                    skipped.append(name)
+                    continue
+                photos[name.lower()] = keep_photo(tmp_path)
+    return photos, skipped
+
+
+async def download_document(bot, document):
+    suffix = os.path.splitext(document.file_name or "")[1]
+    fd, path = tempfile.mkstemp(prefix="import-", suffix=suffix)
+    os.close(fd)
+    try:
+        file = await bot.get_file(document.file_id)
+        await bot.download_file(file.file_path, path, chunk_size=_CHUNK_SIZE)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+async def import_items(supply_id, rows):
+    # Все строки одним COPY в одной транзакции; триггеры итогов и сброса кэша срабатывают как на INSERT
+    async with acquire() as conn:
+        async with conn.transaction():
+            await ItemRepo(conn).copy_many(supply_id, rows)
+    return len(rows)
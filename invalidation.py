@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+import asyncpg
+
+from cache import cache, SUPPLIES, supply_scope, item_scope, photo_scope
+
+CHANNEL = "cache_invalidate"
+
+
+# === СБРОС КЭША ПО УВЕДОМЛЕНИЯМ ИЗ БАЗЫ ===
+def _scope(event):
+    kind, key = event["scope"], event.get("id")
+    if kind == "supplies":
+        return SUPPLIES
+    if kind == "supply":
+        return supply_scope(int(key))
+    if kind == "item":
+        return item_scope(int(key))
+    if kind == "photo":
+        return photo_scope(key)
+    return None
+
+
+class CacheInvalidationListener:
+    # Триггеры на supplies, items и photo_file_ids шлют NOTIFY при коммите; здесь отдельное
+    # соединение вне пула слушает канал и поднимает версии тех же областей в локальном кэше
+    def __init__(self, dsn, ping_interval=30.0, reconnect_delay=1.0, max_reconnect_delay=30.0):
+        self.dsn = dsn
+        self.ping_interval = ping_interval
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.received = 0
+
+    def _on_notify(self, conn, pid, channel, payload):
+        self.received += 1
+        try:
+            scope = _scope(json.loads(payload))
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Bad cache invalidation event {payload!r}: {e}")
+            cache.clear()
+            return
+        if scope is not None:
+            cache.bump(scope)
+
+    async def _listen(self):
+        conn = await asyncpg.connect(self.dsn)
+        lost = asyncio.Event()
+        conn.add_termination_listener(lambda c: lost.set())
+        try:
+            await conn.add_listener(CHANNEL, self._on_notify)
+            # Пока соединения не было, события могли потеряться — начинаем с пустого кэша
+            cache.clear()
+            while not lost.is_set():
+                try:
+                    await asyncio.wait_for(lost.wait(), self.ping_interval)
+                except asyncio.TimeoutError:
+                    # Полуоткрытое соединение termination listener не заметит, пинг — заметит
+                    await conn.execute("SELECT 1", timeout=5)
+        finally:
+            if not conn.is_closed():
+                conn.terminate()
+
+    async def run(self):
+        delay = self.reconnect_delay
+        while True:
+            try:
+                await self._listen()
+                delay = self.reconnect_delay
+                print("Cache invalidation listener lost its connection, reconnecting")
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                print(f"Cache invalidation listener failed: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
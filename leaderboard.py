@@ -0,0 +1,40 @@
+import asyncio
+import time
+
+from db import acquire
+from repo import LeaderboardRepo
+
+
+# === ТОП ВКЛАДЧИКОВ ===
+class TopContributors:
+    __slots__ = ("size", "max_age", "rows", "updated_at", "_lock")
+
+    def __init__(self, size, max_age):
+        self.size = size
+        self.max_age = max_age
+        self.rows = []
+        self.updated_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def refresh(self):
+        async with acquire() as conn:
+            rows = await LeaderboardRepo(conn).top(self.size)
+        self.rows = rows
+        self.updated_at = time.monotonic()
+        return rows
+
+    async def get(self):
+        if time.monotonic() - self.updated_at < self.max_age:
+            return self.rows
+        async with self._lock:
+            if time.monotonic() - self.updated_at < self.max_age:
+                return self.rows
+            return await self.refresh()
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Leaderboard refresh failed: {e}")
+            await asyncio.sleep(self.max_age)
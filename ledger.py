@@ -0,0 +1,32 @@
+import asyncio
+
+from db import acquire
+from repo import LedgerRepo
+
+
+# === СВЁРТКА ЖУРНАЛА ВКЛАДОВ ===
+class ContributionRollup:
+    # Подтверждения только добавляют события в журнал; суммы в contributions догоняются здесь,
+    # одним UPDATE на пару пользователь–поставка за проход, сколько бы событий ни пришло
+    def __init__(self, interval=5.0):
+        self.interval = interval
+        self._wakeup = asyncio.Event()
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def rollup(self):
+        async with acquire() as conn:
+            return await LedgerRepo(conn).rollup()
+
+    async def run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.rollup()
+            except Exception as e:
+                print(f"Contribution rollup failed: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,49 @@
+import asyncio
+
+from aiogram import BaseMiddleware
+
+
+# === ПОСЛЕДОВАТЕЛЬНАЯ ОБРАБОТКА АПДЕЙТОВ ОДНОГО ПОЛЬЗОВАТЕЛЯ ===
+class _KeyLock:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class UpdateLockMiddleware(BaseMiddleware):
+    # Апдейты одного пользователя (или чата) идут по очереди, разные пользователи — параллельно.
+    # Запись в таблице живёт, пока кто-то держит или ждёт замок, поэтому таблица не растёт.
+    # Ждут здесь задачи polling, по одной на апдейт. В режиме вебхука порядок держат очереди
+    # QueuedRequestHandler ещё до воркера, и замок всегда свободен
+    def __init__(self, scope="user"):
+        self.scope = scope
+        self._locks = {}
+
+    def _key(self, data):
+        if self.scope == "chat":
+            chat = data.get("event_chat")
+            return chat.id if chat else None
+        user = data.get("event_from_user")
+        return user.id if user else None
+
+    async def __call__(self, handler, event, data):
+        key = self._key(data)
+        if key is None:
+            return await handler(event, data)
+
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = _KeyLock()
+        entry.users += 1
+        try:
+            async with entry.lock:
+                return await handler(event, data)
+        finally:
+            entry.users -= 1
+            if entry.users == 0:
+                del self._locks[key]
+
+    def __len__(self):
+        return len(self._locks)
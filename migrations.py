@@ -0,0 +1,604 @@
+import asyncpg
+
+# === МИГРАЦИИ ===
+# Номера идут подряд с 1. Применённые миграции не меняются: новое — только новой записью в конце.
+# Первые миграции написаны через IF NOT EXISTS, потому что базы, созданные старым init_db, уже содержат эти таблицы
+MIGRATIONS = (
+    (1, "baseline", (
+        """
+            CREATE TABLE IF NOT EXISTS supplies (
+                id BIGSERIAL PRIMARY KEY,
+                name TEXT NOT NULL,
+                status TEXT DEFAULT 'active'
+            )
+        """,
+        """
+            CREATE TABLE IF NOT EXISTS items (
+                id BIGSERIAL PRIMARY KEY,
+                supply_id INTEGER,
+                title TEXT,
+                price REAL,
+                sell_price REAL,
+                description TEXT,
+                photo TEXT,
+                is_sold BOOLEAN DEFAULT FALSE,
+                status TEXT DEFAULT '🛒 Выкуплен',
+                FOREIGN KEY(supply_id) REFERENCES supplies(id) ON DELETE CASCADE
+            )
+        """,
+        """
+            CREATE TABLE IF NOT EXISTS contributions (
+                user_id BIGINT,
+                supply_id INTEGER,
+                amount REAL,
+                username TEXT,
+                PRIMARY KEY (user_id, supply_id)
+            )
+        """,
+        """
+            CREATE TABLE IF NOT EXISTS contribution_requests (
+                id BIGSERIAL PRIMARY KEY,
+                user_id BIGINT,
+                username TEXT,
+                bank TEXT,
+                payment_info TEXT,
+                status TEXT DEFAULT 'pending'
+            )
+        """,
+        """
+            CREATE TABLE IF NOT EXISTS photo_file_ids (
+                photo TEXT PRIMARY KEY,
+                file_id TEXT NOT NULL
+            )
+        """,
+        "ALTER TABLE items ADD COLUMN IF NOT EXISTS status TEXT DEFAULT '🛒 Выкуплен'",
+    )),
+    # Итоги по поставкам (поддерживаются триггерами)
+    (2, "supply_totals", (
+        """
+            CREATE TABLE IF NOT EXISTS admins (
+                user_id BIGINT PRIMARY KEY
+            )
+        """,
+        """
+            CREATE TABLE IF NOT EXISTS supply_totals (
+                supply_id BIGINT PRIMARY KEY REFERENCES supplies(id) ON DELETE CASCADE,
+                contrib_total DOUBLE PRECISION NOT NULL DEFAULT 0,
+                admin_total DOUBLE PRECISION NOT NULL DEFAULT 0,
+                other_total DOUBLE PRECISION NOT NULL DEFAULT 0,
+                admin_count INTEGER NOT NULL DEFAULT 0,
+                other_count INTEGER NOT NULL DEFAULT 0,
+                item_count INTEGER NOT NULL DEFAULT 0,
+                cost_total DOUBLE PRECISION NOT NULL DEFAULT 0,
+                revenue_total DOUBLE PRECISION NOT NULL DEFAULT 0
+            )
+        """,
+        """
+            CREATE OR REPLACE FUNCTION supply_totals_add(
+                p_supply_id BIGINT,
+                p_user_id BIGINT,
+                p_amount DOUBLE PRECISION,
+                p_contributors INTEGER,
+                p_items INTEGER,
+                p_cost DOUBLE PRECISION,
+                p_revenue DOUBLE PRECISION
+            ) RETURNS void AS $$
+            DECLARE
+                is_admin BOOLEAN := p_user_id IS NOT NULL AND EXISTS (SELECT 1 FROM admins WHERE user_id = p_user_id);
+            BEGIN
+                IF p_supply_id IS NULL OR NOT EXISTS (SELECT 1 FROM supplies WHERE id = p_supply_id) THEN
+                    RETURN;
+                END IF;
+                INSERT INTO supply_totals AS t (
+                    supply_id, contrib_total, admin_total, other_total, admin_count, other_count,
+                    item_count, cost_total, revenue_total
+                ) VALUES (
+                    p_supply_id,
+                    p_amount,
+                    CASE WHEN is_admin THEN p_amount ELSE 0 END,
+                    CASE WHEN is_admin THEN 0 ELSE p_amount END,
+                    CASE WHEN is_admin THEN p_contributors ELSE 0 END,
+                    CASE WHEN is_admin THEN 0 ELSE p_contributors END,
+                    p_items, p_cost, p_revenue
+                )
+                ON CONFLICT (supply_id) DO UPDATE SET
+                    contrib_total = t.contrib_total + EXCLUDED.contrib_total,
+                    admin_total = t.admin_total + EXCLUDED.admin_total,
+                    other_total = t.other_total + EXCLUDED.other_total,
+                    admin_count = t.admin_count + EXCLUDED.admin_count,
+                    other_count = t.other_count + EXCLUDED.other_count,
+                    item_count = t.item_count + EXCLUDED.item_count,
+                    cost_total = t.cost_total + EXCLUDED.cost_total,
+                    revenue_total = t.revenue_total + EXCLUDED.revenue_total;
+            END
+            $$ LANGUAGE plpgsql
+        """,
+        """
+            CREATE OR REPLACE FUNCTION contributions_totals_trigger() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    PERFORM supply_totals_add(OLD.supply_id, OLD.user_id, -COALESCE(OLD.amount, 0), -1, 0, 0, 0);
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    PERFORM supply_totals_add(NEW.supply_id, NEW.user_id, COALESCE(NEW.amount, 0), 1, 0, 0, 0);
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+        """,
+        """
+            CREATE OR REPLACE FUNCTION items_totals_trigger() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    PERFORM supply_totals_add(
+                        OLD.supply_id, NULL, 0, 0, -1, -COALESCE(OLD.price, 0),
+                        CASE WHEN OLD.is_sold THEN -COALESCE(OLD.sell_price, 0) ELSE 0 END
+                    );
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    PERFORM supply_totals_add(
+                        NEW.supply_id, NULL, 0, 0, 1, COALESCE(NEW.price, 0),
+                        CASE WHEN NEW.is_sold THEN COALESCE(NEW.sell_price, 0) ELSE 0 END
+                    );
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+        """,
+        """
+            CREATE OR REPLACE FUNCTION supply_totals_rebuild() RETURNS void AS $$
+            BEGIN
+                DELETE FROM supply_totals;
+                INSERT INTO supply_totals (
+                    supply_id, contrib_total, admin_total, other_total, admin_count, other_count,
+                    item_count, cost_total, revenue_total
+                )
+                SELECT s.id,
+                       COALESCE(c.contrib_total, 0), COALESCE(c.admin_total, 0), COALESCE(c.other_total, 0),
+                       COALESCE(c.admin_count, 0), COALESCE(c.other_count, 0),
+                       COALESCE(i.item_count, 0), COALESCE(i.cost_total, 0), COALESCE(i.revenue_total, 0)
+                FROM supplies s
+                LEFT JOIN (
+                    SELECT supply_id,
+                           SUM(COALESCE(amount, 0)) AS contrib_total,
+                           SUM(COALESCE(amount, 0)) FILTER (WHERE a.user_id IS NOT NULL) AS admin_total,
+                           SUM(COALESCE(amount, 0)) FILTER (WHERE a.user_id IS NULL) AS other_total,
+                           COUNT(*) FILTER (WHERE a.user_id IS NOT NULL) AS admin_count,
+                           COUNT(*) FILTER (WHERE a.user_id IS NULL) AS other_count
+                    FROM contributions
+                    LEFT JOIN admins a USING (user_id)
+                    GROUP BY supply_id
+                ) c ON c.supply_id = s.id
+                LEFT JOIN (
+                    SELECT supply_id,
+                           COUNT(*) AS item_count,
+                           SUM(COALESCE(price, 0)) AS cost_total,
+                           SUM(COALESCE(sell_price, 0)) FILTER (WHERE is_sold) AS revenue_total
+                    FROM items
+                    GROUP BY supply_id
+                ) i ON i.supply_id = s.id;
+            END
+            $$ LANGUAGE plpgsql
+        """,
+        """
+            DROP TRIGGER IF EXISTS contributions_totals ON contributions;
+            CREATE TRIGGER contributions_totals
+                AFTER INSERT OR DELETE OR UPDATE OF supply_id, user_id, amount ON contributions
+                FOR EACH ROW EXECUTE FUNCTION contributions_totals_trigger();
+            DROP TRIGGER IF EXISTS items_totals ON items;
+            CREATE TRIGGER items_totals
+                AFTER INSERT OR DELETE OR UPDATE OF supply_id, price, sell_price, is_sold ON items
+                FOR EACH ROW EXECUTE FUNCTION items_totals_trigger();
+        """,
+        "SELECT supply_totals_rebuild()",
+    )),
+    # Суммы вкладов пользователей за всё время (для рейтинга)
+    (3, "user_totals", (
+        """
+            CREATE TABLE IF NOT EXISTS user_totals (
+                user_id BIGINT PRIMARY KEY,
+                username TEXT,
+                total DOUBLE PRECISION NOT NULL DEFAULT 0
+            )
+        """,
+        "CREATE INDEX IF NOT EXISTS user_totals_total_idx ON user_totals (total)",
+        """
+            CREATE OR REPLACE FUNCTION contributions_user_totals_trigger() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    UPDATE user_totals SET total = total - COALESCE(OLD.amount, 0) WHERE user_id = OLD.user_id;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO user_totals AS t (user_id, username, total)
+                    VALUES (NEW.user_id, NEW.username, COALESCE(NEW.amount, 0))
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        total = t.total + EXCLUDED.total,
+                        username = COALESCE(EXCLUDED.username, t.username);
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+        """,
+        """
+            DROP TRIGGER IF EXISTS contributions_user_totals ON contributions;
+            CREATE TRIGGER contributions_user_totals
+                AFTER INSERT OR DELETE OR UPDATE OF user_id, amount, username ON contributions
+                FOR EACH ROW EXECUTE FUNCTION contributions_user_totals_trigger();
+        """,
+        """
+            INSERT INTO user_totals (user_id, username, total)
+            SELECT user_id, MAX(username), SUM(COALESCE(amount, 0))
+            FROM contributions
+            GROUP BY user_id
+            ON CONFLICT (user_id) DO NOTHING
+        """,
+    )),
+    # Очередь уведомлений (пишется в одной транзакции с изменением данных)
+    (4, "outbox", (
+        """
+            CREATE TABLE IF NOT EXISTS outbox (
+                id BIGSERIAL PRIMARY KEY,
+                chat_id BIGINT NOT NULL,
+                text TEXT NOT NULL,
+                parse_mode TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                sent_at TIMESTAMPTZ,
+                last_error TEXT
+            )
+        """,
+        "CREATE INDEX IF NOT EXISTS outbox_pending_idx ON outbox (next_attempt_at) WHERE sent_at IS NULL",
+    )),
+    (5, "fsm_storage", (
+        """
+            CREATE TABLE IF NOT EXISTS fsm_storage (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data JSONB NOT NULL DEFAULT '{}',
+                expires_at TIMESTAMPTZ
+            )
+        """,
+        "CREATE INDEX IF NOT EXISTS fsm_storage_expires_idx ON fsm_storage (expires_at) WHERE expires_at IS NOT NULL",
+    )),
+    # Сброс кэшей в других процессах (LISTEN/NOTIFY).
+    # Одинаковые уведомления внутри транзакции Postgres схлопывает, поэтому массовые
+    # изменения одной поставки дают одно событие на поставку
+    (6, "cache_notify", (
+        """
+            CREATE OR REPLACE FUNCTION cache_notify(p_scope TEXT, p_id TEXT) RETURNS void AS $$
+            BEGIN
+                PERFORM pg_notify('cache_invalidate', json_build_object(
+                    'scope', p_scope, 'id', p_id, 'version', txid_current()
+                )::text);
+            END
+            $$ LANGUAGE plpgsql
+        """,
+        """
+            CREATE OR REPLACE FUNCTION supplies_cache_trigger() RETURNS trigger AS $$
+            BEGIN
+                PERFORM cache_notify('supplies', NULL);
+                PERFORM cache_notify('supply', COALESCE(NEW.id, OLD.id)::text);
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+        """,
+        """
+            CREATE OR REPLACE FUNCTION items_cache_trigger() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    PERFORM cache_notify('item', OLD.id::text);
+                    PERFORM cache_notify('supply', OLD.supply_id::text);
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    PERFORM cache_notify('supply', NEW.supply_id::text);
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+        """,
+        """
+            CREATE OR REPLACE FUNCTION photo_file_ids_cache_trigger() RETURNS trigger AS $$
+            BEGIN
+                PERFORM cache_notify('photo', COALESCE(NEW.photo, OLD.photo));
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+        """,
+        """
+            DROP TRIGGER IF EXISTS supplies_cache ON supplies;
+            CREATE TRIGGER supplies_cache
+                AFTER INSERT OR UPDATE OR DELETE ON supplies
+                FOR EACH ROW EXECUTE FUNCTION supplies_cache_trigger();
+            DROP TRIGGER IF EXISTS items_cache ON items;
+            CREATE TRIGGER items_cache
+                AFTER INSERT OR UPDATE OR DELETE ON items
+                FOR EACH ROW EXECUTE FUNCTION items_cache_trigger();
+            DROP TRIGGER IF EXISTS photo_file_ids_cache ON photo_file_ids;
+            CREATE TRIGGER photo_file_ids_cache
+                AFTER INSERT OR UPDATE OR DELETE ON photo_file_ids
+                FOR EACH ROW EXECUTE FUNCTION photo_file_ids_cache_trigger();
+        """,
+    )),
+    # Индексы под частые запросы: товары и вклады поставки, заявки пользователя, поставки по статусу
+    (7, "hot_indexes", (
+        "CREATE INDEX IF NOT EXISTS items_supply_id_idx ON items (supply_id, id)",
+        "CREATE INDEX IF NOT EXISTS contributions_supply_id_idx ON contributions (supply_id)",
+        "CREATE INDEX IF NOT EXISTS contribution_requests_user_status_idx ON contribution_requests (user_id, status)",
+        "CREATE INDEX IF NOT EXISTS supplies_status_idx ON supplies (status, id)",
+    )),
+    # Старые вклады удалённых поставок не трогаем: если они есть, ключ остаётся NOT VALID
+    # и проверяется только для новых строк
+    (8, "contributions_supply_fk", (
+        """
+            ALTER TABLE contributions
+                ADD CONSTRAINT contributions_supply_id_fkey
+                FOREIGN KEY (supply_id) REFERENCES supplies(id) ON DELETE CASCADE NOT VALID
+        """,
+        """
+            DO $$
+            BEGIN
+                IF NOT EXISTS (
+                    SELECT 1 FROM contributions c
+                    WHERE c.supply_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM supplies s WHERE s.id = c.supply_id)
+                ) THEN
+                    ALTER TABLE contributions VALIDATE CONSTRAINT contributions_supply_id_fkey;
+                END IF;
+            END
+            $$
+        """,
+    )),
+    # Итоги расчёта по завершённой поставке. В supply_totals добавляется себестоимость проданного:
+    # прибыль считается только с проданных товаров, закупка непроданных возвращается вкладчикам
+    (9, "payouts", (
+        "ALTER TABLE supply_totals ADD COLUMN IF NOT EXISTS sold_cost_total DOUBLE PRECISION NOT NULL DEFAULT 0",
+        """
+            DROP FUNCTION IF EXISTS supply_totals_add(
+                BIGINT, BIGINT, DOUBLE PRECISION, INTEGER, INTEGER, DOUBLE PRECISION, DOUBLE PRECISION
+            )
+        """,
+        """
+            CREATE OR REPLACE FUNCTION supply_totals_add(
+                p_supply_id BIGINT,
+                p_user_id BIGINT,
+                p_amount DOUBLE PRECISION,
+                p_contributors INTEGER,
+                p_items INTEGER,
+                p_cost DOUBLE PRECISION,
+                p_revenue DOUBLE PRECISION,
+                p_sold_cost DOUBLE PRECISION DEFAULT 0
+            ) RETURNS void AS $$
+            DECLARE
+                is_admin BOOLEAN := p_user_id IS NOT NULL AND EXISTS (SELECT 1 FROM admins WHERE user_id = p_user_id);
+            BEGIN
+                IF p_supply_id IS NULL OR NOT EXISTS (SELECT 1 FROM supplies WHERE id = p_supply_id) THEN
+                    RETURN;
+                END IF;
+                INSERT INTO supply_totals AS t (
+                    supply_id, contrib_total, admin_total, other_total, admin_count, other_count,
+                    item_count, cost_total, revenue_total, sold_cost_total
+                ) VALUES (
+                    p_supply_id,
+                    p_amount,
+                    CASE WHEN is_admin THEN p_amount ELSE 0 END,
+                    CASE WHEN is_admin THEN 0 ELSE p_amount END,
+                    CASE WHEN is_admin THEN p_contributors ELSE 0 END,
+                    CASE WHEN is_admin THEN 0 ELSE p_contributors END,
+                    p_items, p_cost, p_revenue, p_sold_cost
+                )
+                ON CONFLICT (supply_id) DO UPDATE SET
+                    contrib_total = t.contrib_total + EXCLUDED.contrib_total,
+                    admin_total = t.admin_total + EXCLUDED.admin_total,
+                    other_total = t.other_total + EXCLUDED.other_total,
+                    admin_count = t.admin_count + EXCLUDED.admin_count,
+                    other_count = t.other_count + EXCLUDED.other_count,
+                    item_count = t.item_count + EXCLUDED.item_count,
+                    cost_total = t.cost_total + EXCLUDED.cost_total,
+                    revenue_total = t.revenue_total + EXCLUDED.revenue_total,
+                    sold_cost_total = t.sold_cost_total + EXCLUDED.sold_cost_total;
+            END
+            $$ LANGUAGE plpgsql
+        """,
+        """
+            CREATE OR REPLACE FUNCTION items_totals_trigger() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    PERFORM supply_totals_add(
+                        OLD.supply_id, NULL, 0, 0, -1, -COALESCE(OLD.price, 0),
+                        CASE WHEN OLD.is_sold THEN -COALESCE(OLD.sell_price, 0) ELSE 0 END,
+                        CASE WHEN OLD.is_sold THEN -COALESCE(OLD.price, 0) ELSE 0 END
+                    );
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    PERFORM supply_totals_add(
+                        NEW.supply_id, NULL, 0, 0, 1, COALESCE(NEW.price, 0),
+                        CASE WHEN NEW.is_sold THEN COALESCE(NEW.sell_price, 0) ELSE 0 END,
+                        CASE WHEN NEW.is_sold THEN COALESCE(NEW.price, 0) ELSE 0 END
+                    );
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+        """,
+        """
+            CREATE OR REPLACE FUNCTION supply_totals_rebuild() RETURNS void AS $$
+            BEGIN
+                DELETE FROM supply_totals;
+                INSERT INTO supply_totals (
+                    supply_id, contrib_total, admin_total, other_total, admin_count, other_count,
+                    item_count, cost_total, revenue_total, sold_cost_total
+                )
+                SELECT s.id,
+                       COALESCE(c.contrib_total, 0), COALESCE(c.admin_total, 0), COALESCE(c.other_total, 0),
+                       COALESCE(c.admin_count, 0), COALESCE(c.other_count, 0),
+                       COALESCE(i.item_count, 0), COALESCE(i.cost_total, 0), COALESCE(i.revenue_total, 0),
+                       COALESCE(i.sold_cost_total, 0)
+                FROM supplies s
+                LEFT JOIN (
+                    SELECT supply_id,
+                           SUM(COALESCE(amount, 0)) AS contrib_total,
+                           SUM(COALESCE(amount, 0)) FILTER (WHERE a.user_id IS NOT NULL) AS admin_total,
+                           SUM(COALESCE(amount, 0)) FILTER (WHERE a.user_id IS NULL) AS other_total,
+                           COUNT(*) FILTER (WHERE a.user_id IS NOT NULL) AS admin_count,
+                           COUNT(*) FILTER (WHERE a.user_id IS NULL) AS other_count
+                    FROM contributions
+                    LEFT JOIN admins a USING (user_id)
+                    GROUP BY supply_id
+                ) c ON c.supply_id = s.id
+                LEFT JOIN (
+                    SELECT supply_id,
+                           COUNT(*) AS item_count,
+                           SUM(COALESCE(price, 0)) AS cost_total,
+                           SUM(COALESCE(sell_price, 0)) FILTER (WHERE is_sold) AS revenue_total,
+                           SUM(COALESCE(price, 0)) FILTER (WHERE is_sold) AS sold_cost_total
+                    FROM items
+                    GROUP BY supply_id
+                ) i ON i.supply_id = s.id;
+            END
+            $$ LANGUAGE plpgsql
+        """,
+        "SELECT supply_totals_rebuild()",
+        """
+            CREATE TABLE IF NOT EXISTS payouts (
+                supply_id BIGINT NOT NULL REFERENCES supplies(id) ON DELETE CASCADE,
+                user_id BIGINT NOT NULL,
+                username TEXT,
+                amount DOUBLE PRECISION NOT NULL,
+                share DOUBLE PRECISION NOT NULL,
+                profit DOUBLE PRECISION NOT NULL,
+                refund DOUBLE PRECISION NOT NULL,
+                payout DOUBLE PRECISION NOT NULL,
+                settled_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                PRIMARY KEY (supply_id, user_id)
+            )
+        """,
+        "CREATE INDEX IF NOT EXISTS payouts_user_id_idx ON payouts (user_id)",
+    )),
+    # Активная поставка создаётся под advisory-блокировкой транзакции: одновременные /start
+    # не создадут две поставки. Пока активная есть, функция — один SELECT по индексу
+    (10, "ensure_active_supply", (
+        """
+            CREATE OR REPLACE FUNCTION ensure_active_supply(p_name TEXT)
+            RETURNS TABLE (id BIGINT, created BOOLEAN) AS $$
+            DECLARE
+                supply_id BIGINT;
+            BEGIN
+                SELECT s.id INTO supply_id FROM supplies s WHERE s.status = 'active' ORDER BY s.id DESC LIMIT 1;
+                IF supply_id IS NULL THEN
+                    PERFORM pg_advisory_xact_lock(7302);
+                    SELECT s.id INTO supply_id FROM supplies s WHERE s.status = 'active' ORDER BY s.id DESC LIMIT 1;
+                    IF supply_id IS NULL THEN
+                        INSERT INTO supplies (name, status) VALUES (p_name, 'active') RETURNING supplies.id INTO supply_id;
+                        RETURN QUERY SELECT supply_id, TRUE;
+                        RETURN;
+                    END IF;
+                END IF;
+                RETURN QUERY SELECT supply_id, FALSE;
+            END
+            $$ LANGUAGE plpgsql
+        """,
+    )),
+    # Журнал движений по вкладам: только вставки. Суммы в contributions — свёртка журнала.
+    # xid — транзакция, вставившая событие: свёртка берёт только события транзакций старше
+    # xmin своего снимка, поэтому поздно закоммиченное событие не проскочит мимо курсора.
+    # Текущие суммы заносятся как opening, уже учтённые в contributions
+    (11, "contribution_events", (
+        """
+            CREATE TABLE IF NOT EXISTS contribution_events (
+                id BIGSERIAL PRIMARY KEY,
+                supply_id BIGINT NOT NULL REFERENCES supplies(id) ON DELETE CASCADE,
+                user_id BIGINT NOT NULL,
+                kind TEXT NOT NULL CHECK (kind IN ('opening', 'approval', 'manual', 'refund', 'payout')),
+                amount DOUBLE PRECISION NOT NULL,
+                username TEXT,
+                request_id BIGINT,
+                admin_id BIGINT,
+                xid xid8 NOT NULL DEFAULT pg_current_xact_id(),
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """,
+        "CREATE INDEX IF NOT EXISTS contribution_events_xid_idx ON contribution_events (xid)",
+        "CREATE INDEX IF NOT EXISTS contribution_events_supply_idx ON contribution_events (supply_id, user_id)",
+        """
+            INSERT INTO contribution_events (supply_id, user_id, kind, amount, username)
+            SELECT c.supply_id, c.user_id, 'opening', c.amount, c.username
+            FROM contributions c
+            JOIN supplies s ON s.id = c.supply_id
+            WHERE COALESCE(c.amount, 0) <> 0
+        """,
+        """
+            INSERT INTO contribution_events (supply_id, user_id, kind, amount, username)
+            SELECT supply_id, user_id, 'payout', payout, username FROM payouts
+        """,
+        """
+            CREATE TABLE IF NOT EXISTS contribution_rollup (
+                id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                last_xmin xid8 NOT NULL
+            )
+        """,
+        """
+            INSERT INTO contribution_rollup (last_xmin) VALUES (pg_snapshot_xmin(pg_current_snapshot()))
+            ON CONFLICT (id) DO NOTHING
+        """,
+    )),
+    # Входящие заявки листаются по id среди pending
+    (12, "pending_requests_index", (
+        "CREATE INDEX IF NOT EXISTS contribution_requests_pending_idx ON contribution_requests (id) WHERE status = 'pending'",
+    )),
+    (13, "contributions_report_index", (
+        # Отчёт по вкладам листается по (amount, user_id) внутри поставки
+        "CREATE INDEX IF NOT EXISTS contributions_report_idx ON contributions (supply_id, amount, user_id) WHERE amount > 0",
+    )),
+    # Версия записи FSM: процесс сверяет с ней свою копию на каждом чтении.
+    # Версии берутся из одной последовательности, поэтому удалённая и заново созданная запись не совпадёт со старой
+    (14, "fsm_storage_version", (
+        "CREATE SEQUENCE IF NOT EXISTS fsm_storage_version_seq",
+        "ALTER TABLE fsm_storage ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT nextval('fsm_storage_version_seq')",
+    )),
+    # Строки вклада появляются только из журнала: нулевые строки от /start убираются, триггеры поправят итоги.
+    # Ручных зачислений и возвратов никто не пишет — в журнале остаются только реальные виды событий
+    (15, "ledger_only_contributions", (
+        "DELETE FROM contributions WHERE COALESCE(amount, 0) = 0",
+        "ALTER TABLE contribution_events DROP CONSTRAINT IF EXISTS contribution_events_kind_check",
+        """
+            ALTER TABLE contribution_events ADD CONSTRAINT contribution_events_kind_check
+                CHECK (kind IN ('opening', 'approval', 'payout'))
+        """,
+    )),
+)
+LATEST_VERSION = len(MIGRATIONS)
+_LOCK_ID = 7301
+
+
+async def migrate(conn):
+    # Обычный старт — один SELECT одной строки, без DDL
+    try:
+        version = await conn.fetchval("SELECT version FROM schema_version")
+    except asyncpg.UndefinedTableError:
+        version = None
+    if version is not None and version >= LATEST_VERSION:
+        return version
+
+    # Несколько процессов могут стартовать одновременно: мигрирует один, остальные ждут
+    await conn.execute("SELECT pg_advisory_lock($1)", _LOCK_ID)
+    try:
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                version INTEGER NOT NULL
+            )
+        """)
+        await conn.execute("INSERT INTO schema_version (version) VALUES (0) ON CONFLICT (id) DO NOTHING")
+        version = await conn.fetchval("SELECT version FROM schema_version")
+        for number, name, statements in MIGRATIONS:
+            if number <= version:
+                continue
+            async with conn.transaction():
+                for sql in statements:
+                    await conn.execute(sql)
+                await conn.execute("UPDATE schema_version SET version = $1", number)
+            print(f"Applied migration {number}: {name}")
+            version = number
+        return version
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", _LOCK_ID)
@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest, TelegramAPIError
+
+from db import acquire
+from repo import OutboxRepo
+
+
+# === ОЧЕРЕДЬ УВЕДОМЛЕНИЙ ===
+class OutboxDispatcher:
+    def __init__(self, bot, batch_size=50, poll_interval=5.0, lease=60.0, max_attempts=10,
+                 max_backoff=3600.0, keep_sent=7 * 86400.0):
+        self.bot = bot
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self.keep_sent = keep_sent
+        self._wakeup = asyncio.Event()
+        self._purged_at = 0.0
+
+    def wake(self):
+        # Обработчик только что закоммитил сообщение, не ждём следующего опроса
+        self._wakeup.set()
+
+    def _backoff(self, attempts):
+        return min(self.max_backoff, 2 ** attempts)
+
+    async def _send(self, message):
+        try:
+            await self.bot.send_message(message.chat_id, message.text, parse_mode=message.parse_mode)
+        except TelegramRetryAfter as e:
+            return e.retry_after, str(e)
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Повтор не поможет: пользователь заблокировал бота или сообщение некорректно
+            return None, str(e)
+        except TelegramAPIError as e:
+            return self._backoff(message.attempts), str(e)
+        return 0, None
+
+    async def dispatch(self):
+        async with acquire() as conn:
+            messages = await OutboxRepo(conn).claim(self.batch_size, self.lease, self.max_attempts)
+
+        for message in messages:
+            delay, error = await self._send(message)
+            async with acquire() as conn:
+                repo = OutboxRepo(conn)
+                if error is None:
+                    await repo.mark_sent(message.id)
+                elif delay is None or message.attempts >= self.max_attempts:
+                    print(f"Outbox message {message.id} to {message.chat_id} dropped: {error}")
+                    await repo.give_up(message.id, self.max_attempts, error)
+                else:
+                    await repo.retry_later(message.id, delay, error)
+        return len(messages)
+
+    async def _purge(self):
+        if time.monotonic() - self._purged_at < 3600:
+            return
+        async with acquire() as conn:
+            await OutboxRepo(conn).purge_sent(self.keep_sent)
+        self._purged_at = time.monotonic()
+
+    async def run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                # Полная пачка — скорее всего, в очереди есть ещё, забираем сразу
+                while await self.dispatch() == self.batch_size:
+                    pass
+                await self._purge()
+            except Exception as e:
+                print(f"Outbox dispatch failed: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,116 @@
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile
+
+from cache import cache, photo_scope
+from db import acquire
+from repo import ItemRepo, PhotoRepo
+
+PHOTO_DIR = "photos"
+_CHUNK_SIZE = 65536
+
+
+# === ХРАНИЛИЩЕ ФОТО ===
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@contextmanager
+def temp_photo():
+    # Временный файл в PHOTO_DIR; если до keep_photo дело не дошло, он удаляется
+    tmp_path = os.path.join(PHOTO_DIR, f".{uuid.uuid4().hex}.part")
+    try:
+        yield tmp_path
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def keep_photo(tmp_path):
+    # Файл называется по хэшу содержимого, поэтому повторная загрузка той же картинки не создаёт дубликат
+    path = os.path.join(PHOTO_DIR, f"{_sha256(tmp_path)}.jpg")
+    if os.path.exists(path):
+        # Обновляем mtime, чтобы сборщик мусора не удалил файл до записи в items
+        os.utime(path)
+    else:
+        os.replace(tmp_path, path)
+    return path
+
+
+async def store_photo(bot, file_id):
+    file = await bot.get_file(file_id)
+    with temp_photo() as tmp_path:
+        await bot.download_file(file.file_path, tmp_path, chunk_size=_CHUNK_SIZE)
+        path = await asyncio.to_thread(keep_photo, tmp_path)
+
+    await remember_file_id(path, file_id)
+    return path
+
+
+async def collect_garbage(grace):
+    # Файл живёт, пока на него ссылается хотя бы одна строка items.photo
+    async with acquire() as conn:
+        referenced = set(await ItemRepo(conn).photos())
+
+    now = time.time()
+    removed = []
+    for entry in os.scandir(PHOTO_DIR):
+        if not entry.is_file():
+            continue
+        path = os.path.join(PHOTO_DIR, entry.name)
+        if path in referenced or now - entry.stat().st_mtime < grace:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        removed.append(path)
+
+    if removed:
+        async with acquire() as conn:
+            await PhotoRepo(conn).forget_many(removed)
+        cache.bump(*(photo_scope(path) for path in removed))
+    return len(removed)
+
+
+async def run_photo_gc(interval, grace):
+    while True:
+        try:
+            removed = await collect_garbage(grace)
+            if removed:
+                print(f"Photo GC removed {removed} unreferenced files")
+        except Exception as e:
+            print(f"Photo GC failed: {e}")
+        await asyncio.sleep(interval)
+
+
+# === ФОТО ТОВАРОВ ===
+async def remember_file_id(photo_path, file_id):
+    async with acquire() as conn:
+        await PhotoRepo(conn).remember(photo_path, file_id)
+    # Закэшированные товары с этим фото должны увидеть новый file_id
+    cache.bump(photo_scope(photo_path))
+
+
+async def send_item_photo(bot, chat_id, photo_path, file_id=None, **kwargs):
+    # Повторно отправляем уже загруженный в Telegram файл, а с диска грузим только при промахе
+    if file_id:
+        try:
+            return await bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+        except TelegramBadRequest as e:
+            print(f"Cached file_id for {photo_path} rejected, re-uploading: {e}")
+
+    message = await bot.send_photo(chat_id=chat_id, photo=FSInputFile(photo_path), **kwargs)
+    if message.photo:
+        await remember_file_id(photo_path, message.photo[-1].file_id)
+    return message
@@ -0,0 +1,762 @@
+# === СТРОКИ ===
+class Supply:
+    __slots__ = ("id", "name", "status")
+
+    def __init__(self, id, name, status=None):
+        self.id = id
+        self.name = name
+        self.status = status
+
+
+class Item:
+    __slots__ = ("id", "supply_id", "title", "price", "sell_price", "description", "photo", "is_sold", "status",
+                 "photo_file_id")
+
+    def __init__(self, id, supply_id, title, price, sell_price, description, photo, is_sold, status,
+                 photo_file_id=None):
+        self.id = id
+        self.supply_id = supply_id
+        self.title = title
+        self.price = price
+        self.sell_price = sell_price
+        self.description = description
+        self.photo = photo
+        self.is_sold = is_sold
+        self.status = status
+        self.photo_file_id = photo_file_id
+
+
+class ItemSummary:
+    __slots__ = ("id", "title", "price", "is_sold")
+
+    def __init__(self, id, title, price, is_sold):
+        self.id = id
+        self.title = title
+        self.price = price
+        self.is_sold = is_sold
+
+
+class Page:
+    __slots__ = ("items", "has_prev", "has_next")
+
+    def __init__(self, items, has_prev, has_next):
+        self.items = items
+        self.has_prev = has_prev
+        self.has_next = has_next
+
+
+class Contribution:
+    __slots__ = ("user_id", "supply_id", "amount", "username")
+
+    def __init__(self, user_id, supply_id, amount, username=None):
+        self.user_id = user_id
+        self.supply_id = supply_id
+        self.amount = amount
+        self.username = username
+
+
+class SupplyTotals:
+    __slots__ = ("contrib_total", "admin_total", "other_total", "admin_count", "other_count",
+                 "item_count", "cost_total", "revenue_total", "sold_cost_total")
+
+    def __init__(self, contrib_total=0, admin_total=0, other_total=0, admin_count=0, other_count=0,
+                 item_count=0, cost_total=0, revenue_total=0, sold_cost_total=0):
+        self.contrib_total = contrib_total
+        self.admin_total = admin_total
+        self.other_total = other_total
+        self.admin_count = admin_count
+        self.other_count = other_count
+        self.item_count = item_count
+        self.cost_total = cost_total
+        self.revenue_total = revenue_total
+        self.sold_cost_total = sold_cost_total
+
+
+class Contributor:
+    __slots__ = ("user_id", "username", "total")
+
+    def __init__(self, user_id, username, total):
+        self.user_id = user_id
+        self.username = username
+        self.total = total
+
+
+class Payout:
+    __slots__ = ("supply_id", "supply_name", "amount", "share", "profit", "refund", "payout")
+
+    def __init__(self, supply_id, supply_name, amount, share, profit, refund, payout):
+        self.supply_id = supply_id
+        self.supply_name = supply_name
+        self.amount = amount
+        self.share = share
+        self.profit = profit
+        self.refund = refund
+        self.payout = payout
+
+
+class SupplyDetails:
+    __slots__ = ("name", "status", "amount", "totals", "payout", "bank", "payment_info")
+
+    def __init__(self, name, status, amount, totals, payout, bank, payment_info):
+        self.name = name
+        self.status = status
+        self.amount = amount
+        self.totals = totals
+        self.payout = payout
+        self.bank = bank
+        self.payment_info = payment_info
+
+
+class ContributionReport:
+    __slots__ = ("supply", "totals", "contributors", "page_total", "prev_supply_id", "next_supply_id", "page")
+
+    def __init__(self, supply, totals, contributors, page_total, prev_supply_id, next_supply_id, page):
+        self.supply = supply
+        self.totals = totals
+        self.contributors = contributors
+        self.page_total = page_total
+        self.prev_supply_id = prev_supply_id
+        self.next_supply_id = next_supply_id
+        self.page = page
+
+
+class UserStats:
+    __slots__ = ("supplies", "invested", "biggest_amount", "biggest_supply", "profit", "best_supply", "rank")
+
+    def __init__(self, supplies, invested, biggest_amount, biggest_supply, profit, best_supply, rank):
+        self.supplies = supplies
+        self.invested = invested
+        self.biggest_amount = biggest_amount
+        self.biggest_supply = biggest_supply
+        self.profit = profit
+        self.best_supply = best_supply
+        self.rank = rank
+
+
+class OutboxMessage:
+    __slots__ = ("id", "chat_id", "text", "parse_mode", "attempts")
+
+    def __init__(self, id, chat_id, text, parse_mode, attempts):
+        self.id = id
+        self.chat_id = chat_id
+        self.text = text
+        self.parse_mode = parse_mode
+        self.attempts = attempts
+
+
+class ContributionRequest:
+    __slots__ = ("id", "user_id", "username", "bank", "payment_info", "status")
+
+    def __init__(self, id, user_id, username, bank, payment_info, status):
+        self.id = id
+        self.user_id = user_id
+        self.username = username
+        self.bank = bank
+        self.payment_info = payment_info
+        self.status = status
+
+
+# === ЗАПРОСЫ ===
+class _Repo:
+    __slots__ = ("conn",)
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    # asyncpg готовит каждый запрос один раз на соединение и хранит его в кэше выражений
+    async def _fetch(self, query, *args):
+        return await self.conn.fetch(query, *args)
+
+    async def _fetchrow(self, query, *args):
+        return await self.conn.fetchrow(query, *args)
+
+    async def _fetchval(self, query, *args):
+        return await self.conn.fetchval(query, *args)
+
+
+class SupplyRepo(_Repo):
+    __slots__ = ()
+
+    GET = "SELECT id, name, status FROM supplies WHERE id = $1"
+    NAME = "SELECT name FROM supplies WHERE id = $1"
+    BY_STATUS = "SELECT id, name, status FROM supplies WHERE status = $1 ORDER BY id"
+    VISIBLE = "SELECT id, name, status FROM supplies WHERE status IN ('active', 'completed') ORDER BY id"
+    COUNT = "SELECT COUNT(*) FROM supplies"
+    CREATE = "INSERT INTO supplies (name, status) VALUES ($1, 'active') RETURNING id"
+    # /start: активная поставка, создаётся при необходимости. Строка вклада появится из журнала при зачислении
+    ENSURE_ACTIVE = "SELECT id, created FROM ensure_active_supply($1)"
+    COMPLETE = "UPDATE supplies SET status = 'completed' WHERE id = $1 AND status <> 'completed' RETURNING id"
+    DELETE = "DELETE FROM supplies WHERE id = $1"
+
+    async def get(self, supply_id):
+        row = await self._fetchrow(self.GET, supply_id)
+        return Supply(*row) if row else None
+
+    async def name(self, supply_id):
+        return await self._fetchval(self.NAME, supply_id)
+
+    async def list_by_status(self, status):
+        return [Supply(*r) for r in await self._fetch(self.BY_STATUS, status)]
+
+    async def list_visible(self):
+        return [Supply(*r) for r in await self._fetch(self.VISIBLE)]
+
+    async def count(self):
+        return await self._fetchval(self.COUNT)
+
+    async def create(self, name):
+        return await self._fetchval(self.CREATE, name)
+
+    async def ensure_active(self, name):
+        # -> (supply_id, создана ли поставка)
+        return tuple(await self._fetchrow(self.ENSURE_ACTIVE, name))
+
+    async def complete(self, supply_id):
+        # False, если поставка уже завершена
+        return await self._fetchval(self.COMPLETE, supply_id) is not None
+
+    async def delete(self, supply_id):
+        await self.conn.execute(self.DELETE, supply_id)
+
+
+class ItemRepo(_Repo):
+    __slots__ = ()
+
+    GET = """
+        SELECT i.id, i.supply_id, i.title, i.price, i.sell_price, i.description, i.photo, i.is_sold, i.status,
+               p.file_id
+        FROM items i
+        LEFT JOIN photo_file_ids p ON p.photo = i.photo
+        WHERE i.id = $1
+    """
+    # Keyset-пагинация по (supply_id, id): страница — один диапазонный проход по индексу
+    PAGE_AFTER = """
+        SELECT id, title, price, is_sold FROM items
+        WHERE supply_id = $1 AND id > $2
+          AND ($3::boolean IS NULL OR is_sold = $3)
+          AND ($4::text IS NULL OR status = $4)
+        ORDER BY id
+        LIMIT $5
+    """
+    PAGE_BEFORE = """
+        SELECT id, title, price, is_sold FROM items
+        WHERE supply_id = $1 AND id < $2
+          AND ($3::boolean IS NULL OR is_sold = $3)
+          AND ($4::text IS NULL OR status = $4)
+        ORDER BY id DESC
+        LIMIT $5
+    """
+    CREATE = """
+        INSERT INTO items (supply_id, title, price, sell_price, description, photo)
+        VALUES ($1, $2, $3, $4, $5, $6) RETURNING id
+    """
+    # Изменения одного товара возвращают его supply_id, чтобы сбросить кэш поставки
+    UPDATE = """
+        UPDATE items SET title = $1, price = $2, sell_price = $3, description = $4 WHERE id = $5 RETURNING supply_id
+    """
+    UPDATE_WITH_PHOTO = """
+        UPDATE items SET title = $1, price = $2, sell_price = $3, description = $4, photo = $5 WHERE id = $6
+        RETURNING supply_id
+    """
+    TOGGLE_SOLD = "UPDATE items SET is_sold = NOT is_sold WHERE id = $1 RETURNING supply_id"
+    SET_STATUS_FOR_SUPPLY = "UPDATE items SET status = $1 WHERE supply_id = $2"
+    DELETE = "DELETE FROM items WHERE id = $1 RETURNING supply_id"
+    DELETE_BY_SUPPLY = "DELETE FROM items WHERE supply_id = $1"
+    PHOTOS = "SELECT DISTINCT photo FROM items WHERE photo IS NOT NULL"
+    COPY_COLUMNS = ("supply_id", "title", "price", "sell_price", "description", "photo", "status")
+
+    async def get(self, item_id):
+        row = await self._fetchrow(self.GET, item_id)
+        return Item(*row) if row else None
+
+    async def page(self, supply_id, limit, after_id=0, before_id=None, is_sold=None, status=None):
+        # Берём на одну строку больше, чтобы узнать, есть ли следующая страница
+        if before_id is not None:
+            rows = await self._fetch(self.PAGE_BEFORE, supply_id, before_id, is_sold, status, limit + 1)
+            items = [ItemSummary(*r) for r in reversed(rows[:limit])]
+            return Page(items, len(rows) > limit, True)
+        rows = await self._fetch(self.PAGE_AFTER, supply_id, after_id, is_sold, status, limit + 1)
+        return Page([ItemSummary(*r) for r in rows[:limit]], after_id > 0, len(rows) > limit)
+
+    async def create(self, supply_id, title, price, sell_price, description, photo):
+        return await self._fetchval(self.CREATE, supply_id, title, price, sell_price, description, photo)
+
+    async def update(self, item_id, title, price, sell_price, description, photo=None):
+        if photo is not None:
+            return await self._fetchval(self.UPDATE_WITH_PHOTO, title, price, sell_price, description, photo, item_id)
+        return await self._fetchval(self.UPDATE, title, price, sell_price, description, item_id)
+
+    async def copy_many(self, supply_id, rows):
+        # rows: (title, price, sell_price, description, photo, status)
+        await self.conn.copy_records_to_table(
+            "items", records=[(supply_id, *row) for row in rows], columns=self.COPY_COLUMNS
+        )
+
+    async def toggle_sold(self, item_id):
+        return await self._fetchval(self.TOGGLE_SOLD, item_id)
+
+    async def set_status_for_supply(self, supply_id, status):
+        await self.conn.execute(self.SET_STATUS_FOR_SUPPLY, status, supply_id)
+
+    async def delete(self, item_id):
+        return await self._fetchval(self.DELETE, item_id)
+
+    async def delete_by_supply(self, supply_id):
+        await self.conn.execute(self.DELETE_BY_SUPPLY, supply_id)
+
+    async def photos(self):
+        return [r[0] for r in await self._fetch(self.PHOTOS)]
+
+
+class ContributionRepo(_Repo):
+    __slots__ = ()
+
+    BY_USER = "SELECT user_id, supply_id, amount, username FROM contributions WHERE user_id = $1"
+    CONTRIBUTOR_IDS = "SELECT user_id FROM contributions WHERE supply_id = $1 AND amount > 0"
+
+    async def contributor_ids(self, supply_id):
+        return [r[0] for r in await self._fetch(self.CONTRIBUTOR_IDS, supply_id)]
+
+    async def list_by_user(self, user_id):
+        return [Contribution(*r) for r in await self._fetch(self.BY_USER, user_id)]
+
+
+class ExportRepo(_Repo):
+    __slots__ = ()
+
+    # Выгрузки идут через COPY ... TO STDOUT: строки не собираются в памяти, а пишутся по мере прихода
+    CONTRIBUTIONS = """
+        SELECT user_id, username, amount
+        FROM contributions
+        WHERE supply_id = $1
+        ORDER BY amount DESC, user_id
+    """
+    ITEMS = """
+        SELECT id, title, price, sell_price, is_sold, status, description, photo
+        FROM items
+        WHERE supply_id = $1
+        ORDER BY id
+    """
+    PAYOUTS = """
+        SELECT user_id, username, amount, round((share * 100)::numeric, 2) AS share_percent,
+               profit, refund, payout
+        FROM payouts
+        WHERE supply_id = $1
+        ORDER BY payout DESC, user_id
+    """
+
+    EVENTS = """
+        SELECT id, created_at, user_id, username, kind, amount, request_id, admin_id
+        FROM contribution_events
+        WHERE supply_id = $1
+        ORDER BY id
+    """
+
+    async def copy_csv(self, query, supply_id, output, timeout=None):
+        await self.conn.copy_from_query(query, supply_id, output=output, format="csv", header=True, timeout=timeout)
+
+
+class PayoutRepo(_Repo):
+    __slots__ = ()
+
+    # Расчёт идёт по журналу, а не по contributions: свёртка могла ещё не дойти до последних событий
+    CONTRIBUTIONS = """
+        SELECT e.user_id, e.username, e.amount, a.user_id IS NOT NULL
+        FROM (
+            SELECT user_id, SUM(amount) AS amount,
+                   (array_agg(username ORDER BY id DESC) FILTER (WHERE username IS NOT NULL))[1] AS username
+            FROM contribution_events
+            WHERE supply_id = $1 AND kind IN ('opening', 'approval')
+            GROUP BY user_id
+        ) e
+        LEFT JOIN admins a ON a.user_id = e.user_id
+    """
+    ITEMS = "SELECT COALESCE(price, 0), COALESCE(sell_price, 0), is_sold FROM items WHERE supply_id = $1"
+    DELETE_BY_SUPPLY = "DELETE FROM payouts WHERE supply_id = $1"
+    RECORD_EVENTS = """
+        INSERT INTO contribution_events (supply_id, user_id, kind, amount, username)
+        SELECT supply_id, user_id, 'payout', payout, username FROM payouts WHERE supply_id = $1
+    """
+    COPY_COLUMNS = ("supply_id", "user_id", "username", "amount", "share", "profit", "refund", "payout")
+
+    async def contributions(self, supply_id):
+        return await self._fetch(self.CONTRIBUTIONS, supply_id)
+
+    async def items(self, supply_id):
+        return await self._fetch(self.ITEMS, supply_id)
+
+    async def replace(self, supply_id, rows):
+        await self.conn.execute(self.DELETE_BY_SUPPLY, supply_id)
+        await self.conn.copy_records_to_table(
+            "payouts", records=[(supply_id, *row) for row in rows], columns=self.COPY_COLUMNS
+        )
+        await self.conn.execute(self.RECORD_EVENTS, supply_id)
+
+
+class SummaryRepo(_Repo):
+    __slots__ = ()
+
+    # Экраны пользователя собираются одним запросом: поставка, вклад, итоги, выплата и реквизиты
+    SUPPLY_DETAILS = """
+        SELECT s.name, s.status, COALESCE(c.amount, 0),
+               t.contrib_total, t.admin_total, t.other_total, t.admin_count, t.other_count,
+               t.item_count, t.cost_total, t.revenue_total, t.sold_cost_total,
+               p.amount, p.share, p.profit, p.refund, p.payout,
+               r.bank, r.payment_info
+        FROM supplies s
+        LEFT JOIN contributions c ON c.supply_id = s.id AND c.user_id = $2
+        LEFT JOIN supply_totals t ON t.supply_id = s.id
+        LEFT JOIN payouts p ON p.supply_id = s.id AND p.user_id = $2
+        LEFT JOIN LATERAL (
+            SELECT bank, payment_info
+            FROM contribution_requests
+            WHERE user_id = $2 AND status = 'pending'
+            ORDER BY id DESC LIMIT 1
+        ) r ON TRUE
+        WHERE s.id = $1
+    """
+    USER_STATS = """
+        WITH mine AS (
+            SELECT s.name, c.amount
+            FROM contributions c
+            JOIN supplies s ON s.id = c.supply_id
+            WHERE c.user_id = $1
+        ), paid AS (
+            SELECT s.name, p.amount, p.profit
+            FROM payouts p
+            JOIN supplies s ON s.id = p.supply_id
+            WHERE p.user_id = $1
+        )
+        SELECT m.supplies, m.invested, b.amount, b.name,
+               (SELECT COALESCE(SUM(profit), 0) FROM paid),
+               (SELECT name FROM paid WHERE amount > 0 AND profit > 0 ORDER BY profit / amount DESC LIMIT 1),
+               (SELECT COUNT(*) FROM user_totals
+                WHERE total >= (SELECT total FROM user_totals WHERE user_id = $1))
+        FROM (SELECT COUNT(*) AS supplies, COALESCE(SUM(amount), 0) AS invested FROM mine) m
+        LEFT JOIN LATERAL (SELECT name, amount FROM mine ORDER BY amount DESC LIMIT 1) b ON TRUE
+    """
+
+    # Отчёт админа по вкладам: одна страница одной поставки вместе с итогами и соседними поставками.
+    # Без $1 берётся последняя поставка. Суммы — из supply_totals, участники — строки с amount > 0
+    # (счёт по частичному индексу). Страницы идут по ключу (amount, user_id), а не по OFFSET.
+    # $4 — размер страницы плюс одна строка-признак следующей; n нумерует строки страницы, сумма — по первым $4 - 1
+    _CONTRIBUTION_REPORT = """
+        WITH s AS MATERIALIZED (
+            SELECT id, name, status,
+                   (SELECT MAX(id) FROM supplies p WHERE p.id < supplies.id) AS prev_id,
+                   (SELECT MIN(id) FROM supplies n WHERE n.id > supplies.id) AS next_id,
+                   (SELECT COUNT(*) FROM contributions c WHERE c.supply_id = supplies.id AND c.amount > 0) AS contributors
+            FROM supplies
+            WHERE id = COALESCE($1, (SELECT MAX(id) FROM supplies))
+        )
+        SELECT s.id, s.name, s.status,
+               t.contrib_total, t.admin_total, t.other_total, t.admin_count, t.other_count,
+               t.item_count, t.cost_total, t.revenue_total, t.sold_cost_total,
+               s.prev_id, s.next_id,
+               c.user_id, c.username, c.amount,
+               COALESCE(SUM(c.amount) FILTER (WHERE c.n < $4) OVER (), 0), s.contributors
+        FROM s
+        LEFT JOIN supply_totals t ON t.supply_id = s.id
+        LEFT JOIN LATERAL (
+            SELECT p.*, row_number() OVER (ORDER BY {order}) AS n
+            FROM (
+                SELECT user_id, username, amount FROM contributions
+                WHERE supply_id = s.id AND amount > 0 AND {page}
+                ORDER BY {order}
+                LIMIT $4
+            ) p
+        ) c ON TRUE
+        ORDER BY c.n
+    """
+    CONTRIBUTIONS_AFTER = _CONTRIBUTION_REPORT.format(
+        page="(amount, user_id) < ($2, $3)", order="amount DESC, user_id DESC"
+    )
+    CONTRIBUTIONS_BEFORE = _CONTRIBUTION_REPORT.format(
+        page="(amount, user_id) > ($2, $3)", order="amount, user_id"
+    )
+
+    async def supply_details(self, supply_id, user_id):
+        row = await self._fetchrow(self.SUPPLY_DETAILS, supply_id, user_id)
+        if row is None:
+            return None
+        totals = SupplyTotals(*row[3:12]) if row[3] is not None else SupplyTotals()
+        payout = Payout(supply_id, row[0], *row[12:17]) if row[12] is not None else None
+        return SupplyDetails(row[0], row[1], row[2], totals, payout, row[17], row[18])
+
+    async def user_stats(self, user_id):
+        return UserStats(*await self._fetchrow(self.USER_STATS, user_id))
+
+    async def contribution_report(self, supply_id, limit, after=None, before=None):
+        # after/before — ключ (amount, user_id) крайней строки соседней страницы
+        if before is not None:
+            rows = await self._fetch(self.CONTRIBUTIONS_BEFORE, supply_id, *before, limit + 1)
+        else:
+            rows = await self._fetch(self.CONTRIBUTIONS_AFTER, supply_id, *(after or (float("inf"), 0)), limit + 1)
+        if not rows:
+            return None
+        row = rows[0]
+        totals = SupplyTotals(*row[3:12]) if row[3] is not None else SupplyTotals()
+        items = [Contribution(r[14], row[0], r[16], r[15]) for r in rows[:limit] if r[14] is not None]
+        if before is not None:
+            page = Page(items[::-1], len(rows) > limit, True)
+        else:
+            page = Page(items, after is not None, len(rows) > limit)
+        return ContributionReport(Supply(*row[:3]), totals, row[18], row[17], row[12], row[13], page)
+
+
+class LedgerRepo(_Repo):
+    __slots__ = ()
+
+    # FOR SHARE держит поставку до коммита: завершение дождётся зачислений в неё.
+    # Если её завершили, пока ждали замка, перепроверенная строка отбрасывается и запрос вернёт пусто
+    LOCK_ACTIVE_SUPPLY = "SELECT id FROM supplies WHERE status = 'active' ORDER BY id DESC LIMIT 1 FOR SHARE"
+    # Пачка подтверждений одним запросом: заявки переводятся в approved только если ещё pending,
+    # по каждой в журнал пишется зачисление в заблокированную поставку
+    APPROVE_MANY = """
+        WITH input AS (
+            SELECT * FROM unnest($1::bigint[], $2::double precision[]) AS v(req_id, amount)
+        ), approved AS (
+            UPDATE contribution_requests r SET status = 'approved'
+            FROM input i
+            WHERE r.id = i.req_id AND r.status = 'pending'
+            RETURNING r.id, r.user_id, r.username, i.amount
+        )
+        INSERT INTO contribution_events (supply_id, user_id, kind, amount, username, request_id, admin_id)
+        SELECT $4, user_id, 'approval', amount, username, id, $3
+        FROM approved
+        RETURNING request_id, user_id, supply_id, amount
+    """
+    LOCK = "SELECT pg_advisory_xact_lock(7303)"
+    TRY_LOCK = "SELECT pg_try_advisory_xact_lock(7303)"
+    # В contributions попадают только движения капитала; выплаты остаются в журнале
+    ROLLUP = """
+        WITH bound AS (
+            SELECT last_xmin, pg_snapshot_xmin(pg_current_snapshot()) AS next_xmin FROM contribution_rollup
+        ), batch AS (
+            SELECT e.supply_id, e.user_id, SUM(e.amount) AS amount,
+                   (array_agg(e.username ORDER BY e.id DESC) FILTER (WHERE e.username IS NOT NULL))[1] AS username
+            FROM contribution_events e, bound b
+            WHERE e.xid >= b.last_xmin AND e.xid < b.next_xmin
+              AND e.kind = 'approval'
+            GROUP BY e.supply_id, e.user_id
+        ), folded AS (
+            INSERT INTO contributions AS c (user_id, supply_id, amount, username)
+            SELECT user_id, supply_id, amount, username FROM batch
+            ON CONFLICT (user_id, supply_id) DO UPDATE SET
+                amount = COALESCE(c.amount, 0) + EXCLUDED.amount,
+                username = COALESCE(EXCLUDED.username, c.username)
+            RETURNING 1
+        ), moved AS (
+            UPDATE contribution_rollup r SET last_xmin = b.next_xmin FROM bound b
+            WHERE b.next_xmin > r.last_xmin
+        )
+        SELECT COUNT(*) FROM folded
+    """
+    # Свёрнутая часть журнала против contributions; opening — суммы, бывшие до журнала
+    RECONCILE = """
+        SELECT COALESCE(c.supply_id, e.supply_id), COALESCE(c.user_id, e.user_id),
+               COALESCE(c.amount, 0), COALESCE(e.amount, 0)
+        FROM contributions c
+        FULL JOIN (
+            SELECT supply_id, user_id, SUM(amount) AS amount
+            FROM contribution_events
+            WHERE kind = 'opening'
+               OR kind = 'approval' AND xid < (SELECT last_xmin FROM contribution_rollup)
+            GROUP BY supply_id, user_id
+        ) e ON e.supply_id = c.supply_id AND e.user_id = c.user_id
+        WHERE abs(COALESCE(c.amount, 0) - COALESCE(e.amount, 0)) >= 0.01
+        ORDER BY 1, 2
+    """
+
+    async def lock_active_supply(self):
+        # Вызывается внутри транзакции. Второй заход видит поставку, завершённую во время ожидания,
+        # и берёт следующую активную; None — активной поставки нет
+        for _ in range(2):
+            supply_id = await self._fetchval(self.LOCK_ACTIVE_SUPPLY)
+            if supply_id is not None:
+                return supply_id
+        return None
+
+    async def approve_requests(self, amounts, admin_id, supply_id):
+        # amounts: {id заявки: сумма} -> строки (request_id, user_id, supply_id, amount) подтверждённых
+        return await self._fetch(self.APPROVE_MANY, list(amounts), list(amounts.values()), admin_id, supply_id)
+
+    async def rollup(self):
+        # Сворачивает один процесс: остальные в это время пропускают свой проход
+        async with self.conn.transaction():
+            if not await self._fetchval(self.TRY_LOCK):
+                return 0
+            return await self._fetchval(self.ROLLUP)
+
+    async def fold(self):
+        # Свёртка внутри уже открытой транзакции: ждёт идущий проход, а не пропускает его
+        await self.conn.execute(self.LOCK)
+        return await self._fetchval(self.ROLLUP)
+
+    async def reconcile(self):
+        return await self._fetch(self.RECONCILE)
+
+
+class RequestRepo(_Repo):
+    __slots__ = ()
+
+    PENDING_AFTER = """
+        SELECT id, user_id, username, bank, payment_info, status
+        FROM contribution_requests WHERE status = 'pending' AND id > $1
+        ORDER BY id LIMIT $2
+    """
+    PENDING_BEFORE = """
+        SELECT id, user_id, username, bank, payment_info, status
+        FROM contribution_requests WHERE status = 'pending' AND id < $1
+        ORDER BY id DESC LIMIT $2
+    """
+    LATEST_PENDING_FOR_USER = """
+        SELECT id, user_id, username, bank, payment_info, status
+        FROM contribution_requests
+        WHERE user_id = $1 AND status = 'pending'
+        ORDER BY id DESC LIMIT 1
+    """
+    CREATE = "INSERT INTO contribution_requests (user_id, username, bank, payment_info) VALUES ($1, $2, $3, $4)"
+    UPDATE_DETAILS = "UPDATE contribution_requests SET username = $1, bank = $2, payment_info = $3 WHERE id = $4"
+    REJECT_MANY = """
+        UPDATE contribution_requests SET status = 'rejected'
+        WHERE id = ANY($1::bigint[]) AND status = 'pending'
+        RETURNING user_id
+    """
+
+    async def pending_page(self, limit, after_id=0, before_id=None):
+        if before_id is not None:
+            rows = await self._fetch(self.PENDING_BEFORE, before_id, limit + 1)
+            requests = [ContributionRequest(*r) for r in reversed(rows[:limit])]
+            return Page(requests, len(rows) > limit, True)
+        rows = await self._fetch(self.PENDING_AFTER, after_id, limit + 1)
+        return Page([ContributionRequest(*r) for r in rows[:limit]], after_id > 0, len(rows) > limit)
+
+    async def latest_pending_for_user(self, user_id):
+        row = await self._fetchrow(self.LATEST_PENDING_FOR_USER, user_id)
+        return ContributionRequest(*row) if row else None
+
+    async def create(self, user_id, username, bank, payment_info):
+        await self.conn.execute(self.CREATE, user_id, username, bank, payment_info)
+
+    async def update_details(self, req_id, username, bank, payment_info):
+        await self.conn.execute(self.UPDATE_DETAILS, username, bank, payment_info, req_id)
+
+    async def reject_many(self, req_ids):
+        # -> id пользователей отклонённых заявок; уже обработанные пропускаются
+        return [r[0] for r in await self._fetch(self.REJECT_MANY, req_ids)]
+
+
+class PhotoRepo(_Repo):
+    __slots__ = ()
+
+    REMEMBER = """
+        INSERT INTO photo_file_ids (photo, file_id) VALUES ($1, $2)
+        ON CONFLICT (photo) DO UPDATE SET file_id = EXCLUDED.file_id
+    """
+    FORGET_MANY = "DELETE FROM photo_file_ids WHERE photo = ANY($1::text[])"
+
+    async def remember(self, photo, file_id):
+        await self.conn.execute(self.REMEMBER, photo, file_id)
+
+    async def forget_many(self, photos):
+        await self.conn.execute(self.FORGET_MANY, photos)
+
+
+class LeaderboardRepo(_Repo):
+    __slots__ = ()
+
+    TOP = "SELECT user_id, username, total FROM user_totals WHERE total > 0 ORDER BY total DESC LIMIT $1"
+
+    async def top(self, limit):
+        return [Contributor(*r) for r in await self._fetch(self.TOP, limit)]
+
+
+class OutboxRepo(_Repo):
+    __slots__ = ()
+
+    ENQUEUE_MANY = """
+        INSERT INTO outbox (chat_id, text, parse_mode)
+        SELECT chat_id, text, $3 FROM unnest($1::bigint[], $2::text[]) AS m(chat_id, text)
+    """
+    # Строки забираются с арендой: если процесс упадёт до отметки, через lease секунд их заберёт другой
+    CLAIM = """
+        UPDATE outbox SET attempts = attempts + 1, next_attempt_at = now() + make_interval(secs => $2)
+        WHERE id IN (
+            SELECT id FROM outbox
+            WHERE sent_at IS NULL AND next_attempt_at <= now() AND attempts < $3
+            ORDER BY next_attempt_at
+            LIMIT $1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, chat_id, text, parse_mode, attempts
+    """
+    MARK_SENT = "UPDATE outbox SET sent_at = now(), last_error = NULL WHERE id = $1"
+    RETRY_LATER = "UPDATE outbox SET next_attempt_at = now() + make_interval(secs => $2), last_error = $3 WHERE id = $1"
+    GIVE_UP = "UPDATE outbox SET attempts = $2, last_error = $3 WHERE id = $1"
+    PURGE_SENT = "DELETE FROM outbox WHERE sent_at < now() - make_interval(secs => $1)"
+
+    async def enqueue_many(self, chat_ids, texts, parse_mode=None):
+        await self.conn.execute(self.ENQUEUE_MANY, chat_ids, texts, parse_mode)
+
+    async def claim(self, limit, lease, max_attempts):
+        return [OutboxMessage(*r) for r in await self._fetch(self.CLAIM, limit, float(lease), max_attempts)]
+
+    async def mark_sent(self, message_id):
+        await self.conn.execute(self.MARK_SENT, message_id)
+
+    async def retry_later(self, message_id, delay, error):
+        await self.conn.execute(self.RETRY_LATER, message_id, float(delay), error)
+
+    async def give_up(self, message_id, max_attempts, error):
+        await self.conn.execute(self.GIVE_UP, message_id, max_attempts, error)
+
+    async def purge_sent(self, older_than):
+        await self.conn.execute(self.PURGE_SENT, float(older_than))
+
+
+class FsmRepo(_Repo):
+    __slots__ = ()
+
+    # $2 — версия копии в памяти процесса: если она совпадает, состояние и данные не передаются
+    GET = """
+        SELECT version,
+               CASE WHEN version IS DISTINCT FROM $2 THEN state END,
+               CASE WHEN version IS DISTINCT FROM $2 THEN data::text END,
+               EXTRACT(EPOCH FROM expires_at)::float8
+        FROM fsm_storage WHERE key = $1 AND (expires_at IS NULL OR expires_at > now())
+    """
+    PUT = """
+        INSERT INTO fsm_storage (key, state, data, expires_at)
+        VALUES ($1, $2, $3::jsonb, now() + make_interval(secs => $4))
+        ON CONFLICT (key) DO UPDATE SET state = EXCLUDED.state, data = EXCLUDED.data, expires_at = EXCLUDED.expires_at,
+                                        version = nextval('fsm_storage_version_seq')
+        RETURNING version
+    """
+    DELETE = "DELETE FROM fsm_storage WHERE key = $1"
+    PURGE_EXPIRED = "DELETE FROM fsm_storage WHERE expires_at <= now()"
+
+    async def get(self, key, version=None):
+        return await self._fetchrow(self.GET, key, version)
+
+    # ttl=None — запись не истекает (make_interval от NULL даёт NULL). Возвращает новую версию записи
+    async def put(self, key, state, data, ttl):
+        return await self._fetchval(self.PUT, key, state, data, ttl)
+
+    async def delete(self, key):
+        await self.conn.execute(self.DELETE, key)
+
+    async def purge_expired(self):
+        await self.conn.execute(self.PURGE_EXPIRED)
+
+
+# Запросы, которые готовятся на каждом новом соединении пула.
+# Только SELECT: при прогреве они выполняются с NULL-параметрами
+HOT_STATEMENTS = (
+    SupplyRepo.BY_STATUS,
+    SupplyRepo.NAME,
+    ItemRepo.GET,
+    ItemRepo.PAGE_AFTER,
+    SummaryRepo.SUPPLY_DETAILS,
+    FsmRepo.GET,
+)
@@ -0,0 +1,111 @@
+from db import acquire
+from repo import LedgerRepo, PayoutRepo, SupplyRepo
+
+ADMIN_FEE = 0.2
+
+
+# === РАСЧЁТ ДОЛЕЙ ===
+# Прибыль — выручка проданных товаров минус их закупка. Если вклад есть и у админов, и у остальных,
+# админы забирают ADMIN_FEE от прибыли остальных и делят её между собой пропорционально своим вкладам.
+# Убыток делится строго по вкладам, без комиссии
+def profit_weight(amount, is_admin, admin_total, other_total, fee=ADMIN_FEE):
+    if admin_total <= 0 or other_total <= 0:
+        return amount
+    if is_admin:
+        return amount * (1 + fee * other_total / admin_total)
+    return amount * (1 - fee)
+
+
+def profit_share(amount, is_admin, totals, fee=ADMIN_FEE):
+    # Доля в прибыли по итогам поставки, для экранов активной поставки
+    if totals.contrib_total <= 0:
+        return 0
+    return profit_weight(amount, is_admin, totals.admin_total, totals.other_total, fee) / totals.contrib_total
+
+
+def expected_profit(amount, is_admin, totals, fee=ADMIN_FEE):
+    # Сколько вкладчик получил бы сверх вклада, если бы поставка завершилась сейчас
+    if totals.contrib_total <= 0:
+        return 0
+    profit = totals.revenue_total - totals.sold_cost_total
+    if profit <= 0:
+        return profit * amount / totals.contrib_total
+    return profit * profit_share(amount, is_admin, totals, fee)
+
+
+# === РАСЧЁТ ПОСТАВКИ ===
+def _cents(value):
+    return round((value or 0) * 100)
+
+
+def _allocate(total, weights):
+    # Делим сумму в копейках по весам методом наибольшего остатка: сумма частей равна total копейка в копейку.
+    # Веса переводятся в целые, дальше только целочисленная арифметика
+    weights = [round(weight * 1000) for weight in weights]
+    weight_sum = sum(weights)
+    if weight_sum <= 0:
+        return [0] * len(weights)
+    sign = -1 if total < 0 else 1
+    total = abs(total)
+    parts, remainders = [], []
+    for i, weight in enumerate(weights):
+        part, remainder = divmod(total * weight, weight_sum)
+        parts.append(part)
+        remainders.append((remainder, i))
+    for _, i in sorted(remainders, reverse=True)[:total - sum(parts)]:
+        parts[i] += 1
+    return [sign * part for part in parts]
+
+
+def settle(contributions, items, fee=ADMIN_FEE):
+    # contributions: (user_id, username, amount, is_admin), items: (price, sell_price, is_sold).
+    # Каждый получает назад свой вклад плюс долю прибыли (или минус долю убытка).
+    # Возвращает строки (user_id, username, amount, share, profit, refund, payout)
+    revenue = sold_cost = unsold_cost = 0
+    for price, sell_price, is_sold in items:
+        if is_sold:
+            revenue += _cents(sell_price)
+            sold_cost += _cents(price)
+        else:
+            unsold_cost += _cents(price)
+
+    contributions = [(user_id, username, _cents(amount), is_admin)
+                     for user_id, username, amount, is_admin in contributions]
+    total = admin_total = 0
+    for _, _, amount, is_admin in contributions:
+        total += amount
+        if is_admin:
+            admin_total += amount
+    other_total = total - admin_total
+
+    profit = revenue - sold_cost
+    if profit > 0:
+        weights = [profit_weight(amount, is_admin, admin_total, other_total, fee)
+                   for _, _, amount, is_admin in contributions]
+    else:
+        weights = [amount for _, _, amount, _ in contributions]
+    profits = _allocate(profit, weights)
+    refunds = _allocate(unsold_cost, [amount for _, _, amount, _ in contributions])
+
+    return [
+        (user_id, username, amount / 100, weight / total if total else 0,
+         user_profit / 100, refund / 100, (amount + user_profit) / 100)
+        for (user_id, username, amount, _), weight, user_profit, refund
+        in zip(contributions, weights, profits, refunds)
+    ]
+
+
+async def complete_supply(supply_id):
+    # Перевод в завершённые и запись выплат — в одной транзакции: экраны не увидят поставку без расчёта.
+    # Уже завершённая поставка не пересчитывается: выплаты по ней уже в журнале.
+    # Строка поставки блокируется первой, так что все зачисления в неё уже закоммичены;
+    # журнал сворачивается под тем же замком, что и у ContributionRollup, а доли считаются по журналу
+    async with acquire() as conn:
+        async with conn.transaction():
+            if not await SupplyRepo(conn).complete(supply_id):
+                return None
+            await LedgerRepo(conn).fold()
+            payouts = PayoutRepo(conn)
+            rows = settle(await payouts.contributions(supply_id), await payouts.items(supply_id))
+            await payouts.replace(supply_id, rows)
+    return rows
@@ -0,0 +1,32 @@
+import asyncio
+
+
+# === ОБЪЕДИНЕНИЕ ОДИНАКОВЫХ ЗАПРОСОВ ===
+class SingleFlight:
+    # Пока запрос с таким ключом выполняется, остальные вызовы ждут его результат, а не идут в базу
+    __slots__ = ("name", "calls", "coalesced", "_inflight")
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.coalesced = 0
+        self._inflight = {}
+
+    async def do(self, key, fn, *args, **kwargs):
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            self.calls += 1
+            future = asyncio.ensure_future(fn(*args, **kwargs))
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._inflight.pop(key, None))
+        # shield: отмена одного ожидающего не должна отменять запрос для остальных
+        return await asyncio.shield(future)
+
+
+groups = {}
+
+
+def stats():
+    return [(g.name, g.calls, g.coalesced) for g in groups.values()]
@@ -0,0 +1,238 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import os
+import secrets
+import signal
+import time
+
+from aiohttp import ClientSession, ClientTimeout, ClientError, web
+
+
+# === КОНСИСТЕНТНОЕ ХЭШИРОВАНИЕ ===
+def _hash(value):
+    return int.from_bytes(hashlib.md5(str(value).encode()).digest()[:8], "big")
+
+
+class HashRing:
+    # У каждого воркера много точек на кольце: при падении одного его пользователи
+    # расходятся по остальным, а пользователи живых воркеров остаются на месте
+    def __init__(self, nodes, replicas=100):
+        points = sorted((_hash(f"{node}:{i}"), node) for node in nodes for i in range(replicas))
+        self._keys = [p[0] for p in points]
+        self._nodes = [p[1] for p in points]
+
+    def nodes_for(self, key):
+        start = bisect.bisect(self._keys, _hash(key))
+        seen = []
+        for i in range(len(self._nodes)):
+            node = self._nodes[(start + i) % len(self._nodes)]
+            if node not in seen:
+                seen.append(node)
+                yield node
+
+
+def update_user_id(update):
+    # Апдейты одного пользователя должны попадать в один воркер, чтобы там жил его сценарий FSM
+    for payload in update.values():
+        if not isinstance(payload, dict):
+            continue
+        for field in ("from", "user"):
+            if isinstance(payload.get(field), dict) and "id" in payload[field]:
+                return payload[field]["id"]
+        if isinstance(payload.get("chat"), dict):
+            return payload["chat"].get("id")
+    return update.get("update_id")
+
+
+# === ВОРКЕРЫ ===
+class Worker:
+    def __init__(self, index, port, command, env):
+        self.index = index
+        self.port = port
+        self.command = command
+        self.env = env
+        self.process = None
+        self.healthy = False
+        self.failures = 0
+        self.restarts = 0
+        self.queue_depth = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self):
+        env = {**os.environ, **self.env, "WEBAPP_HOST": "127.0.0.1", "WEBAPP_PORT": str(self.port), "WORKER_ID": str(self.index)}
+        self.process = await asyncio.create_subprocess_exec(*self.command, env=env)
+        self.healthy = False
+        self.failures = 0
+
+    async def stop(self, timeout=15):
+        if self.process is None or self.process.returncode is not None:
+            return
+        self.process.terminate()
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout)
+        except asyncio.TimeoutError:
+            self.process.kill()
+            await self.process.wait()
+
+
+class Supervisor:
+    def __init__(self, command, workers=4, base_port=8100, path="/webhook", secret_token=None,
+                 check_interval=5.0, max_failures=3, startup_timeout=60.0):
+        self.path = path
+        self.secret_token = secret_token
+        self.check_interval = check_interval
+        self.max_failures = max_failures
+        self.startup_timeout = startup_timeout
+        # Воркер — тот же бот в режиме вебхука на локальном порту, без регистрации вебхука в Telegram
+        env = {"RUN_MODE": "webhook", "WEBHOOK_URL": "", "WEBHOOK_PATH": path}
+        self.workers = [Worker(i, base_port + i, command, env) for i in range(workers)]
+        self.ring = HashRing(range(workers))
+        self.forwarded = [0] * workers
+        self._session = None
+
+    async def _check(self, worker):
+        try:
+            async with self._session.get(worker.url + "/health", timeout=ClientTimeout(total=2)) as response:
+                worker.queue_depth = (await response.json())["queue"]
+            worker.healthy = True
+            worker.failures = 0
+        except (ClientError, asyncio.TimeoutError, ValueError, KeyError):
+            worker.healthy = False
+            worker.failures += 1
+
+    async def _wait_healthy(self, worker):
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline and worker.process.returncode is None:
+            await self._check(worker)
+            if worker.healthy:
+                return True
+            await asyncio.sleep(0.5)
+        return False
+
+    async def _restart(self, worker):
+        worker.healthy = False
+        await worker.stop()
+        worker.restarts += 1
+        print(f"Restarting worker {worker.index} (restart #{worker.restarts})")
+        await worker.start()
+        await self._wait_healthy(worker)
+
+    async def start(self):
+        self._session = ClientSession()
+        # Запускаем по одному: init_db в нескольких процессах одновременно гоняет DDL наперегонки
+        for worker in self.workers:
+            await worker.start()
+            if not await self._wait_healthy(worker):
+                print(f"Worker {worker.index} did not become healthy")
+
+    async def monitor(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            for worker in self.workers:
+                if worker.process.returncode is not None:
+                    print(f"Worker {worker.index} exited with code {worker.process.returncode}")
+                    await self._restart(worker)
+                    continue
+                await self._check(worker)
+                if worker.failures >= self.max_failures:
+                    print(f"Worker {worker.index} failed {worker.failures} health checks")
+                    await self._restart(worker)
+
+    async def close(self):
+        await asyncio.gather(*(worker.stop() for worker in self.workers))
+        if self._session is not None:
+            await self._session.close()
+
+    async def handle(self, request):
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if self.secret_token and not secrets.compare_digest(token, self.secret_token):
+            return web.Response(status=401, text="Unauthorized")
+
+        body = await request.read()
+        try:
+            user_id = update_user_id(json.loads(body))
+        except (ValueError, AttributeError):
+            return web.Response(status=400, text="Bad update")
+
+        for index in self.ring.nodes_for(user_id):
+            worker = self.workers[index]
+            if not worker.healthy:
+                continue
+            try:
+                async with self._session.post(
+                    worker.url + self.path, data=body, headers={
+                        "Content-Type": "application/json",
+                        "X-Telegram-Bot-Api-Secret-Token": token,
+                    },
+                    timeout=ClientTimeout(total=10),
+                ) as response:
+                    # 503 от воркера — его очередь полна; Telegram повторит доставку
+                    self.forwarded[index] += 1
+                    return web.Response(status=response.status, body=await response.read(),
+                                        content_type="application/json")
+            except (ClientError, asyncio.TimeoutError):
+                worker.healthy = False
+        return web.Response(status=503, text="No healthy workers")
+
+    async def health(self, request):
+        return web.json_response([
+            {
+                "worker": w.index,
+                "pid": w.process.pid if w.process else None,
+                "healthy": w.healthy,
+                "queue": w.queue_depth,
+                "restarts": w.restarts,
+                "forwarded": self.forwarded[w.index],
+            }
+            for w in self.workers
+        ])
+
+    async def metrics(self, request):
+        lines = ["# TYPE bot_worker_queue_depth gauge"]
+        lines += [f'bot_worker_queue_depth{{worker="{w.index}"}} {w.queue_depth}' for w in self.workers]
+        lines.append("# TYPE bot_worker_up gauge")
+        lines += [f'bot_worker_up{{worker="{w.index}"}} {int(w.healthy)}' for w in self.workers]
+        lines.append("# TYPE bot_worker_restarts_total counter")
+        lines += [f'bot_worker_restarts_total{{worker="{w.index}"}} {w.restarts}' for w in self.workers]
+        lines.append("# TYPE bot_worker_forwarded_total counter")
+        lines += [f'bot_worker_forwarded_total{{worker="{w.index}"}} {self.forwarded[w.index]}' for w in self.workers]
+        return web.Response(text="\n".join(lines) + "\n")
+
+
+async def run_supervisor(bot, allowed_updates, command, host, port, path, url=None, secret_token=None,
+                         workers=4, base_port=8100, max_connections=40):
+    supervisor = Supervisor(command, workers=workers, base_port=base_port, path=path, secret_token=secret_token)
+    app = web.Application()
+    app.router.add_post(path, supervisor.handle)
+    app.router.add_get("/health", supervisor.health)
+    app.router.add_get("/metrics", supervisor.metrics)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await supervisor.start()
+        await web.TCPSite(runner, host, port).start()
+        if url:
+            await bot.set_webhook(
+                url.rstrip("/") + path,
+                secret_token=secret_token,
+                max_connections=max_connections,
+                allowed_updates=allowed_updates,
+            )
+        print(f"Supervisor listening on {host}:{port}{path} with {workers} workers")
+        monitor = asyncio.create_task(supervisor.monitor())
+        stop = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        try:
+            await stop.wait()
+        finally:
+            monitor.cancel()
+    finally:
+        await runner.cleanup()
+        await supervisor.close()
+        await bot.session.close()
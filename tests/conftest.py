@@ -0,0 +1,52 @@
+import asyncio
+import os
+import sys
+
+import asyncpg
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Тесты с базой пишут в неё свои строки и убирают за собой — DATABASE_URL должен указывать на отдельную базу.
+# Без него такие тесты пропускаются
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+# bot.py читает настройки при импорте
+os.environ.setdefault("BOT_TOKEN", "123456:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA")
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/unused")
+os.environ.setdefault("FSM_STORAGE", "memory")
+
+from db import init_pool, close_pool  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def database_url():
+    if not DATABASE_URL:
+        pytest.skip("DATABASE_URL не задан")
+
+    async def prepare():
+        conn = await asyncpg.connect(DATABASE_URL)
+        try:
+            await migrate(conn)
+        finally:
+            await conn.close()
+
+    asyncio.run(prepare())
+    return DATABASE_URL
+
+
+@pytest.fixture
+def run_with_pool(database_url):
+    # Пул привязан к циклу событий, поэтому на каждый прогон — свой
+    def run(fn):
+        async def main():
+            await init_pool(database_url, min_size=1, max_size=4)
+            try:
+                return await fn()
+            finally:
+                await close_pool()
+
+        return asyncio.run(main())
+
+    return run
@@ -0,0 +1,45 @@
+from cache import VersionedCache, item_scope, _MISS
+
+
+def test_put_started_before_clear_is_rejected():
+    cache = VersionedCache()
+    seq = cache.seq
+    # Пока запрос шёл, LISTEN-соединение переподключилось и кэш сброшен
+    cache.clear()
+    cache.put("key", "old", [item_scope(1)], seq)
+    assert len(cache) == 0
+
+    seq = cache.seq
+    cache.put("key", "new", [item_scope(1)], seq)
+    assert cache.get("key") == "new"
+
+
+def test_bump_invalidates_entries_and_in_flight_puts():
+    cache = VersionedCache()
+    seq = cache.seq
+    cache.put("a", 1, [item_scope(1)], seq)
+    cache.bump(item_scope(1))
+    cache.put("b", 2, [item_scope(1)], seq)
+    assert len(cache) == 1
+    assert cache.get("a") is _MISS
+    assert len(cache) == 0
+
+
+def test_versions_stay_bounded():
+    cache = VersionedCache(maxsize=100)
+    for item_id in range(100000):
+        seq = cache.seq
+        cache.put(("item", item_id), item_id, [item_scope(item_id)], seq)
+        cache.bump(item_scope(item_id))
+    assert len(cache._versions) <= 4 * cache.maxsize
+
+
+def test_pruned_version_still_rejects_in_flight_put():
+    cache = VersionedCache(maxsize=10)
+    seq = cache.seq
+    cache.bump(item_scope(1))
+    for item_id in range(2, 100):
+        cache.bump(item_scope(item_id))
+    assert item_scope(1) not in cache._versions
+    cache.put("item1", "old", [item_scope(1)], seq)
+    assert len(cache) == 0
@@ -0,0 +1,51 @@
+from db import acquire
+from repo import SummaryRepo, SupplyRepo
+
+
+def test_report_counts_and_sums_only_real_contributions(run_with_pool):
+    async def scenario():
+        async with acquire() as conn:
+            supply_id = await SupplyRepo(conn).create("report-test")
+            await conn.executemany(
+                "INSERT INTO contributions (user_id, supply_id, amount, username) VALUES ($1, $2, $3, $4)",
+                [(1, supply_id, 500, "a"), (2, supply_id, 300, "b"), (3, supply_id, 100, "c"), (4, supply_id, 0, "zero")],
+            )
+        try:
+            async with acquire() as conn:
+                summary = SummaryRepo(conn)
+                first = await summary.contribution_report(supply_id, 2)
+                assert first.contributors == 3
+                assert [c.user_id for c in first.page.items] == [1, 2]
+                assert first.page_total == 800
+                assert first.page.has_next and not first.page.has_prev
+
+                last = first.page.items[-1]
+                second = await summary.contribution_report(supply_id, 2, after=(last.amount, last.user_id))
+                assert [c.user_id for c in second.page.items] == [3]
+                assert second.page_total == 100
+                assert not second.page.has_next
+
+                head = second.page.items[0]
+                back = await summary.contribution_report(supply_id, 2, before=(head.amount, head.user_id))
+                assert [c.user_id for c in back.page.items] == [1, 2]
+                assert back.page_total == 800
+        finally:
+            async with acquire() as conn:
+                await SupplyRepo(conn).delete(supply_id)
+
+    run_with_pool(scenario)
+
+
+def test_report_for_supply_without_contributions(run_with_pool):
+    async def scenario():
+        async with acquire() as conn:
+            supply_id = await SupplyRepo(conn).create("report-test-empty")
+            try:
+                report = await SummaryRepo(conn).contribution_report(supply_id, 2)
+                assert report.contributors == 0
+                assert report.page_total == 0
+                assert report.page.items == []
+            finally:
+                await SupplyRepo(conn).delete(supply_id)
+
+    run_with_pool(scenario)
@@ -0,0 +1,49 @@
+import uuid
+
+from aiogram.fsm.storage.base import StorageKey
+
+from fsm_storage import PostgresStorage
+
+
+def _key():
+    return StorageKey(bot_id=1, chat_id=uuid.uuid4().int % 10 ** 9, user_id=uuid.uuid4().int % 10 ** 9)
+
+
+def test_processes_see_each_others_steps(run_with_pool):
+    # Апдейты одного пользователя попадают то в процесс A, то в B
+    async def scenario():
+        a, b = PostgresStorage(), PostgresStorage()
+        key = _key()
+        try:
+            await a.set_state(key, "AddItem:waiting_price")
+            await a.set_data(key, {"title": "куртка"})
+            assert await b.get_state(key) == "AddItem:waiting_price"
+
+            await b.set_state(key, "AddItem:waiting_sell_price")
+            await b.set_data(key, {"title": "куртка", "price": 100})
+            assert await a.get_state(key) == "AddItem:waiting_sell_price"
+            assert await a.get_data(key) == {"title": "куртка", "price": 100}
+
+            await b.set_state(key, None)
+            await b.set_data(key, {})
+            assert await a.get_state(key) is None
+            assert await a.get_data(key) == {}
+        finally:
+            await a.set_state(key, None)
+            await a.set_data(key, {})
+
+    run_with_pool(scenario)
+
+
+def test_unchanged_entry_is_reused(run_with_pool):
+    async def scenario():
+        storage = PostgresStorage()
+        key = _key()
+        try:
+            await storage.set_data(key, {"step": 1})
+            entry = await storage._entry(storage.key_builder.build(key))
+            assert await storage._entry(storage.key_builder.build(key)) is entry
+        finally:
+            await storage.set_data(key, {})
+
+    run_with_pool(scenario)
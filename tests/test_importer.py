@@ -0,0 +1,63 @@
+import json
+import zipfile
+
+import importer
+import photos
+
+STATUSES = ["в наличии", "продан"]
+
+
+def test_json_array_is_read_item_by_item(tmp_path, monkeypatch):
+    # Маленький кусок чтения: элементы рвутся на границах буфера
+    monkeypatch.setattr(importer, "_CHUNK_SIZE", 5)
+    items = [{"title": f"товар {n}", "price": 100 + n * 0.5, "sell_price": 1234567} for n in range(50)]
+    path = tmp_path / "items.json"
+    path.write_text(json.dumps(items, ensure_ascii=False, indent=1), encoding="utf-8")
+    rows, errors = importer.parse_items(str(path), "items.json", {}, STATUSES)
+    assert errors == []
+    assert [(title, price, sell_price) for title, price, sell_price, *_ in rows] == [
+        (item["title"], item["price"], item["sell_price"]) for item in items
+    ]
+
+
+def test_broken_json_array_keeps_rows_before_the_error(tmp_path):
+    path = tmp_path / "items.json"
+    path.write_text(
+        '[{"title": "a", "price": 1, "sell_price": 2}, 5, {"title": "b", "price": 2, "sell_price": 3} {"title": "c"}]',
+        encoding="utf-8",
+    )
+    rows, errors = importer.parse_items(str(path), "items.json", {}, STATUSES)
+    assert [row[0] for row in rows] == ["a", "b"]
+    assert errors[0][0] == 2
+    assert errors[-1][0] == 0
+
+
+def test_missing_sell_price_is_a_row_error(tmp_path):
+    path = tmp_path / "items.csv"
+    path.write_text("title,price,sell_price\na,100,\nb,100,150\n", encoding="utf-8")
+    rows, errors = importer.parse_items(str(path), "items.csv", {}, STATUSES)
+    assert [row[0] for row in rows] == ["b"]
+    assert errors == [(2, "нет цены продажи (sell_price)")]
+
+
+def test_cp1251_csv_from_excel(tmp_path):
+    path = tmp_path / "items.csv"
+    path.write_bytes("title;price;sell_price\nкуртка;1 500,50;3000\n".encode("cp1251"))
+    rows, errors = importer.parse_items(str(path), "items.csv", {}, STATUSES)
+    assert errors == []
+    assert [row[:3] for row in rows] == [("куртка", 1500.5, 3000)]
+
+
+def test_archive_skips_oversized_photos(tmp_path, monkeypatch):
+    monkeypatch.setattr(photos, "PHOTO_DIR", str(tmp_path))
+    archive = tmp_path / "photos.zip"
+    with zipfile.ZipFile(archive, "w") as f:
+        f.writestr("dir/A.JPG", b"a" * 10)
+        f.writestr("same.jpg", b"a" * 10)
+        f.writestr("big.png", b"b" * 101)
+        f.writestr("notes.txt", b"x")
+    found, skipped = importer.extract_photos(str(archive), max_size=100)
+    assert set(found) == {"a.jpg", "same.jpg"}
+    assert found["a.jpg"] == found["same.jpg"]
+    assert skipped == ["big.png"]
+    assert not [p for p in tmp_path.iterdir() if p.name.endswith(".part")]
@@ -0,0 +1,42 @@
+import asyncio
+import json
+
+import asyncpg
+import pytest
+
+from repo import ContributionRepo, ItemRepo, RequestRepo, SupplyRepo
+
+# Горячие запросы и индексы, которые им подходят. Какой из подходящих выбрать, планировщик решает
+# по статистике: последнюю заявку пользователя можно найти и обратным проходом по частичному индексу заявок в ожидании
+HOT_QUERIES = [
+    ("items", ItemRepo.PAGE_AFTER, (1, 0, None, None, 11), {"items_supply_id_idx"}),
+    ("contributions", ContributionRepo.CONTRIBUTOR_IDS, (1,), {"contributions_supply_id_idx", "contributions_report_idx"}),
+    ("contribution_requests", RequestRepo.LATEST_PENDING_FOR_USER, (1,),
+     {"contribution_requests_user_status_idx", "contribution_requests_pending_idx"}),
+    ("supplies", SupplyRepo.BY_STATUS, ("active",), {"supplies_status_idx"}),
+]
+
+
+def _nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _nodes(child)
+
+
+async def _plan(dsn, query, args):
+    conn = await asyncpg.connect(dsn)
+    try:
+        async with conn.transaction():
+            # На тестовой базе таблицы маленькие, и полный проход дешевле любого индекса.
+            # С выключенным seqscan планировщик берёт индекс, если подходящий есть, иначе всё равно Seq Scan
+            await conn.execute("SET LOCAL enable_seqscan = off")
+            return json.loads(await conn.fetchval("EXPLAIN (FORMAT JSON) " + query, *args))[0]["Plan"]
+    finally:
+        await conn.close()
+
+
+@pytest.mark.parametrize("table, query, args, indexes", HOT_QUERIES, ids=[q[0] for q in HOT_QUERIES])
+def test_hot_query_uses_index(database_url, table, query, args, indexes):
+    nodes = list(_nodes(asyncio.run(_plan(database_url, query, args))))
+    assert not [n for n in nodes if n["Node Type"] == "Seq Scan" and n.get("Relation Name") == table]
+    assert {n.get("Index Name") for n in nodes} & indexes
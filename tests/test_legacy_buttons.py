@@ -0,0 +1,71 @@
+import asyncio
+
+from aiogram import Bot
+from aiogram.fsm.storage.base import StorageKey
+
+import bot as bot_module
+
+ADMIN_ID = 4242
+
+
+class RecordingBot(Bot):
+    # Вместо запросов к Telegram запоминает вызванные методы
+    def __init__(self):
+        super().__init__("123456:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA")
+        self.calls = []
+
+    async def __call__(self, method, request_timeout=None):
+        self.calls.append(method)
+        return True
+
+
+def _user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": "admin"}
+
+
+def _callback(data):
+    return {
+        "update_id": 1,
+        "callback_query": {
+            "id": "1",
+            "from": _user(ADMIN_ID),
+            "chat_instance": "1",
+            "data": data,
+            "message": {"message_id": 1, "date": 0, "chat": {"id": ADMIN_ID, "type": "private"}, "text": "заявка"},
+        },
+    }
+
+
+def test_old_request_buttons_point_to_the_inbox():
+    async def scenario():
+        bot = RecordingBot()
+        for data in ("approve_req_7", "reject_req_7"):
+            bot.calls.clear()
+            await bot_module.dp.feed_raw_update(bot, _callback(data))
+            assert [type(m).__name__ for m in bot.calls] == ["AnswerCallbackQuery"]
+            assert "/requests" in bot.calls[0].text
+
+    asyncio.run(scenario())
+
+
+def test_old_amount_prompt_is_closed():
+    # Админ нажал старое «Подтвердить» до обновления: в состоянии остался req_id
+    async def scenario():
+        bot = RecordingBot()
+        key = StorageKey(bot_id=bot.id, chat_id=ADMIN_ID, user_id=ADMIN_ID)
+        storage = bot_module.dp.storage
+        await storage.set_state(key, bot_module.MakeContribution.waiting_bank)
+        await storage.set_data(key, {"req_id": 7, "temp_user_id": 1})
+        update = {
+            "update_id": 2,
+            "message": {
+                "message_id": 2, "date": 0, "chat": {"id": ADMIN_ID, "type": "private"},
+                "from": _user(ADMIN_ID), "text": "1500",
+            },
+        }
+        await bot_module.dp.feed_raw_update(bot, update)
+        assert [type(m).__name__ for m in bot.calls] == ["SendMessage"]
+        assert "/requests" in bot.calls[0].text
+        assert await storage.get_state(key) is None
+
+    asyncio.run(scenario())
@@ -0,0 +1,104 @@
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+from cache import cache
+from repo import ItemRepo, SummaryRepo
+
+
+class CountingConnection:
+    # Вместо базы: считает обращения и отдаёт заготовленную строку по тексту запроса
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = 0
+
+    async def fetchrow(self, query, *args):
+        self.calls += 1
+        return self.rows[query]
+
+    async def fetch(self, query, *args):
+        self.calls += 1
+        return [self.rows[query]]
+
+    async def fetchval(self, query, *args):
+        self.calls += 1
+        return self.rows[query][0]
+
+    async def execute(self, query, *args):
+        self.calls += 1
+
+
+class Message:
+    chat = SimpleNamespace(id=1)
+
+    def __init__(self):
+        self.texts = []
+
+    async def edit_text(self, text, **kwargs):
+        self.texts.append(text)
+
+    async def answer(self, text, **kwargs):
+        self.texts.append(text)
+
+
+def _call(data):
+    async def answer(*args, **kwargs):
+        return None
+
+    return SimpleNamespace(data=data, from_user=SimpleNamespace(id=7), message=Message(), answer=answer)
+
+
+ROWS = {
+    SummaryRepo.SUPPLY_DETAILS: (
+        "Поставка", "active", 1000.0,
+        5000.0, 0.0, 5000.0, 0, 3, 2, 3000.0, 2500.0, 1000.0,
+        None, None, None, None, None,
+        "Т-Банк", "+7900",
+    ),
+    SummaryRepo.USER_STATS: (2, 3000.0, 2000.0, "Поставка", 150.0, "Поставка", 4),
+    ItemRepo.GET: (5, 1, "Куртка", 1000.0, 2000.0, "тёплая", None, False, "в наличии", None),
+}
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    conn = CountingConnection(ROWS)
+
+    @asynccontextmanager
+    async def acquire():
+        yield conn
+
+    monkeypatch.setattr(bot, "acquire", acquire)
+    cache.clear()
+    return conn
+
+
+def test_supply_details_is_one_round_trip(conn):
+    call = _call("user_supply_1")
+    asyncio.run(bot.user_show_supply_details(call))
+    assert conn.calls == 1
+    assert "Т-Банк" in call.message.texts[0]
+
+
+def test_my_stats_is_one_round_trip(conn):
+    call = _call("my_stats")
+    asyncio.run(bot.my_stats(call))
+    assert conn.calls == 1
+    assert "3000.0₽" in call.message.texts[0]
+
+
+def test_item_details_is_one_round_trip_with_cached_item(conn):
+    # Сам товар берётся из кэша товаров: после первого просмотра экран — один запрос
+    call = _call("user_item_5")
+
+    async def scenario():
+        await bot.get_item(5)
+        conn.calls = 0
+        await bot.user_show_item_details(call)
+
+    asyncio.run(scenario())
+    assert conn.calls == 1
+    assert "Куртка" in call.message.texts[0]
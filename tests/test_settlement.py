@@ -0,0 +1,162 @@
+import asyncio
+import random
+import uuid
+
+import asyncpg
+import pytest
+
+from db import acquire
+from repo import LedgerRepo, RequestRepo, SupplyRepo
+from settlement import ADMIN_FEE, complete_supply, settle
+
+
+def _kopecks(value):
+    return round(value * 100)
+
+
+def _random_supply(rng, contributors):
+    contributions = [
+        (user_id, f"u{user_id}", round(rng.uniform(1, 50000), 2), rng.random() < 0.1)
+        for user_id in range(contributors)
+    ]
+    items = [
+        (round(rng.uniform(10, 5000), 2), round(rng.uniform(5, 9000), 2), rng.random() < 0.7)
+        for _ in range(rng.randint(0, 60))
+    ]
+    return contributions, items
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_conservation(seed):
+    rng = random.Random(seed)
+    contributions, items = _random_supply(rng, rng.randint(1, 40))
+    rows = settle(contributions, items)
+
+    revenue = sum(_kopecks(sell) for _, sell, sold in items if sold)
+    sold_cost = sum(_kopecks(price) for price, _, sold in items if sold)
+    unsold_cost = sum(_kopecks(price) for price, _, sold in items if not sold)
+    invested = sum(_kopecks(amount) for _, _, amount, _ in contributions)
+
+    # Копейка в копейку: выплаты — это вклады плюс прибыль, возвраты — закупка непроданного
+    assert sum(_kopecks(row[6]) for row in rows) == invested + revenue - sold_cost
+    assert sum(_kopecks(row[4]) for row in rows) == revenue - sold_cost
+    assert sum(_kopecks(row[5]) for row in rows) == unsold_cost
+    assert all(_kopecks(row[6]) == _kopecks(row[2]) + _kopecks(row[4]) for row in rows)
+
+
+def test_admin_fee_on_profit():
+    rows = settle([(1, "admin", 100, True), (2, "user", 100, False)], [(0, 1000, True)])
+    profits = {row[0]: row[4] for row in rows}
+    # Остальные отдают ADMIN_FEE своей доли прибыли админам
+    assert profits[2] == pytest.approx(500 * (1 - ADMIN_FEE))
+    assert profits[1] == pytest.approx(500 * (1 + ADMIN_FEE))
+
+
+def test_loss_is_split_by_contribution_without_fee():
+    rows = settle([(1, "admin", 300, True), (2, "user", 100, False)], [(1000, 600, True)])
+    profits = {row[0]: row[4] for row in rows}
+    assert profits == {1: -300, 2: -100}
+
+
+@pytest.mark.parametrize("is_admin", [True, False])
+def test_single_side_gets_profit_by_contribution(is_admin):
+    rows = settle([(1, "a", 100, is_admin), (2, "b", 300, is_admin)], [(0, 400, True)])
+    assert {row[0]: row[4] for row in rows} == {1: 100, 2: 300}
+    assert [row[3] for row in rows] == [0.25, 0.75]
+
+
+def test_zero_total():
+    rows = settle([(1, "a", 0, False), (2, "b", None, True)], [(100, 300, True), (50, 80, False)])
+    assert [row[2:] for row in rows] == [(0, 0, 0, 0, 0), (0, 0, 0, 0, 0)]
+
+
+def test_remainder_kopecks_are_not_lost():
+    rows = settle([(n, str(n), 1, False) for n in range(3)], [(0, 1, True)])
+    assert sorted(_kopecks(row[4]) for row in rows) == [33, 33, 34]
+
+
+def test_completion_waits_for_approval_in_flight(run_with_pool):
+    # Подтверждение не свёрнуто и ещё не закоммичено, когда админ завершает поставку
+    async def scenario():
+        user_id = uuid.uuid4().int % 10 ** 9
+        async with acquire() as conn:
+            supply_id = await SupplyRepo(conn).create("settlement-test")
+            await RequestRepo(conn).create(user_id, "tester", "bank", "card")
+            request_id = await conn.fetchval(
+                "SELECT id FROM contribution_requests WHERE user_id = $1 ORDER BY id DESC LIMIT 1", user_id
+            )
+        try:
+            async with acquire() as conn:
+                async with conn.transaction():
+                    ledger = LedgerRepo(conn)
+                    assert await ledger.lock_active_supply() == supply_id
+                    approved = await ledger.approve_requests({request_id: 1500}, 1, supply_id)
+                    assert [r[2] for r in approved] == [supply_id]
+                    completion = asyncio.create_task(complete_supply(supply_id))
+                    await asyncio.sleep(0.3)
+                    assert not completion.done()
+            rows = await completion
+            assert [(r[0], r[2], r[6]) for r in rows] == [(user_id, 1500, 1500)]
+        finally:
+            async with acquire() as conn:
+                await SupplyRepo(conn).delete(supply_id)
+                await conn.execute("DELETE FROM contribution_requests WHERE id = $1", request_id)
+
+    run_with_pool(scenario)
+
+
+def test_approval_waits_for_completion_and_moves_to_next_supply(run_with_pool):
+    # Админ подтверждает заявку, пока завершение последней поставки ещё не закоммичено
+    async def scenario():
+        user_id = uuid.uuid4().int % 10 ** 9
+        async with acquire() as conn:
+            supplies = SupplyRepo(conn)
+            previous_id = await supplies.create("settlement-test-previous")
+            latest_id = await supplies.create("settlement-test-latest")
+            await RequestRepo(conn).create(user_id, "tester", "bank", "card")
+            request_id = await conn.fetchval(
+                "SELECT id FROM contribution_requests WHERE user_id = $1 ORDER BY id DESC LIMIT 1", user_id
+            )
+
+        async def approve():
+            async with acquire() as conn:
+                async with conn.transaction():
+                    ledger = LedgerRepo(conn)
+                    supply_id = await ledger.lock_active_supply()
+                    return supply_id, await ledger.approve_requests({request_id: 700}, 1, supply_id)
+
+        try:
+            async with acquire() as conn:
+                async with conn.transaction():
+                    assert await SupplyRepo(conn).complete(latest_id)
+                    approval = asyncio.create_task(approve())
+                    await asyncio.sleep(0.3)
+                    assert not approval.done()
+            supply_id, approved = await approval
+            assert supply_id == previous_id
+            assert [(r[0], r[2], r[3]) for r in approved] == [(request_id, previous_id, 700)]
+        finally:
+            async with acquire() as conn:
+                await SupplyRepo(conn).delete(latest_id)
+                await SupplyRepo(conn).delete(previous_id)
+                await conn.execute("DELETE FROM contribution_requests WHERE id = $1", request_id)
+
+    run_with_pool(scenario)
+
+
+def test_contribution_rows_come_only_from_the_ledger(run_with_pool):
+    async def scenario():
+        async with acquire() as conn:
+            supply_id, created = await SupplyRepo(conn).ensure_active("settlement-test")
+            try:
+                assert await conn.fetchval("SELECT COUNT(*) FROM contributions WHERE COALESCE(amount, 0) = 0") == 0
+                with pytest.raises(asyncpg.CheckViolationError):
+                    await conn.execute(
+                        "INSERT INTO contribution_events (supply_id, user_id, kind, amount) VALUES ($1, 1, 'manual', 1)",
+                        supply_id,
+                    )
+            finally:
+                if created:
+                    await SupplyRepo(conn).delete(supply_id)
+
+    run_with_pool(scenario)
@@ -0,0 +1,145 @@
+import asyncio
+
+from aiogram import Bot, Dispatcher, Router
+
+from middlewares import UpdateLockMiddleware
+from webhook import QueuedRequestHandler, update_key
+
+USERS = 50
+UPDATES = 10000
+
+
+def _message(update_id, user_id):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "u"},
+            "text": "tap",
+        },
+    }
+
+
+def _updates(count=UPDATES):
+    return [_message(n, 1000 + n % USERS) for n in range(1, count + 1)]
+
+
+def _counter_dispatcher(lock=True):
+    # Обработчик читает счётчик, уступает цикл и пишет обратно — как toggle_sold_ и зачисление вклада
+    counters, seen = {}, {}
+    router = Router()
+
+    @router.message()
+    async def tap(message):
+        user_id = message.from_user.id
+        value = counters.get(user_id, 0)
+        await asyncio.sleep(0)
+        counters[user_id] = value + 1
+        seen.setdefault(user_id, []).append(message.message_id)
+
+    dp = Dispatcher()
+    middleware = UpdateLockMiddleware()
+    if lock:
+        dp.update.outer_middleware(middleware)
+    dp.include_router(router)
+    return dp, middleware, counters, seen
+
+
+def _assert_no_lost_updates(counters, seen):
+    assert sum(counters.values()) == UPDATES
+    assert all(count == UPDATES // USERS for count in counters.values())
+    # Апдейты каждого пользователя обработаны в порядке поступления
+    assert all(ids == sorted(ids) for ids in seen.values())
+
+
+def test_harness_detects_lost_updates():
+    async def scenario():
+        dp, _, counters, _ = _counter_dispatcher(lock=False)
+        bot = Bot("123456:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA")
+        await asyncio.gather(*(dp.feed_raw_update(bot, update) for update in _updates(1000)))
+        await bot.session.close()
+        return counters
+
+    assert sum(asyncio.run(scenario()).values()) < 1000
+
+
+def test_polling_tasks_lose_no_updates():
+    async def scenario():
+        dp, middleware, counters, seen = _counter_dispatcher()
+        bot = Bot("123456:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA")
+        await asyncio.gather(*(dp.feed_raw_update(bot, update) for update in _updates()))
+        await bot.session.close()
+        return counters, seen, len(middleware)
+
+    counters, seen, locks = asyncio.run(scenario())
+    _assert_no_lost_updates(counters, seen)
+    assert locks == 0
+
+
+def test_webhook_queue_loses_no_updates():
+    async def scenario():
+        dp, _, counters, seen = _counter_dispatcher()
+        bot = Bot("123456:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA")
+        handler = QueuedRequestHandler(dp, bot, workers=16, queue_size=UPDATES)
+        handler.start()
+        for update in _updates():
+            handler.put(update)
+        await asyncio.wait_for(handler._ready.join(), 60)
+        for task in handler._worker_tasks:
+            task.cancel()
+        await bot.session.close()
+        return counters, seen, handler.pending, len(handler._queues)
+
+    counters, seen, pending, queues = asyncio.run(scenario())
+    _assert_no_lost_updates(counters, seen)
+    assert pending == 0 and queues == 0
+
+
+def test_burst_from_one_user_takes_one_worker():
+    async def scenario():
+        release, other_done = asyncio.Event(), asyncio.Event()
+        busy = peak = 0
+        router = Router()
+
+        @router.message()
+        async def handle(message):
+            nonlocal busy, peak
+            if message.from_user.id == 2:
+                other_done.set()
+                return
+            busy += 1
+            peak = max(peak, busy)
+            await release.wait()
+            busy -= 1
+
+        dp = Dispatcher()
+        dp.update.outer_middleware(UpdateLockMiddleware())
+        dp.include_router(router)
+        bot = Bot("123456:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA")
+        handler = QueuedRequestHandler(dp, bot, workers=16)
+        handler.start()
+        for n in range(1, 17):
+            handler.put(_message(n, 1))
+        handler.put(_message(17, 2))
+        # Пользователь 2 обслужен, пока все 16 апдейтов пользователя 1 ещё ждут
+        await asyncio.wait_for(other_done.wait(), 5)
+        queued = handler.pending
+        release.set()
+        await asyncio.wait_for(handler._ready.join(), 5)
+        for task in handler._worker_tasks:
+            task.cancel()
+        await bot.session.close()
+        return peak, queued
+
+    peak, queued = asyncio.run(scenario())
+    assert peak == 1
+    assert queued == 16
+
+
+def test_update_key():
+    callback = {"update_id": 1, "callback_query": {"id": "1", "from": {"id": 7}, "message": {"chat": {"id": -5}}}}
+    assert update_key(callback) == 7
+    assert update_key(callback, "chat") == -5
+    assert update_key({"update_id": 2, "poll": {"id": "p"}}) is None
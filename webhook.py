@@ -0,0 +1,176 @@
+import argparse
+import asyncio
+import json
+import signal
+from collections import deque
+
+from aiohttp import ClientSession, web
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+
+# === ВЕБХУК ===
+def update_key(update, scope="user"):
+    # Тот же ключ, что у UpdateLockMiddleware, но из сырого апдейта: событие — единственное поле-объект
+    for name, event in update.items():
+        if name == "update_id" or not isinstance(event, dict):
+            continue
+        if scope == "chat":
+            chat = event.get("chat") or (event.get("message") or {}).get("chat")
+            return chat["id"] if chat else None
+        user = event.get("from") or event.get("user")
+        return user["id"] if user else None
+    return None
+
+
+class QueuedRequestHandler(SimpleRequestHandler):
+    # Отвечаем Telegram сразу после постановки апдейта в очередь, обрабатывают его воркеры.
+    # У каждого пользователя (или чата) своя очередь, и её разбирает не больше одного воркера за раз:
+    # апдейты одного пользователя идут по порядку, а серия быстрых нажатий занимает один воркер, а не весь пул.
+    # Всего в очередях не больше queue_size апдейтов: если места нет дольше enqueue_timeout,
+    # отдаём 503 и Telegram повторит доставку
+    def __init__(self, dispatcher, bot, secret_token=None, workers=16, queue_size=1000, enqueue_timeout=1.0,
+                 scope="user", **data):
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=secret_token, **data)
+        self.workers = workers
+        self.queue_size = queue_size
+        self.enqueue_timeout = enqueue_timeout
+        self.scope = scope
+        self.pending = 0
+        self.rejected = 0
+        self._space = asyncio.Semaphore(queue_size)
+        self._queues = {}
+        # Ключи, у которых есть апдейты и нет воркера
+        self._ready = asyncio.Queue()
+        self._worker_tasks = []
+
+    async def _handle_request_background(self, bot, request):
+        update = await request.json(loads=bot.session.json_loads)
+        try:
+            await asyncio.wait_for(self._space.acquire(), self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return web.Response(status=503, text="Busy")
+        self.put(update)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    def put(self, update):
+        key = update_key(update, self.scope)
+        if key is None:
+            # Апдейт без пользователя ни с чем не упорядочиваем
+            key = ("update", update.get("update_id"))
+        queue = self._queues.get(key)
+        if queue is None:
+            self._queues[key] = deque([update])
+            self._ready.put_nowait(key)
+        else:
+            queue.append(update)
+        self.pending += 1
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            queue = self._queues[key]
+            update = queue.popleft()
+            try:
+                await self._background_feed_update(self.bot, update)
+            except Exception as e:
+                print(f"Webhook update {update.get('update_id')} failed: {e}")
+            finally:
+                self.pending -= 1
+                self._space.release()
+                # Остаток очереди ключа — в конец общей: один пользователь не держит воркер, пока ждут другие
+                if queue:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._queues[key]
+                self._ready.task_done()
+
+    def start(self):
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self, timeout=10):
+        # Даём воркерам дообработать принятые апдейты: Telegram их уже не пришлёт повторно
+        try:
+            await asyncio.wait_for(self._ready.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Webhook shutdown dropped {self.pending} queued updates")
+        for task in self._worker_tasks:
+            task.cancel()
+        await super().close()
+
+    async def health(self, request):
+        return web.json_response({
+            "queue": self.pending,
+            "users": len(self._queues),
+            "capacity": self.queue_size,
+            "rejected": self.rejected,
+        })
+
+
+async def run_webhook(dispatcher, bot, host, port, path, url=None, secret_token=None,
+                      workers=16, queue_size=1000, max_connections=40, scope="user"):
+    handler = QueuedRequestHandler(
+        dispatcher, bot, secret_token=secret_token, workers=workers, queue_size=queue_size, scope=scope
+    )
+    app = web.Application()
+    handler.register(app, path=path)
+    app.router.add_get("/health", handler.health)
+    setup_application(app, dispatcher, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        handler.start()
+        await web.TCPSite(runner, host, port).start()
+        # Без url вебхук не регистрируется: так запускаются второй и следующие экземпляры за балансировщиком
+        if url:
+            await bot.set_webhook(
+                url.rstrip("/") + path,
+                secret_token=secret_token,
+                max_connections=max_connections,
+                allowed_updates=dispatcher.resolve_used_update_types(),
+            )
+        print(f"Webhook listening on {host}:{port}{path}")
+        # SIGTERM от супервизора или оркестратора — штатная остановка с дообработкой очереди
+        stop = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+
+
+# === ЛОКАЛЬНЫЙ ПРОГОН ЗАПИСАННЫХ АПДЕЙТОВ ===
+async def replay(path, url, secret_token=None, concurrency=10, repeat=1):
+    # Файл — по одному JSON-апдейту на строку, в том виде, в каком их присылает Telegram
+    with open(path, encoding="utf-8") as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret_token} if secret_token else {}
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = {}
+
+    async def post(session, update):
+        async with semaphore:
+            async with session.post(url, json=update, headers=headers) as response:
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+
+    async with ClientSession() as session:
+        update_id = 0
+        tasks = []
+        for _ in range(repeat):
+            for update in updates:
+                update_id += 1
+                tasks.append(post(session, {**update, "update_id": update_id}))
+        await asyncio.gather(*tasks)
+    return statuses
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Отправить записанные апдейты на локальный вебхук")
+    parser.add_argument("updates")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+    print(asyncio.run(replay(args.updates, args.url, args.secret, args.concurrency, args.repeat)))